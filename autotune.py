@@ -0,0 +1,265 @@
+import argparse
+import configparser
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+
+def tuning_options_from_config(config):
+    return dict(profile_path=config.get('tuning', 'profile_path', fallback='./tuned.ini'),
+                autotune=config.get('tuning', 'autotune', fallback='0') == "1",
+                target_latency_ms=float(config.get('tuning', 'target_latency_ms', fallback='1000')),
+                adaptive_fps=config.get('tuning', 'adaptive_fps', fallback='1') == "1",
+                min_fps=float(config.get('tuning', 'min_fps', fallback='2')),
+                max_fps=float(config.get('tuning', 'max_fps', fallback='30')))
+
+
+def apply_tuned_profile(config):
+    # values of the tuned profile take precedence over config.ini, deleting it undoes the tuning
+    path = tuning_options_from_config(config)["profile_path"]
+    if path and os.path.exists(path):
+        config.read(path)
+        return path
+    return None
+
+
+def sample_frames(config, count, archive=''):
+    # frames of a recording if there is one, otherwise a synthetic log panel of the capture region's size
+    archive = archive or config.get('capture', 'replay_path', fallback='')
+    if archive:
+        from frame_archive import FrameArchiveReader
+
+        reader = FrameArchiveReader(archive)
+        return [np.array(reader.frames[i]) for i in range(min(count, len(reader)))]
+
+    from synthetic_frames import SyntheticCombatLog
+
+    log = SyntheticCombatLog(width=int(config.get('capture', 'region_width')),
+                             height=int(config.get('capture', 'region_height')),
+                             empty_frames=0, idle_ratio=0.0)
+    return [frame.image for frame in log.frames(count)]
+
+
+def measure(ocr, frames, workers):
+    # every frame once through a pool of ocr threads sharing the engine, like DPSMeter
+    # does: frames/s while the workers are saturated and the time of a single frame
+    latencies = []
+    texts = [None] * len(frames)
+
+    def recognize(index):
+        started = time.perf_counter()
+        texts[index] = ocr.handle(frames[index], 0, index).text
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(recognize, range(len(frames))))
+    elapsed = time.perf_counter() - started
+    return len(frames) / elapsed, float(np.percentile(latencies, 95)) * 1000.0, texts
+
+
+def measure_processes(options, frames, workers):
+    # every frame once through ocr worker processes, like DPSMeter with executor=process.
+    # One frame per worker is in flight, so the workers are saturated and the latency
+    # is that of a single frame, shared memory copies and queues included.
+    from ocr_process_pool import ProcessOCRPool
+    from screen_capturer import Capture
+
+    latencies = []
+    texts = [None] * len(frames)
+    errors = []
+    submitted = {}
+    free = threading.Semaphore(workers)
+
+    def on_result(snapshot):
+        latencies.append(time.perf_counter() - submitted[snapshot.seq_id])
+        texts[snapshot.seq_id] = snapshot.text
+        if snapshot.error is not None:
+            errors.append(snapshot.error)
+        free.release()
+
+    pool = ProcessOCRPool(options, worker_count=workers, slot_count=workers, on_result=on_result,
+                          warm_up_shape=frames[0].shape)
+    try:
+        # engines load in parallel and are not part of the measurement
+        pool.wait_ready()
+        started = time.perf_counter()
+        for index, frame in enumerate(frames):
+            free.acquire()
+            if errors:
+                # an engine that failed to load fails every frame
+                free.release()
+                break
+            submitted[index] = time.perf_counter()
+            pool.submit(Capture(frame, 0), index)
+        # every frame in flight has come back once all the workers are free again
+        for _ in range(workers):
+            free.acquire()
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.shutdown(wait=True)
+    if errors:
+        raise RuntimeError(errors[0])
+    return len(frames) / elapsed, float(np.percentile(latencies, 95)) * 1000.0, texts
+
+
+def worker_options(config, workers):
+    # ocr options of a worker count, the cores are split between the workers like in DPSMeter
+    from dps_meter import ocr_options_from_config
+
+    candidate = configparser.ConfigParser(interpolation=None)
+    candidate.read_dict({section: dict(config.items(section, raw=True)) for section in config.sections()})
+    if not candidate.has_section('ocr'):
+        candidate.add_section('ocr')
+    candidate.set('ocr', 'thread_count', str(workers))
+    return ocr_options_from_config(candidate)
+
+
+def calibrate(config, frames, resize_factors=None, worker_counts=None, target_latency_ms=None,
+              max_fps=None, max_cer=0.02, headroom=0.8):
+    # Measures every resize factor and worker count on the frames with the configured
+    # executor, thread or process, and picks the one with the highest sustained frame
+    # rate whose p95 frame latency stays under the target. Resize factors that read the
+    # frames differently from the configured one (character error rate above max_cer)
+    # are left out. The capture rate is the picked frame rate less some headroom.
+    from combat_log_ocr import CombatLogOCR
+    from utils import character_error_rate
+
+    executor = config.get('ocr', 'executor', fallback='thread')
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Unsupported OCR executor: {executor}")
+    options = worker_options(config, 1)
+    configured_factor = options["resize_factor"]
+    resize_factors = resize_factors or sorted({1, 2, 3, configured_factor})
+    # the configured factor is measured first, the others are compared with its text
+    resize_factors = [configured_factor] + [factor for factor in resize_factors if factor != configured_factor]
+    if options["incremental"]:
+        worker_counts = [1]
+    cpu_count = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({1, 2, 4, 8, cpu_count} & set(range(1, cpu_count + 1)))
+    target_latency_ms = target_latency_ms or tuning_options_from_config(config)["target_latency_ms"]
+    max_fps = max_fps or tuning_options_from_config(config)["max_fps"]
+
+    results = []
+    reference = None
+    for resize_factor in resize_factors:
+        for workers in worker_counts:
+            # every candidate starts from a freshly loaded engine and a cold cache
+            candidate_options = dict(worker_options(config, workers), resize_factor=resize_factor)
+            try:
+                if executor == 'process':
+                    fps, p95_ms, texts = measure_processes(candidate_options, frames, workers)
+                else:
+                    ocr = CombatLogOCR(**candidate_options)
+                    ocr.warm_up(frames[0].shape)
+                    fps, p95_ms, texts = measure(ocr, frames, workers)
+            except Exception as e:
+                print(f"resize_factor={resize_factor} workers={workers}: skipped, Error: {e}")
+                continue
+            if reference is None:
+                reference = texts
+            cer = float(np.mean([character_error_rate(expected, text) for expected, text in zip(reference, texts)]))
+            usable = p95_ms <= target_latency_ms and cer <= max_cer
+            print(f"{executor} resize_factor={resize_factor} workers={workers}: {fps:.1f} frames/s, p95 {p95_ms:.0f} ms, "
+                  f"CER {cer:.2%}{'' if usable else ' (rejected)'}")
+            results.append(dict(resize_factor=resize_factor, workers=workers, fps=fps, p95_ms=p95_ms, cer=cer, usable=usable))
+
+    usable = [result for result in results if result["usable"]]
+    if not usable:
+        if not results:
+            raise RuntimeError("No OCR configuration could be measured")
+        # nothing meets the target, the fastest one at least keeps up best
+        usable = [min(results, key=lambda result: result["p95_ms"])]
+    # ties go to fewer workers and the larger resize factor
+    best = max(usable, key=lambda result: (round(result["fps"], 1), -result["workers"], result["resize_factor"]))
+    best["capture_fps"] = max(1, min(int(max_fps), int(best["fps"] * headroom)))
+    best["executor"] = executor
+    return best
+
+
+def write_profile(path, result):
+    profile = configparser.ConfigParser()
+    profile['capture'] = {'fps': str(result["capture_fps"])}
+    profile['ocr'] = {'executor': result["executor"], 'thread_count': str(result["workers"]),
+                      'resize_factor': str(result["resize_factor"])}
+    profile['tuned'] = {
+        'tuned_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'measured_fps': f"{result['fps']:.1f}",
+        'p95_latency_ms': f"{result['p95_ms']:.0f}",
+        'cer': f"{result['cer']:.4f}",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        profile.write(f)
+
+
+def autotune(config, frame_count=60, archive='', **calibrate_options):
+    # calibrates, writes the tuned profile and applies it to config
+    path = tuning_options_from_config(config)["profile_path"]
+    result = calibrate(config, sample_frames(config, frame_count, archive), **calibrate_options)
+    write_profile(path, result)
+    config.read(path)
+    print(f"Tuned profile {path}: fps={result['capture_fps']}, executor={result['executor']}, "
+          f"thread_count={result['workers']}, resize_factor={result['resize_factor']}")
+    return result
+
+
+class AdaptiveCaptureRate:
+    # Follows the end-to-end latency of recognized frames with a moving average and
+    # lowers the capture rate when it rises above the target, then raises it again
+    # up to the configured rate once OCR keeps up. Unchanged frames are never
+    # recognized, so a static log panel leaves the rate alone.
+    def __init__(self, max_fps, min_fps=2.0, target_latency_ms=1000.0, interval=2.0, smoothing=0.2):
+        self.max_fps = max_fps
+        self.min_fps = min(min_fps, max_fps)
+        self.target = target_latency_ms / 1000.0
+        self.interval = interval
+        self.smoothing = smoothing
+        self.fps = max_fps
+        self.latency = None
+        self.adjusted_at = time.perf_counter()
+        self.lock = threading.Lock()
+
+    @property
+    def delay(self):
+        return 1.0 / self.fps
+
+    def observe(self, seconds):
+        with self.lock:
+            self.latency = seconds if self.latency is None else self.latency + self.smoothing * (seconds - self.latency)
+            now = time.perf_counter()
+            if now - self.adjusted_at < self.interval:
+                return
+            self.adjusted_at = now
+            if self.latency > self.target:
+                self.fps = max(self.min_fps, self.fps * 0.8)
+            elif self.latency < self.target / 2:
+                self.fps = min(self.max_fps, self.fps * 1.1)
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description='Measure OCR settings on sample frames and write a tuned profile')
+    args_parser.add_argument('--config', default=os.path.join(os.getcwd(), 'config.ini'))
+    args_parser.add_argument('--archive', default='', help='frame archive, [capture] replay_path or synthetic frames if omitted')
+    args_parser.add_argument('--frames', type=int, default=60)
+    args_parser.add_argument('--resize-factors', default='', help='comma separated, 1,2,3 and the configured one if omitted')
+    args_parser.add_argument('--workers', default='', help='comma separated worker counts, powers of two up to the cores if omitted')
+    args_parser.add_argument('--target-latency-ms', type=float, default=0, help='[tuning] target_latency_ms if omitted')
+    args_parser.add_argument('--max-fps', type=float, default=0, help='highest capture rate, [tuning] max_fps if omitted')
+    args = args_parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    autotune(config, args.frames, args.archive,
+             resize_factors=[int(value) for value in args.resize_factors.split(',')] if args.resize_factors else None,
+             worker_counts=[int(value) for value in args.workers.split(',')] if args.workers else None,
+             target_latency_ms=args.target_latency_ms or None,
+             max_fps=args.max_fps or None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,679 @@
+import argparse
+import configparser
+import json
+import os
+import time
+
+import numpy as np
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+def load_config(path):
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+
+def benchmark_replay(args):
+    from dps_meter import DPSMeter
+
+    config = load_config(args.config)
+    config.set('capture', 'replay_path', args.archive)
+    config.set('capture', 'record_path', '')
+    # keep console and disk output out of the measurement
+    for option in ('save_combat_log', 'ignored_log', 'damage_log', 'dps_log', 'ocr_view'):
+        config.set('debug', option, '0')
+    if not config.has_section('ui'):
+        config.add_section('ui')
+    config.set('ui', 'mode', 'headless')
+
+    dps_meter = DPSMeter(config)
+    report = dps_meter.run_benchmark()
+    print(json.dumps(report, indent=2))
+
+
+def load_frames(archive, count):
+    if archive:
+        from frame_archive import FrameArchiveReader
+
+        reader = FrameArchiveReader(archive)
+        return [reader.frames[i] for i in range(min(count, len(reader)))]
+
+    # text-like stripes scrolling up by one line now and then, with idle frames in between
+    rng = np.random.default_rng(0)
+    height, width, line_height = 852, 348, 17
+    tall = np.zeros((height + line_height * count, width, 3), dtype=np.uint8)
+    for top in range(0, len(tall), line_height):
+        tall[top + 4:top + 13, :rng.integers(width // 3, width)] = rng.integers(100, 255, 3, dtype=np.uint8)
+    frames = []
+    offset = 0
+    for i in range(count):
+        if i % 3 == 0:
+            offset += line_height
+        frames.append(tall[offset:offset + height].copy())
+    return frames
+
+
+def benchmark_detectors(args):
+    from change_detector import change_detectors
+
+    frames = load_frames(args.archive, args.frames)
+    decisions = {}
+    for name, detector_class in change_detectors.items():
+        detector = detector_class()
+        try:
+            detector.detect(frames[0], frames[1])
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+
+        changed = []
+        started = time.perf_counter()
+        for prev, cur in zip(frames, frames[1:]):
+            changed.append(detector.detect(prev, cur).changed)
+        elapsed = time.perf_counter() - started
+
+        decisions[name] = changed
+        print(f"{name}: {elapsed * 1000.0 / len(changed):.3f} ms/frame, {sum(changed)}/{len(changed)} changed")
+
+    if "ssim" in decisions:
+        for name, changed in decisions.items():
+            if name == "ssim":
+                continue
+            agreement = sum(a == b for a, b in zip(changed, decisions["ssim"])) / len(changed)
+            print(f"{name}: {agreement:.1%} agreement with ssim")
+
+
+def benchmark_preprocess(args):
+    from text_extractor import ColorTextExtractor, extract_color_ranges
+
+    frames = load_frames(args.archive, args.frames)
+    if not args.archive:
+        # sprinkle every text color over the synthetic frames
+        rng = np.random.default_rng(1)
+        colors = np.array([np.add(lower, upper) // 2 for lower, upper in extract_color_ranges], dtype=np.uint8)
+        for frame in frames:
+            noise = rng.random(frame.shape[:2]) < 0.2
+            frame[noise] = colors[rng.integers(0, len(colors), noise.sum())]
+
+    extractor = ColorTextExtractor(extract_color_ranges)
+    mismatched = sum(not np.array_equal(extractor.extract(frame), extractor.extract_reference(frame)) for frame in frames)
+    print(f"identical output: {len(frames) - mismatched}/{len(frames)} frames")
+
+    for name, extract in (("reference", extractor.extract_reference), ("lut", extractor.extract)):
+        started = time.perf_counter()
+        for frame in frames:
+            extract(frame)
+        print(f"{name}: {(time.perf_counter() - started) * 1000.0 / len(frames):.3f} ms/frame")
+
+    if mismatched:
+        raise SystemExit(1)
+
+
+def benchmark_ocr_modes(args):
+    from combat_log_ocr import CombatLogOCR
+    from dps_meter import ocr_options_from_config
+    from utils import character_error_rate
+
+    config = load_config(args.config)
+    frames = load_frames(args.archive, args.frames)
+
+    texts = {}
+    for mode in ("full", "rec_only"):
+        options = ocr_options_from_config(config)
+        options.update(mode=mode, incremental=False)
+        ocr = CombatLogOCR(**options)
+        ocr.handle(frames[0], 0, 0)
+
+        started = time.perf_counter()
+        if mode == "rec_only" and args.batch > 1:
+            results = []
+            for i in range(0, len(frames), args.batch):
+                results += ocr.handle_batch([(frame, 0, i + j) for j, frame in enumerate(frames[i:i + args.batch])])
+        else:
+            results = [ocr.handle(frame, 0, i) for i, frame in enumerate(frames)]
+        elapsed = time.perf_counter() - started
+
+        texts[mode] = [result.text for result in results]
+        print(f"{mode}: {elapsed * 1000.0 / len(frames):.1f} ms/frame")
+        if ocr.line_cache is not None:
+            print(f"{mode}: line cache {ocr.line_cache.stats()}")
+
+    errors = [character_error_rate(full, rec_only) for full, rec_only in zip(texts["full"], texts["rec_only"])]
+    print(f"rec_only vs full: mean CER {np.mean(errors):.2%}, max CER {np.max(errors):.2%}")
+
+
+def benchmark_ocr_engines(args):
+    from combat_log_ocr import CombatLogOCR
+    from dps_meter import ocr_options_from_config
+    from utils import character_error_rate, edit_distance
+
+    config = load_config(args.config)
+    frames = load_frames(args.archive, args.frames)
+
+    # the first engine is the reference of the error rates, "onnx-int8" is onnx with quantized models
+    texts = {}
+    for name in args.engines.split(","):
+        engine, _, variant = name.partition("-")
+        options = ocr_options_from_config(config)
+        # every line goes to the engine, the line cache would hide it
+        options.update(ocr_engine=engine, mode=args.mode, incremental=False, line_cache_size=0)
+        if args.atlas:
+            options.update(glyph_atlas=args.atlas)
+        if engine == "onnx":
+            options.update(onnx_quantize=variant == "int8")
+            if args.threads:
+                options.update(onnx_threads=args.threads)
+        try:
+            ocr = CombatLogOCR(**options)
+        except Exception as e:
+            print(f"{name}: skipped, Error: {e}")
+            continue
+        ocr.handle(frames[0], 0, 0)
+
+        latencies = []
+        for i, frame in enumerate(frames):
+            started = time.perf_counter()
+            result = ocr.handle(frame, 0, i)
+            latencies.append(time.perf_counter() - started)
+            texts.setdefault(name, []).append(result.text)
+        elapsed = sum(latencies)
+        lines = sum(len(text.splitlines()) for text in texts[name])
+        print(f"{name}: {elapsed * 1000.0 / len(frames):.1f} ms/frame, "
+              f"p50 {np.percentile(latencies, 50) * 1000.0:.1f} ms, p95 {np.percentile(latencies, 95) * 1000.0:.1f} ms, "
+              f"{len(frames) / elapsed:.1f} frames/s, {lines / elapsed:.0f} lines/s")
+
+    if not texts:
+        return
+    reference_name, *others = texts
+    reference = texts[reference_name]
+    total_characters = max(sum(len(text) for text in reference), 1)
+    for name in others:
+        errors = [character_error_rate(expected, text) for expected, text in zip(reference, texts[name])]
+        total_errors = sum(edit_distance(expected, text) for expected, text in zip(reference, texts[name]))
+        print(f"{name} vs {reference_name}: CER {total_errors / total_characters:.2%}, "
+              f"mean frame CER {np.mean(errors):.2%}, max frame CER {np.max(errors):.2%}")
+
+
+def build_synthetic_atlas(options, frames, seed, path, noise=0.0, blur=0):
+    # the synthetic font is not the game font, its atlas is learned from other synthetic frames
+    from combat_log_ocr import CombatLogOCR
+    from glyph_ocr import GlyphAtlasBuilder
+    from recognition_cache import RecognitionCache
+    from synthetic_frames import SyntheticCombatLog
+    from text_layout import crop_band
+
+    ocr = CombatLogOCR(**dict(options, ocr_engine="glyph"), load=False)
+    builder = GlyphAtlasBuilder(ocr.resize_factor)
+    keys = RecognitionCache()
+    seen = set()
+    for frame in SyntheticCombatLog(seed=seed, noise=noise, blur=blur).frames(frames):
+        processed, bounds = ocr._preprocess_image(frame.image)
+        bands = ocr._segment_lines(processed, bounds) if bounds is not None else []
+        if len(bands) != len(frame.rows):
+            continue
+        for band, text in zip(bands, frame.rows):
+            crop = crop_band(processed, band, padding=2 * ocr.resize_factor)
+            key = keys.key(crop)
+            if key is not None and key not in seen:
+                seen.add(key)
+                builder.add(crop, text)
+    builder.build().save(path)
+    return path
+
+
+def benchmark_regression(args):
+    import tempfile
+
+    from combat_log_ocr import CombatLogOCR
+    from dps_meter import ocr_options_from_config
+    from offline_analyzer import OfflineAnalysis
+    from synthetic_frames import SyntheticCombatLog
+    from utils import character_error_rate
+
+    config = load_config(args.config)
+    options = ocr_options_from_config(config)
+    options.update(incremental=False)
+    if args.engine:
+        options.update(ocr_engine=args.engine)
+
+    log = SyntheticCombatLog(seed=args.seed, noise=args.noise, blur=args.blur)
+    frames = list(log.frames(args.frames))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.atlas:
+            options.update(glyph_atlas=args.atlas)
+        elif options["ocr_engine"] == "glyph":
+            options.update(glyph_atlas=build_synthetic_atlas(options, args.atlas_frames, args.seed + 1,
+                                                             os.path.join(temp_dir, "glyph_atlas.npz"), args.noise, args.blur))
+        ocr = CombatLogOCR(**options)
+    ocr.warm_up(frames[0].image.shape)
+
+    texts = []
+    started = time.perf_counter()
+    for i, frame in enumerate(frames):
+        texts.append(ocr.handle(frame.image, frame.timestamp, i).text)
+    elapsed = time.perf_counter() - started
+
+    # the truth text goes through the same parser, so parser and ocr regressions are told apart
+    truth = OfflineAnalysis()
+    recognized = OfflineAnalysis()
+    for i, (frame, text) in enumerate(zip(frames, texts)):
+        truth.add_text(frame.text, frame.timestamp, i)
+        recognized.add_text(text, frame.timestamp, i)
+    truth.close()
+    recognized.close()
+
+    expected_total = max(log.expected_total, 1)
+    damage_error = abs(recognized.calculator.total - log.expected_total) / expected_total
+    cer = np.mean([character_error_rate(frame.text, text) for frame, text in zip(frames, texts)])
+    fps = len(frames) / elapsed
+    checks = [
+        ("parser total", f"{truth.calculator.total} / {log.expected_total}", truth.calculator.total == log.expected_total),
+        ("parser hits", f"{truth.calculator.count} / {log.expected_hits}", truth.calculator.count == log.expected_hits),
+        ("ocr total error", f"{damage_error:.2%} <= {args.max_damage_error:.2%}", damage_error <= args.max_damage_error),
+        ("ocr hits", f"{recognized.calculator.count} / {log.expected_hits}",
+         abs(recognized.calculator.count - log.expected_hits) <= args.max_damage_error * log.expected_hits),
+        ("ocr mean CER", f"{cer:.2%} <= {args.max_cer:.2%}", cer <= args.max_cer),
+        ("throughput", f"{fps:.1f} >= {args.min_fps:.1f} frames/s", fps >= args.min_fps),
+    ]
+    print(f"{options['ocr_engine']}: {len(frames)} frames, {len(log.entries)} messages, {elapsed * 1000.0 / len(frames):.1f} ms/frame")
+    for name, value, passed in checks:
+        print(f"{'ok' if passed else 'FAIL':<5} {name:<16} {value}")
+    if not all(passed for _, _, passed in checks):
+        raise SystemExit(1)
+
+
+def benchmark_incremental(args):
+    import tempfile
+
+    from combat_log_ocr import CombatLogOCR
+    from dps_meter import ocr_options_from_config
+    from synthetic_frames import SyntheticCombatLog
+
+    config = load_config(args.config)
+    options = ocr_options_from_config(config)
+    if args.engine:
+        options.update(ocr_engine=args.engine)
+    if args.archive:
+        frames = load_frames(args.archive, args.frames)
+    else:
+        frames = [frame.image for frame in SyntheticCombatLog(seed=args.seed, noise=args.noise).frames(args.frames)]
+
+    texts = {}
+    elapsed = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.atlas:
+            options.update(glyph_atlas=args.atlas)
+        elif options["ocr_engine"] == "glyph" and not args.archive:
+            options.update(glyph_atlas=build_synthetic_atlas(options, args.atlas_frames, args.seed + 1,
+                                                             os.path.join(temp_dir, "glyph_atlas.npz"), args.noise))
+        for incremental in (False, True):
+            ocr = CombatLogOCR(**dict(options, incremental=incremental))
+            ocr.warm_up(frames[0].shape)
+            started = time.perf_counter()
+            texts[incremental] = [ocr.handle(frame, 0, i).text for i, frame in enumerate(frames)]
+            elapsed[incremental] = time.perf_counter() - started
+            print(f"{'incremental' if incremental else 'full'}: {elapsed[incremental] * 1000.0 / len(frames):.1f} ms/frame")
+    tracker = ocr.scroll_tracker
+    print(f"incremental: {tracker.incremental_frames} stitched and {tracker.full_frames} full frames, "
+          f"{tracker.pixels_recognized / max(tracker.pixels_total, 1):.1%} of the pixels recognized")
+
+    # incremental=1 is only worth it when it is faster and reads every frame like full OCR
+    differing = [i for i, (full, incremental) in enumerate(zip(texts[False], texts[True])) if full != incremental]
+    checks = [
+        ("same text", f"{len(frames) - len(differing)} / {len(frames)} frames", not differing),
+        ("faster", f"{elapsed[True]:.2f} s < {elapsed[False]:.2f} s", elapsed[True] < elapsed[False]),
+    ]
+    for name, value, passed in checks:
+        print(f"{'ok' if passed else 'FAIL':<5} {name:<10} {value}")
+    if differing:
+        print(f"first differing frames: {differing[:10]}")
+    if not all(passed for _, _, passed in checks):
+        print("keep [ocr] incremental=0")
+        raise SystemExit(1)
+
+
+def load_log_lines(path):
+    lines = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            # strip the "[timestamp] " prefix of saved combat logs
+            if line.startswith('[') and '] ' in line:
+                line = line.split('] ', 1)[1]
+            if line:
+                lines.append(line)
+    return lines
+
+
+def synthetic_log_lines(count, rng):
+    skills = ['Flame Bolt', 'Frost Chain', 'Wind Cut', 'Earth Spike', 'Dark Flash']
+    targets = ['Training Dummy', 'Ancient Dragon', 'Goblin']
+    multipliers = ['', 'Critical ', 'Perfect ', 'Double Critical ']
+    lines = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            lines.append(f"Dealt additional damage of {rng.integers(10, 999)} to {rng.choice(targets)}.")
+        else:
+            # few distinct values, so identical consecutive lines happen
+            lines.append(f"Used {rng.choice(skills)} against {rng.choice(targets)} and dealt "
+                         f"{rng.choice([1200, 1350, 2400])} {rng.choice(multipliers)}damage.")
+    return lines
+
+
+def ocr_noise(line, rng, rate):
+    chars = list(line)
+    for i in range(len(chars)):
+        if rng.random() < rate:
+            chars[i] = rng.choice(list('lI1oO0 .,'))
+    return ''.join(chars)
+
+
+def benchmark_align(args):
+    from log_aligner import LogAligner
+
+    rng = np.random.default_rng(0)
+    corpus = load_log_lines(args.log) if args.log else synthetic_log_lines(args.lines, rng)
+
+    # consecutive frames of a panel scrolling over the corpus, every frame OCR'd with fresh noise
+    frames = []
+    position = 0
+    while position + args.window <= len(corpus):
+        frames.append((position, [ocr_noise(line, rng, args.noise) for line in corpus[position:position + args.window]]))
+        position += int(rng.integers(0, args.max_scroll + 1))
+
+    aligner = LogAligner()
+    duplicated = missed = 0
+    started = time.perf_counter()
+    for (prev_position, prev), (position, cur) in zip(frames, frames[1:]):
+        reported = len(aligner.new_lines(prev, cur))
+        expected = min(position - prev_position, len(cur))
+        duplicated += max(reported - expected, 0)
+        missed += max(expected - reported, 0)
+    elapsed = time.perf_counter() - started
+
+    new_total = frames[-1][0] - frames[0][0]
+    aligned_lines = args.window * (len(frames) - 1)
+    duplicated_ratio = duplicated / max(new_total, 1)
+    missed_ratio = missed / max(new_total, 1)
+    print(f"frames: {len(frames)}, new lines: {new_total}")
+    print(f"speed: {elapsed * 1000.0 / (len(frames) - 1):.3f} ms/frame, {aligned_lines / elapsed:.0f} lines/sec")
+    checks = [
+        ("duplicated", f"{duplicated} ({duplicated_ratio:.2%}) <= {args.max_duplicated:.2%}", duplicated_ratio <= args.max_duplicated),
+        ("missed", f"{missed} ({missed_ratio:.2%}) <= {args.max_missed:.2%}", missed_ratio <= args.max_missed),
+    ]
+    for name, value, passed in checks:
+        print(f"{'ok' if passed else 'FAIL':<5} {name:<11} {value}")
+    if not all(passed for _, _, passed in checks):
+        raise SystemExit(1)
+
+
+def benchmark_parse(args):
+    import re
+
+    from combat_log_processor import CombatLogParser, DamageInfo, LogClassifier, ParserConfig, damage_matches
+
+    rng = np.random.default_rng(0)
+    if args.log or os.path.exists('./logs/combat_log.log'):
+        lines = load_log_lines(args.log or './logs/combat_log.log')
+    else:
+        other = ['Recovered 1520 HP.', 'You received the effect of Blessing of Wind.',
+                 'Ancient Dragon used Tail Sweep against you and dealt 4800 damage.',
+                 'Unable to use the skill now.', 'The effect of Stone Skin has ended.']
+        damage = synthetic_log_lines(args.lines // 2, rng)
+        lines = damage + [other[i] for i in rng.integers(0, len(other), args.lines - len(damage))]
+        rng.shuffle(lines)
+    lines = lines * max(1, args.lines // max(len(lines), 1))
+
+    # message types a parser would add next, registered after the damage patterns
+    extra_matches = [
+        ParserConfig(pattern=re.compile(r"Recovered ([0-9]+) HP."), keyword="Recovered", kind="healing"),
+        ParserConfig(pattern=re.compile(r"Received ([0-9]+) damage from (.*)."), keyword="Received", kind="received_damage"),
+        ParserConfig(pattern=re.compile(r"Continuous damage of ([0-9]+) to (.*)."), keyword="Continuous", kind="dot"),
+        ParserConfig(pattern=re.compile(r"You received the effect of (.*)."), keyword="You received", kind="buff"),
+        ParserConfig(pattern=re.compile(r"The effect of (.*) has ended."), keyword="The effect of", kind="buff_end"),
+    ]
+
+    def legacy_filter(configs):
+        # _filter_damage before the classifier: every pattern searched in order
+        show_ignored = False
+
+        def run(logs, timestamp):
+            result = []
+            for log in logs:
+                for match in configs:
+                    m = match.pattern.search(log)
+                    if m:
+                        break
+                else:
+                    match = None
+                if match is not None and match.kind == "damage":
+                    result.append(DamageInfo(
+                        timestamp=timestamp,
+                        skill_name=m.group(match.skill_name_group) if match.skill_name_group > 0 else "",
+                        target_name=m.group(match.target_name_group) if match.target_name_group > 0 else "",
+                        damage=int(m.group(match.damage_group).replace(".", "")) if match.damage_group > 0 else 0,
+                        multiplier_type=m.group(match.multiplier_type_group) if match.multiplier_type_group > 0 else "",
+                    ))
+                elif show_ignored and match is None:
+                    print("-", log)
+            return result
+        return run
+
+    def classifier_filter(configs):
+        parser = CombatLogParser()
+        parser.classifier = LogClassifier(configs)
+        return parser._filter_damage
+
+    for title, configs in (("damage patterns", damage_matches),
+                           ("with 5 more message types", damage_matches + extra_matches)):
+        runs = (("before (search every pattern)", legacy_filter(configs)),
+                ("after (keyword dispatch)", classifier_filter(configs)))
+        # interleaved so that both see the same machine load
+        best = [float("inf")] * len(runs)
+        results = [None] * len(runs)
+        for _ in range(args.repeat):
+            for i, (_, run) in enumerate(runs):
+                started = time.perf_counter()
+                results[i] = run(lines, 0)
+                best[i] = min(best[i], time.perf_counter() - started)
+        print(f"{title}: {len(results[-1])} damage lines, {sum(d.damage for d in results[-1])} damage")
+        for (name, _), elapsed, result in zip(runs, best, results):
+            print(f"  {name}: {len(lines) / elapsed:.0f} lines/sec, {len(result)} damage lines")
+
+
+def benchmark_names(args):
+    from collections import Counter
+
+    from name_index import NameIndex
+
+    rng = np.random.default_rng(0)
+    first = ['Flame', 'Frost', 'Wind', 'Earth', 'Dark', 'Soul', 'Blade', 'Holy', 'Shadow', 'Thunder', 'Venom', 'Iron',
+             'Ancient', 'Savage', 'Piercing', 'Crushing', 'Spinning', 'Rising', 'Hidden', 'Burning']
+    second = ['Bolt', 'Chain', 'Cut', 'Spike', 'Flash', 'Strike', 'Storm', 'Arrow', 'Slash', 'Nova', 'Wave', 'Blow',
+              'Dragon', 'Goblin', 'Fang', 'Shield', 'Burst', 'Howl', 'Lance', 'Roar']
+    names = sorted({f"{rng.choice(first)} {rng.choice(second)}" for _ in range(args.names * 4)})[:args.names]
+    # ranks of one skill differ by a letter but must stay apart
+    names += [f"{name} {rank}" for name in names[::10] for rank in ("II", "III")]
+    # a few skills are used most of the time
+    weights = 1.0 / np.arange(1, len(names) + 1)
+    truth = rng.choice(len(names), args.lookups, p=weights / weights.sum())
+    stream = [ocr_noise(names[i], rng, args.noise) for i in truth]
+    print(f"{len(names)} names, {len(set(stream))} distinct OCR'd variants in {len(stream)} lookups")
+
+    checks = []
+    for title, index in (("memo", NameIndex()),
+                         ("no memo", NameIndex(cache_size=0)),
+                         ("memo and known names", NameIndex(names))):
+        started = time.perf_counter()
+        ids = [index.canonical_id(name) for name in stream]
+        elapsed = time.perf_counter() - started
+        # purity: share of the lookups of a canonical id that belong to its most common true name,
+        # the overflow name collects names past max_names on purpose and is left out
+        by_id = {}
+        for name_id, true_id in zip(ids, truth):
+            if name_id != index.overflow_id:
+                by_id.setdefault(name_id, Counter())[true_id] += 1
+        named = sum(sum(counter.values()) for counter in by_id.values())
+        purity = sum(counter.most_common(1)[0][1] for counter in by_id.values()) / max(named, 1)
+        # recall: share of the lookups of a true name that land on its most common canonical id
+        by_truth = {}
+        for name_id, true_id in zip(ids, truth):
+            by_truth.setdefault(true_id, Counter())[name_id] += 1
+        recall = sum(counter.most_common(1)[0][1] for counter in by_truth.values()) / len(ids)
+        print(f"{title}: {len(stream) / elapsed:.0f} lookups/s, {len(index.names)} canonical names, purity {purity:.2%}, "
+              f"recall {recall:.2%}, memo hit ratio {index.stats()['hit_ratio']:.1%}")
+        # distinct names must never merge, misread variants must, with known names and without
+        checks.append((f"{title} purity", f"{purity:.2%} >= {args.min_purity:.2%}", purity >= args.min_purity))
+        checks.append((f"{title} recall", f"{recall:.2%} >= {args.min_recall:.2%}", recall >= args.min_recall))
+
+    for name, value, passed in checks:
+        print(f"{'ok' if passed else 'FAIL':<5} {name:<32} {value}")
+    if not all(passed for _, _, passed in checks):
+        raise SystemExit(1)
+
+
+def benchmark_store(args):
+    import tempfile
+
+    from combat_log_processor import DamageInfo
+    from damage_store import DamageEventStore
+
+    directory = args.dir or tempfile.mkdtemp(prefix='damage_store_')
+    store = DamageEventStore(directory)
+    if len(store) == 0:
+        # an evening of pulls: hits every ~100 ms, a minute of idle between pulls
+        rng = np.random.default_rng(0)
+        skills = [f'Skill {i}' for i in range(40)]
+        targets = ['Training Dummy', 'Ancient Dragon', 'Goblin']
+        multipliers = ['', 'Critical', 'Perfect', 'Double Critical']
+        pull_events = args.events // args.pulls
+        started = time.perf_counter()
+        timestamp = 0
+        for _ in range(args.pulls):
+            batch = []
+            for i in range(pull_events):
+                timestamp += int(rng.integers(50, 150))
+                batch.append(DamageInfo(timestamp, skills[rng.integers(len(skills))], targets[rng.integers(len(targets))],
+                                        int(rng.integers(100, 5000)), multipliers[rng.integers(len(multipliers))]))
+            store.append(batch)
+            timestamp += 60000
+        store.flush()
+        elapsed = time.perf_counter() - started
+        print(f"generate and append: {len(store)} events, {len(store) / elapsed:.0f} events/sec")
+
+    pulls = store.pulls(args.idle_gap)
+    print(f"store: {directory}, {len(store)} events, {len(pulls)} pulls")
+    pull = min(args.pull, len(pulls))
+    for name, query in (("pulls", lambda: store.pulls(args.idle_gap)),
+                        (f"dps by skill, pull {pull}", lambda: store.damage_by('skill', pull, args.idle_gap)),
+                        ("damage by target, all pulls", lambda: store.damage_by('target')),
+                        ("damage per second buckets, all pulls", lambda: store.damage_by_time(1000))):
+        started = time.perf_counter()
+        result = query()
+        rows = len(result[0]) if isinstance(result, tuple) else len(result)
+        print(f"{name}: {(time.perf_counter() - started) * 1000:.2f} ms, {rows} rows")
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aion 2 DPS meter benchmarks')
+    parser.add_argument('--config', default=os.path.join(os.getcwd(), 'config.ini'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay = commands.add_parser('replay', help='run a recorded frame archive through the whole pipeline')
+    replay.add_argument('archive')
+    replay.set_defaults(handler=benchmark_replay)
+
+    detectors = commands.add_parser('detectors', help='compare frame change detectors')
+    detectors.add_argument('--archive', default='', help='frame archive, synthetic frames if omitted')
+    detectors.add_argument('--frames', type=int, default=300)
+    detectors.set_defaults(handler=benchmark_detectors)
+
+    preprocess = commands.add_parser('preprocess', help='check and time color text extraction')
+    preprocess.add_argument('--archive', default='', help='frame archive, synthetic frames if omitted')
+    preprocess.add_argument('--frames', type=int, default=300)
+    preprocess.set_defaults(handler=benchmark_preprocess)
+
+    ocr_modes = commands.add_parser('ocr-modes', help='compare full and recognition-only OCR on recorded frames')
+    ocr_modes.add_argument('archive')
+    ocr_modes.add_argument('--frames', type=int, default=100)
+    ocr_modes.add_argument('--batch', type=int, default=1, help='frames per recognizer batch in rec_only mode')
+    ocr_modes.set_defaults(handler=benchmark_ocr_modes)
+
+    ocr_engines = commands.add_parser('ocr-engines', help='speed of the OCR engines and their character error rate against the first one')
+    ocr_engines.add_argument('archive')
+    ocr_engines.add_argument('--frames', type=int, default=100)
+    ocr_engines.add_argument('--engines', default='paddle,glyph,onnx,onnx-int8', help='comma separated, the first one is the reference')
+    ocr_engines.add_argument('--mode', default='rec_only', choices=('full', 'rec_only'))
+    ocr_engines.add_argument('--threads', type=int, default=0, help='onnx intra-op threads, [ocr] onnx_threads if omitted')
+    ocr_engines.add_argument('--atlas', default='', help='glyph atlas, [ocr] glyph_atlas if omitted')
+    ocr_engines.set_defaults(handler=benchmark_ocr_engines)
+
+    regression = commands.add_parser('regression', help='synthetic combat log through ocr, parser and calculator, fails below the thresholds')
+    regression.add_argument('--frames', type=int, default=300)
+    regression.add_argument('--seed', type=int, default=0)
+    regression.add_argument('--engine', default='glyph', help='ocr engine, [ocr] engine if empty')
+    regression.add_argument('--atlas', default='', help='glyph atlas, built from synthetic frames if omitted')
+    regression.add_argument('--atlas-frames', type=int, default=100, help='synthetic frames the glyph atlas is built from')
+    regression.add_argument('--noise', type=float, default=0.0, help='standard deviation of gaussian pixel noise')
+    regression.add_argument('--blur', type=int, default=0, help='gaussian blur radius in pixels')
+    regression.add_argument('--max-damage-error', type=float, default=0.01, help='relative error of the total damage and the hit count')
+    regression.add_argument('--max-cer', type=float, default=0.02)
+    regression.add_argument('--min-fps', type=float, default=5.0)
+    regression.set_defaults(handler=benchmark_regression)
+
+    incremental = commands.add_parser('incremental', help='scroll-aware incremental OCR against full OCR, fails unless it is faster and reads the same text')
+    incremental.add_argument('--archive', default='', help='frame archive, synthetic frames if omitted')
+    incremental.add_argument('--frames', type=int, default=300)
+    incremental.add_argument('--seed', type=int, default=0)
+    incremental.add_argument('--engine', default='', help='ocr engine, [ocr] engine if empty')
+    incremental.add_argument('--atlas', default='', help='glyph atlas, built from synthetic frames if omitted')
+    incremental.add_argument('--atlas-frames', type=int, default=100, help='synthetic frames the glyph atlas is built from')
+    incremental.add_argument('--noise', type=float, default=0.0, help='standard deviation of gaussian pixel noise')
+    incremental.set_defaults(handler=benchmark_incremental)
+
+    align = commands.add_parser('align', help='new line detection speed and duplicate/missed line rates')
+    align.add_argument('--log', default='', help='saved combat_log.log used as corpus, synthetic lines if omitted')
+    align.add_argument('--lines', type=int, default=5000)
+    align.add_argument('--window', type=int, default=40, help='lines visible in one frame')
+    align.add_argument('--max-scroll', type=positive_int, default=6, help='most new lines between two frames, at least 1')
+    align.add_argument('--noise', type=float, default=0.01, help='per character OCR substitution rate')
+    align.add_argument('--max-duplicated', type=float, default=0.02, help='share of the new lines reported twice')
+    align.add_argument('--max-missed', type=float, default=0.02, help='share of the new lines not reported')
+    align.set_defaults(handler=benchmark_align)
+
+    parse = commands.add_parser('parse', help='damage line classification throughput')
+    parse.add_argument('--log', default='', help='saved combat_log.log, ./logs/combat_log.log or synthetic lines if omitted')
+    parse.add_argument('--lines', type=int, default=200000)
+    parse.add_argument('--repeat', type=int, default=5)
+    parse.set_defaults(handler=benchmark_parse)
+
+    names = commands.add_parser('names', help='skill and target name canonicalization speed and accuracy')
+    names.add_argument('--names', type=int, default=60, help='distinct true names')
+    names.add_argument('--lookups', type=int, default=100000)
+    names.add_argument('--noise', type=float, default=0.03, help='per character OCR substitution rate')
+    names.add_argument('--min-purity', type=float, default=0.99, help='share of the lookups on a canonical name that belong to it')
+    names.add_argument('--min-recall', type=float, default=0.9, help='share of the lookups of a name that find its most common canonical name')
+    names.set_defaults(handler=benchmark_names)
+
+    store = commands.add_parser('store', help='damage event store append and query speed')
+    store.add_argument('--dir', default='', help='existing event store, a synthetic one in a temp directory if omitted')
+    store.add_argument('--events', type=int, default=1000000)
+    store.add_argument('--pulls', type=int, default=20)
+    store.add_argument('--pull', type=int, default=7)
+    store.add_argument('--idle-gap', type=int, default=10000, help='ms without damage that ends a pull')
+    store.set_defaults(handler=benchmark_store)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+
+class ChangeResult:
+    def __init__(self, changed, rows=None):
+        self.changed = changed
+        # (top, bottom) bands of changed rows in frame coordinates, None if unknown
+        self.rows = rows
+
+
+class SSIMChangeDetector:
+    def __init__(self, threshold=0.9):
+        self.threshold = threshold
+
+    def detect(self, prev, cur):
+        from utils import images_not_similar
+
+        return ChangeResult(images_not_similar(prev, cur, self.threshold))
+
+
+class RowHashChangeDetector:
+    # Stage 1 compares downsampled grayscale frames and exits early when they are
+    # identical or differ only by noise. Stage 2 counts rows whose mean difference
+    # exceeds row_threshold: many changed rows (new lines, scrolling) is a change for
+    # sure. Only the ambiguous rest is compared with SSIM at full resolution.
+    def __init__(self, scale=4, noise_threshold=0.5, row_threshold=4.0, changed_rows_ratio=0.02, ssim_threshold=0.9):
+        self.scale = scale
+        self.noise_threshold = noise_threshold
+        self.row_threshold = row_threshold
+        self.changed_rows_ratio = changed_rows_ratio
+        self.ssim_threshold = ssim_threshold
+
+        self.last_image = None
+        self.last_features = None
+
+        self.early_exits = 0
+        self.fine_checks = 0
+
+    def detect(self, prev, cur):
+        if prev is None or cur is None or prev.shape != cur.shape:
+            return ChangeResult(True)
+
+        prev_features = self.last_features if prev is self.last_image else self._features(prev)
+        cur_features = self._features(cur)
+        self.last_image = cur
+        self.last_features = cur_features
+
+        if np.array_equal(prev_features, cur_features):
+            self.early_exits += 1
+            return ChangeResult(False, [])
+
+        row_diff = cv2.absdiff(prev_features, cur_features).mean(axis=1)
+        if row_diff.max() <= self.noise_threshold:
+            self.early_exits += 1
+            return ChangeResult(False, [])
+
+        changed_rows = row_diff > self.row_threshold
+        rows = self._row_bands(changed_rows, cur.shape[0])
+        if changed_rows.mean() >= self.changed_rows_ratio:
+            return ChangeResult(True, rows)
+
+        self.fine_checks += 1
+        return ChangeResult(self._fine_changed(prev, cur), rows)
+
+    def _features(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+        h, w = gray.shape
+        return cv2.resize(gray, (max(w // self.scale, 1), max(h // self.scale, 1)), interpolation=cv2.INTER_AREA)
+
+    def _fine_changed(self, prev, cur):
+        from skimage.metrics import structural_similarity
+
+        prev_gray = cv2.cvtColor(prev, cv2.COLOR_RGB2GRAY) if prev.ndim == 3 else prev
+        cur_gray = cv2.cvtColor(cur, cv2.COLOR_RGB2GRAY) if cur.ndim == 3 else cur
+        return structural_similarity(prev_gray, cur_gray, full=False) < self.ssim_threshold
+
+    def _row_bands(self, changed_rows, height):
+        bands = []
+        edges = np.diff(np.concatenate(([0], changed_rows.astype(np.int8), [0])))
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            bands.append((int(start) * self.scale, min(int(end) * self.scale, height)))
+        return bands
+
+
+change_detectors = {
+    "ssim": SSIMChangeDetector,
+    "rowhash": RowHashChangeDetector,
+}
+
+
+def create_change_detector(name):
+    if name not in change_detectors:
+        raise ValueError(f"Unsupported change detector: {name}")
+    return change_detectors[name]()
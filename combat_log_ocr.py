@@ -1,7 +1,14 @@
+import threading
+import time
+
 import cv2
 import numpy as np
-import paddle
-from paddleocr import PaddleOCR
+
+from ocr_engine import GlyphEngine, OnnxEngine, PaddleEngine, ocr_engines
+from recognition_cache import RecognitionCache
+from scroll_tracker import ScrollTracker
+from text_extractor import ColorTextExtractor
+from text_layout import TextLine, crop_band, find_text_bands, lines_to_text, text_bounds, text_mask
 
 
 class RecognizedResult:
@@ -11,6 +18,19 @@ class RecognizedResult:
         self.text = text
         self.timestamp = timestamp
         self.seq_id = seq_id
+        self.captured_at = None
+        self.error = None
+        # seconds spent per ocr stage
+        self.timings = {}
+        # line cache hits, misses and evictions of this frame, added to the pipeline counters
+        self.counters = {}
+        # pooled capture behind image, released once the snapshot is analyzed
+        self.capture = None
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
 
 
 class CombatLogOCR:
@@ -26,7 +46,30 @@ class CombatLogOCR:
         extract_color_ranges,
         resize_factor=2,
         resize_interpolation=cv2.INTER_NEAREST_EXACT,
+        incremental=False,
+        incremental_refresh=30,
+        mode="full",
+        rec_batch_num=16,
+        line_cache_size=4096,
+        glyph_atlas="./models/glyph_atlas.npz",
+        onnx_det_model=None,
+        onnx_rec_model="./models/PP-OCRv5_rec.onnx",
+        onnx_rec_dict="./models/ppocrv5_dict.txt",
+        onnx_quantize=False,
+        onnx_threads=1,
+        paddle_threads=1,
+        load=True,
     ):
+        if ocr_engine not in ocr_engines:
+            raise ValueError(f"Unsupported OCR engine: {ocr_engine}")
+        if mode not in ("full", "rec_only"):
+            raise ValueError(f"Unsupported OCR mode: {mode}")
+        if not ocr_engines[ocr_engine].detects_lines:
+            # the engine reads line crops only, so lines are always cut here
+            mode = "rec_only"
+        if ocr_engine == "onnx" and mode == "full" and not onnx_det_model:
+            raise ValueError("ONNX full mode needs onnx_det_model, or use mode=rec_only")
+
         self.color_ranges = extract_color_ranges
         self.ocr_engine = ocr_engine
         self.ocr_lang = ocr_lang
@@ -34,68 +77,192 @@ class CombatLogOCR:
         self.det_model_dir = det_model_dir
         self.rec_model_dir = rec_model_dir
         self.cls_model_dir = cls_model_dir
-        self.use_gpu = self._detect_gpu() if use_gpu is None else use_gpu
+        # None means detected when the engine is loaded
+        self.use_gpu = use_gpu
         self.resize_factor = resize_factor
         self.resize_interpolation = resize_interpolation
+        self.mode = mode
+        self.rec_batch_num = rec_batch_num
+        self.glyph_atlas = glyph_atlas
+        self.onnx_det_model = onnx_det_model
+        self.onnx_rec_model = onnx_rec_model
+        self.onnx_rec_dict = onnx_rec_dict
+        self.onnx_quantize = onnx_quantize
+        self.onnx_threads = onnx_threads
+        self.paddle_threads = paddle_threads
+        # line crops exist only in recognition-only mode
+        self.line_cache = RecognitionCache(line_cache_size) if mode == "rec_only" and line_cache_size > 0 else None
+        # counters of the frame each ocr thread is working on
+        self.local = threading.local()
+        self.text_extractor = ColorTextExtractor(extract_color_ranges, resize_factor, resize_interpolation)
+        # incremental mode keeps state between frames, so frames have to come in order
+        self.scroll_tracker = ScrollTracker(refresh_interval=incremental_refresh) if incremental else None
+
+        # building the engine takes seconds, with load=False it is left to load()
+        self.engine = None
+        self.ready = threading.Event()
+        self.load_error = None
+        if load:
+            self.load()
 
-        if self.ocr_engine != "paddle":
-            raise ValueError(f"Unsupported OCR engine: {self.ocr_engine}")
 
-        self.ocr = self._init_paddle_ocr()
+    def load(self, warm_up_shape=None):
+        try:
+            engine = self._create_engine()
+            engine.load()
+            self.engine = engine
+            if warm_up_shape is not None:
+                self.warm_up(warm_up_shape)
+        except Exception as e:
+            self.load_error = e
+            raise
+        finally:
+            self.ready.set()
+
+
+    def warm_up(self, shape):
+        # the first inference allocates buffers and selects kernels, a dummy line pays for it before real frames
+        dummy = np.zeros(shape, dtype=np.uint8)
+        cv2.putText(dummy, "Used Warm Up against Dummy and dealt 1200 damage.", (4, min(20, shape[0] - 1)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (220, 180, 120), 1)
+        self._recognize_lines(*self._preprocess_image(dummy))
 
 
     def handle(self, image, timestamp, seq_id):
-        processed = self._preprocess_image(image)
-        text = self._paddle_to_text(processed)
-        return RecognizedResult(image, processed, text, timestamp, seq_id)
+        self._wait_ready()
+        self.local.counters = {}
+        started = time.perf_counter()
+        processed, bounds = self._preprocess_image(image)
+        preprocessed = time.perf_counter()
+        if bounds is None:
+            # nothing in the text colors, the frame never reaches the engine
+            if self.scroll_tracker is not None:
+                self.scroll_tracker.reset()
+            result = RecognizedResult(image, processed, "", timestamp, seq_id)
+            result.timings = {"preprocess": preprocessed - started}
+            return result
+        if self.scroll_tracker is not None:
+            lines = self.scroll_tracker.recognize(processed, self._recognize_lines)
+        else:
+            lines = self._recognize_lines(processed, bounds)
+        text = lines_to_text(lines)
+        result = RecognizedResult(image, processed, text, timestamp, seq_id)
+        result.timings = {"preprocess": preprocessed - started, "ocr": time.perf_counter() - preprocessed}
+        result.counters = self.local.counters
+        return result
+
+
+    def handle_batch(self, frames):
+        # recognition-only mode sends the lines of all frames to the recognizer at once,
+        # scroll tracking needs the previous frame's result so it goes frame by frame
+        if self.mode != "rec_only" or self.scroll_tracker is not None:
+            return [self.handle(image, timestamp, seq_id) for image, timestamp, seq_id in frames]
+
+        self._wait_ready()
+        self.local.counters = {}
+        started = time.perf_counter()
+        processed = [self._preprocess_image(image) for image, _, _ in frames]
+        preprocessed = time.perf_counter()
+        lines = self._recognize_bands([image for image, _ in processed],
+                                      [self._segment_lines(image, bounds) if bounds is not None else [] for image, bounds in processed])
+        recognized = time.perf_counter()
+
+        results = []
+        for (image, timestamp, seq_id), (processed_image, bounds), frame_lines in zip(frames, processed, lines):
+            result = RecognizedResult(image, processed_image, lines_to_text(frame_lines), timestamp, seq_id)
+            # the batch is shared evenly
+            result.timings = {"preprocess": (preprocessed - started) / len(frames)}
+            if bounds is not None:
+                result.timings["ocr"] = (recognized - preprocessed) / len(frames)
+            results.append(result)
+        if results:
+            # the counters of the batch go with its first frame
+            results[0].counters = self.local.counters
+        return results
+
+
+    def _wait_ready(self):
+        # frames captured while the engine loads wait here
+        if not self.ready.is_set():
+            self.ready.wait()
+        if self.engine is None:
+            raise RuntimeError(f"OCR engine failed to load: {self.load_error}")
 
 
     def _preprocess_image(self, image):
-        resized = cv2.resize(image, None, fx=self.resize_factor, fy=self.resize_factor, interpolation=self.resize_interpolation)
-        extracted = self._extract_multi_color_text(resized, self.color_ranges)
-        return extracted
+        # (processed image, bounds of its text or None)
+        return self.text_extractor.extract_with_bounds(image)
 
 
-    def _extract_multi_color_text(self, image, color_ranges):
-        combined_mask = np.zeros(image.shape[:2], dtype=np.uint8)
-        for lower, upper in color_ranges:
-            mask = cv2.inRange(image, np.array(lower), np.array(upper))
-            combined_mask = cv2.bitwise_or(combined_mask, mask)
-        result = cv2.bitwise_and(image, image, mask=combined_mask)
-        return result
+    def _recognize_lines(self, image, bounds=None):
+        # without bounds (strips of the scroll tracker) they are taken from the image itself
+        if bounds is None:
+            bounds = text_bounds(text_mask(image))
+            if bounds is None:
+                return []
+        if self.mode == "rec_only":
+            return self._recognize_bands([image], [self._segment_lines(image, bounds)])[0]
+        # detection runs on the text area only, most of the processed frame is black
+        top = max(bounds.top - 2 * self.resize_factor, 0)
+        crop = crop_band(image, bounds, padding=2 * self.resize_factor)
+        return [line.shifted(top) for line in self.engine.detect_and_recognize(crop)]
 
 
-    def _detect_gpu(self):
-        return paddle.device.is_compiled_with_cuda() and paddle.device.cuda.device_count() > 0
+    def _segment_lines(self, image, bounds):
+        # the log font has a fixed size, lines are found by horizontal projection of the text mask
+        region = image[bounds.top:bounds.bottom, bounds.left:bounds.right]
+        bands = find_text_bands(text_mask(region), min_height=4 * self.resize_factor, max_gap=self.resize_factor)
+        return [band.shifted(bounds.top, bounds.left) for band in bands]
 
 
-    def _init_paddle_ocr(self):
-        options = {
-            "lang": self.ocr_lang,
-            "use_angle_cls": True,
-            "show_log": False,
-            "use_gpu": self.use_gpu,
-        }
-        if self.ocr_version:
-            options["ocr_version"] = self.ocr_version
-        if self.det_model_dir:
-            options["det_model_dir"] = self.det_model_dir
-        if self.rec_model_dir:
-            options["rec_model_dir"] = self.rec_model_dir
-        if self.cls_model_dir:
-            options["cls_model_dir"] = self.cls_model_dir
-        return PaddleOCR(**options)
+    def _recognize_bands(self, images, bands_per_image):
+        crops = []
+        for image, bands in zip(images, bands_per_image):
+            crops += [crop_band(image, band, padding=2 * self.resize_factor) for band in bands]
+        texts = self._recognize_crops(crops)
 
+        result = []
+        position = 0
+        for bands in bands_per_image:
+            lines = []
+            for band, text in zip(bands, texts[position:position + len(bands)]):
+                if text:
+                    lines.append(TextLine(band.top, band.bottom, text))
+            position += len(bands)
+            result.append(lines)
+        return result
 
-    def _paddle_to_text(self, image):
-        try:
-            result = self.ocr.ocr(image, cls=True)
-        except Exception as exc:
-            print(f"OCR Error: {exc}")
-            return ""
-        lines = []
-        for block in result or []:
-            for line in block or []:
-                if len(line) > 1 and line[1]:
-                    lines.append(line[1][0])
-        return "\n".join(lines)
+
+    def _recognize_crops(self, crops):
+        if self.line_cache is None:
+            return self.engine.recognize(crops)
+
+        keys = [self.line_cache.key(crop) for crop in crops]
+        texts = [self.line_cache.get(key) if key is not None else "" for key in keys]
+        missed = [i for i, text in enumerate(texts) if text is None]
+        counters = getattr(self.local, "counters", None)
+        if counters is not None:
+            # blank crops have no key and are no lookup
+            lookups = sum(key is not None for key in keys)
+            counters["line_cache_hits"] = counters.get("line_cache_hits", 0) + lookups - len(missed)
+            counters["line_cache_misses"] = counters.get("line_cache_misses", 0) + len(missed)
+        evicted = 0
+        for i, text in zip(missed, self.engine.recognize([crops[i] for i in missed])):
+            texts[i] = text
+            evicted += self.line_cache.put(keys[i], text)
+        if counters is not None and evicted:
+            counters["line_cache_evictions"] = counters.get("line_cache_evictions", 0) + evicted
+        return texts
+
+
+    def _create_engine(self):
+        if self.ocr_engine == "glyph":
+            return GlyphEngine(self.glyph_atlas, self.resize_factor)
+        if self.ocr_engine == "onnx":
+            # the detection model is loaded only when lines are detected by the engine
+            return OnnxEngine(self.onnx_rec_model, self.onnx_rec_dict, self.onnx_det_model if self.mode == "full" else None,
+                              self.onnx_quantize, self.onnx_threads, self.rec_batch_num)
+        if self.use_gpu is None:
+            self.use_gpu = PaddleEngine.detect_gpu()
+        return PaddleEngine(self.ocr_lang, self.ocr_version, self.det_model_dir, self.rec_model_dir,
+                            self.cls_model_dir, self.use_gpu, self.rec_batch_num, self.paddle_threads)
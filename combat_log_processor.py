@@ -2,12 +2,17 @@ import re
 
 from pathlib import Path
 
-from utils import fuzzy_string_match, format_timestamp
+from log_aligner import LogAligner
+from log_writer import LogWriter
+from name_index import NameIndex
 
 
 class ParserConfig:
-    def __init__(self, pattern, skill_name_group=-1, target_name_group=-1, damage_group=-1, multiplier_type_group=-1):
+    def __init__(self, pattern, keyword, kind="damage", skill_name_group=-1, target_name_group=-1, damage_group=-1, multiplier_type_group=-1):
+        # pattern starts with keyword, numbered groups only
         self.pattern = pattern
+        self.keyword = keyword
+        self.kind = kind
         self.skill_name_group = skill_name_group
         self.target_name_group = target_name_group
         self.damage_group = damage_group
@@ -18,10 +23,56 @@ damage_pattern = re.compile(r"Used (.*?) against (.*?) and dealt ([0-9]+[0-9.]*)
 additional_damage_pattern = re.compile(r"Dealt additional damage of ([0-9]+[0-9.]*) to (.*).")
 
 damage_matches = [
-    ParserConfig(pattern=damage_pattern, skill_name_group=1, target_name_group=2, damage_group=3, multiplier_type_group=4),
-    ParserConfig(pattern=additional_damage_pattern, damage_group=1, target_name_group=2),
+    ParserConfig(pattern=damage_pattern, keyword="Used", skill_name_group=1, target_name_group=2, damage_group=3, multiplier_type_group=4),
+    ParserConfig(pattern=additional_damage_pattern, keyword="Dealt additional", damage_group=1, target_name_group=2),
 ]
 
+
+class LogClassifier:
+    # The patterns of all message types are joined into one alternation that is
+    # matched at the start of a line, so the regex engine picks the message type by
+    # its keyword and parses it in the same call; only the pattern of that type runs
+    # past the keyword. Lines not starting with a known message (OCR junk in front
+    # of it, unknown message types) are checked for the keywords with a substring
+    # test, much cheaper than a regex search, and matched where one is found.
+    def __init__(self, configs):
+        self.configs = []
+        self.by_group = []
+        self.pattern = None
+        self.keywords = None
+        for config in configs:
+            self.register(config)
+
+    def register(self, config):
+        self.configs.append(config)
+        # group of every config's alternative, its own groups follow it
+        parts = []
+        self.by_group = [None]
+        for c in self.configs:
+            parts.append(f"({c.pattern.pattern})")
+            self.by_group += [c] + [None] * c.pattern.groups
+        self.pattern = re.compile("|".join(parts))
+        self.keywords = [c.keyword for c in self.configs]
+
+    def classify(self, lines):
+        # yields (line, config, match, base) of every line, group k of config.pattern is
+        # group base + k of match; config and match are None if the line has no known type
+        match = self.pattern.match
+        keywords = self.keywords
+        by_group = self.by_group
+        for line in lines:
+            m = match(line)
+            if m is None:
+                for keyword in keywords:
+                    if keyword in line:
+                        m = match(line, line.find(keyword, 1))
+                        break
+                if m is None:
+                    yield line, None, None, 0
+                    continue
+            yield line, by_group[m.lastindex], m, m.lastindex
+
+
 class DamageInfo:
     def __init__(self, timestamp, skill_name, target_name, damage, multiplier_type):
         self.timestamp = timestamp
@@ -29,16 +80,26 @@ class DamageInfo:
         self.target_name = target_name
         self.damage = damage
         self.multiplier_type = multiplier_type
+        # canonical ids of the names, set when the parser canonicalizes names
+        self.skill_id = None
+        self.target_id = None
 
 
 class CombatLogParser:
     def __init__(self):
         self.prev_logs = []
+        self.aligner = LogAligner()
+        self.classifier = LogClassifier(damage_matches)
+        self.unaligned_frames = 0
+        # lines of unaligned frames that were not counted, their damage is lost
+        self.unaligned_lines_dropped = 0
         self.damage_log = False
         self.show_ignored = False
-        self.save_combat_log = False
+        self.log_writer = None
         self.log_file_path = Path("./logs/combat_log.log")
-        self.log_file_path.parent.mkdir(exist_ok=True, parents=True)
+        # names are kept as read unless set_name_canonicalization turns it on
+        self.skill_names = None
+        self.target_names = None
 
 
     def set_debug(self, damage_log, show_ignored):
@@ -46,18 +107,23 @@ class CombatLogParser:
         self.show_ignored = show_ignored
 
 
-    def set_write_log(self, save_log):
-        self.save_combat_log = save_log
+    def set_write_log(self, save_log, **writer_options):
+        if self.log_writer is not None:
+            self.log_writer.close()
+        self.log_writer = LogWriter(self.log_file_path, **writer_options) if save_log else None
 
-    def _save_logs_to_file(self, logs, timestamp):
-        try:
-            formatted_time = format_timestamp(timestamp)
-            with open(self.log_file_path, 'a', encoding='utf-8') as f:
-                for log in logs:
-                    f.write(f"[{formatted_time}] {log}\n")
-        except Exception as e:
-            print(f"Error saving combat log: {e}")
 
+    def set_name_canonicalization(self, enabled, known_skills=(), known_targets=(), **index_options):
+        # misread variants of a name are merged into one canonical name, None keeps names as read
+        self.skill_names = NameIndex(known_skills, **index_options) if enabled else None
+        self.target_names = NameIndex(known_targets, **index_options) if enabled else None
+
+
+    def close(self):
+        # writes out the queued log lines
+        if self.log_writer is not None:
+            self.log_writer.close()
+            self.log_writer = None
 
 
     def parse_combat_log(self, text, timestamp, seq_id):
@@ -79,78 +145,63 @@ class CombatLogParser:
 
 
     def _detect_new_logs(self, logs):
-        if len(logs) == 0 or len(self.prev_logs) == 0:
-            self.prev_logs = logs
+        # an empty frame (failed ocr, hidden panel) says nothing about what is new
+        if len(logs) == 0:
             return logs
 
-        # find anchor in current logs
-        anchor = []
-        anchor_cur_end_pos = 0
-        if len(logs) < 2:
-            anchor = logs
-        else:
-            # find anchor/pattern
-            for i in range(1, len(logs)):
-                if not fuzzy_string_match(logs[i - 1], logs[i], 6):
-                    anchor.append(logs[i - 1])
-                    anchor.append(logs[i])
-                    anchor_cur_end_pos = i + 1
-                    break
-        if len(anchor) == 0:
-            anchor = logs[:2]
-
-        if len(self.prev_logs) < len(anchor):
-            return logs
-
-        # find the same anchor in prev_logs
-        anchor_prev_found = False
-        anchor_prev_end_pos = len(self.prev_logs)
-        for i in range(0, len(self.prev_logs) - 1):
-            if fuzzy_string_match(self.prev_logs[i], anchor[0]):
-                if len(anchor) == 1:
-                    anchor_prev_end_pos = i + 1
-                    anchor_prev_found = True
-                    break
-                if fuzzy_string_match(self.prev_logs[i + 1], anchor[1]):
-                    anchor_prev_end_pos = i + 2
-                    anchor_prev_found = True
-                    break
-
-        # calc equal pos count and then remove from incoming logs
-        same_length = len(self.prev_logs) - anchor_prev_end_pos
-        result = logs[anchor_cur_end_pos + same_length:] if anchor_prev_found else logs
+        overlap = self.aligner.overlap(self.prev_logs, logs)
+        if overlap is None:
+            self.unaligned_frames += 1
+            if self.aligner.full_panels(self.prev_logs, logs):
+                # a misread frame, counting it again would duplicate the damage of the whole panel
+                overlap = len(logs)
+                self.unaligned_lines_dropped += len(logs)
+                if self.show_ignored:
+                    print("! no overlap with previous frame, its lines are dropped")
+            else:
+                overlap = 0
+                if self.show_ignored:
+                    print("! no overlap with previous frame, all lines are new")
 
         self.prev_logs = logs
-
-        return result
+        return logs[overlap:]
 
 
     def _filter_damage(self, logs, timestamp):
         result = []
-        for log in logs:
-            matched = False
-            for match in damage_matches:
-                m = match.pattern.search(log)
-                if m:
-                    result.append(DamageInfo(
-                        timestamp=timestamp,
-                        skill_name=m.group(match.skill_name_group) if match.skill_name_group > 0 else "",
-                        target_name=m.group(match.target_name_group) if match.target_name_group > 0 else "",
-                        damage=int(m.group(match.damage_group).replace(".", "")) if match.damage_group > 0 else 0, # TODO check without . remove
-                        multiplier_type=m.group(match.multiplier_type_group) if match.multiplier_type_group > 0 else "",
-                    ))
-                    matched = True
-                    break
-            if self.show_ignored and not matched:
+        show_ignored = self.show_ignored
+        for log, match, m, base in self.classifier.classify(logs):
+            if match is not None and match.kind == "damage":
+                result.append(DamageInfo(
+                    timestamp=timestamp,
+                    skill_name=m.group(base + match.skill_name_group) if match.skill_name_group > 0 else "",
+                    target_name=m.group(base + match.target_name_group) if match.target_name_group > 0 else "",
+                    damage=int(m.group(base + match.damage_group).replace(".", "")) if match.damage_group > 0 else 0, # TODO check without . remove
+                    multiplier_type=m.group(base + match.multiplier_type_group) if match.multiplier_type_group > 0 else "",
+                ))
+            elif show_ignored and match is None:
                 print("-", log)
+        if self.skill_names is not None:
+            self._canonicalize_names(result)
         return result
 
 
+    def _canonicalize_names(self, damage_list):
+        # the calculator and the event store aggregate by name, so variants are merged before them
+        skill_names = self.skill_names
+        target_names = self.target_names
+        for damage_info in damage_list:
+            damage_info.skill_id = skill_names.canonical_id(damage_info.skill_name)
+            damage_info.skill_name = skill_names.names[damage_info.skill_id]
+            damage_info.target_id = target_names.canonical_id(damage_info.target_name)
+            damage_info.target_name = target_names.names[damage_info.target_id]
+
+
     def _get_new_damage(self, logs, timestamp):
         new_logs = self._detect_new_logs(logs)
         if len(new_logs) != 0:
-            if self.save_combat_log:
-                self._save_logs_to_file(new_logs, timestamp)
+            if self.log_writer is not None:
+                self.log_writer.write(new_logs, timestamp)
 
 
         damage = self._filter_damage(new_logs, timestamp)
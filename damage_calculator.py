@@ -1,60 +1,190 @@
+import math
+
+from collections import deque
+
+
+class DamageHistogram:
+    # Counts damage values in logarithmic buckets, so any percentile is known within
+    # relative_error while memory depends only on the range of values, not on the
+    # number of hits.
+    def __init__(self, relative_error=0.01):
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def percentile(self, q):
+        if self.count == 0:
+            return 0
+        rank = q / 100 * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # middle of the bucket (gamma^(key-1), gamma^key]
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class DamageStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.crit_count = 0
+        self.histogram = DamageHistogram()
+
+    def add(self, damage, multiplier_type):
+        self.count += 1
+        self.total += damage
+        self.min = damage if self.min is None else min(self.min, damage)
+        self.max = damage if self.max is None else max(self.max, damage)
+        if "Critical" in multiplier_type:
+            self.crit_count += 1
+        self.histogram.add(damage)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count != 0 else 0
+
+    @property
+    def crit_ratio(self):
+        return self.crit_count / self.count if self.count != 0 else 0
+
+    def percentile(self, q):
+        return self.histogram.percentile(q)
+
+
 class SkillDamageInfo:
     def __init__(self):
-        self.damage = []
+        self.stats = DamageStats()
         self.damage_by_multiplier_type = {}
-        self.total_damage = 0
+
+    @property
+    def total_damage(self):
+        return self.stats.total
+
+    def add(self, damage_info):
+        self.stats.add(damage_info.damage, damage_info.multiplier_type)
+        if damage_info.multiplier_type not in self.damage_by_multiplier_type:
+            self.damage_by_multiplier_type[damage_info.multiplier_type] = DamageStats()
+        self.damage_by_multiplier_type[damage_info.multiplier_type].add(damage_info.damage, damage_info.multiplier_type)
+
+
+class DamageWindow:
+    # Hits of the last window_ms with their running sum. Every hit is appended and
+    # expired once, so keeping the window up to date is O(1) amortized per hit.
+    def __init__(self, window_ms):
+        self.window_ms = window_ms
+        self.hits = deque()
+        self.total = 0
+
+    def add(self, timestamp, damage):
+        self.hits.append((timestamp, damage))
+        self.total += damage
+
+    def expire(self, now):
+        hits = self.hits
+        while hits and hits[0][0] < now - self.window_ms:
+            self.total -= hits.popleft()[1]
+
+    @property
+    def count(self):
+        return len(self.hits)
+
+    @property
+    def average(self):
+        return self.total / len(self.hits) if self.hits else 0
+
+    @property
+    def dps(self):
+        return self.total * 1000 / self.window_ms
 
 
 class DamageCalculator:
-    def __init__(self):
+    def __init__(self, windows_ms=(1000, 5000, 30000), log=True):
+        # print the moving average and average of every frame
+        self.log = log
         self.total = 0
         self.count = 0
 
+        self.first_timestamp_ms = None
         self.last_timestamp_ms = 0
         self.average = 0
         self.moving_average = 0
 
-        self.data = []
+        # the moving average uses the first window
+        self.windows = {window_ms: DamageWindow(window_ms) for window_ms in windows_ms}
+        self.moving_average_window = self.windows[windows_ms[0]]
         self.by_skills = {}
 
 
     def process_damage(self, damage_list, now):
-        # data will be cutted by moving average window further
-        self.data += damage_list
         self.count += len(damage_list)
+        if self.first_timestamp_ms is None and damage_list:
+            self.first_timestamp_ms = damage_list[0].timestamp
 
         for damage_info in damage_list:
             self.total += damage_info.damage
+            for window in self.windows.values():
+                window.add(damage_info.timestamp, damage_info.damage)
 
             if damage_info.skill_name not in self.by_skills:
                 self.by_skills[damage_info.skill_name] = SkillDamageInfo()
-            skill_damage_info = self.by_skills[damage_info.skill_name]
-            skill_damage_info.damage.append(damage_info.damage)
-            skill_damage_info.total_damage += damage_info.damage
-
-            if damage_info.multiplier_type not in skill_damage_info.damage_by_multiplier_type:
-                skill_damage_info.damage_by_multiplier_type[damage_info.multiplier_type] = {
-                    "damage": [],
-                    "total_damage": 0
-                }
-            multiplier_type_damage_info = skill_damage_info.damage_by_multiplier_type[damage_info.multiplier_type]
-            multiplier_type_damage_info["damage"].append(damage_info.damage)
-            multiplier_type_damage_info["total_damage"] += damage_info.damage
+            self.by_skills[damage_info.skill_name].add(damage_info)
+
+        for window in self.windows.values():
+            window.expire(now)
 
         self.last_timestamp_ms = now
         self.average = self.total / self.count if self.count != 0 else 0
-        self.moving_average = self._moving_average_by_time(now)
-
-        print("=", now, ":", round(self.moving_average, 2), round(self.average, 2))
+        self.moving_average = self.moving_average_window.average
 
+        if self.log:
+            print("=", now, ":", round(self.moving_average, 2), round(self.average, 2))
 
-    def _moving_average_by_time(self, now, window_ms=1000):
-        self.data = [d for d in self.data if d.timestamp >= now - window_ms]
 
-        window_size = len(self.data)
-
-        if window_size == 0:
+    def dps(self, window_ms=None):
+        # damage per second over a window, or over the whole fight if window_ms is None
+        if window_ms is not None:
+            return self.windows[window_ms].dps
+        if self.first_timestamp_ms is None:
             return 0
-
-        total_damage = sum(d.damage for d in self.data)
-        return total_damage / window_size
\ No newline at end of file
+        elapsed_ms = self.last_timestamp_ms - self.first_timestamp_ms
+        return self.total * 1000 / elapsed_ms if elapsed_ms > 0 else 0
+
+
+    def snapshot(self):
+        # plain dict of the current numbers, safe to serialize from another thread
+        skills = {}
+        for skill_name, skill_damage_info in list(self.by_skills.items()):
+            stats = skill_damage_info.stats
+            skills[skill_name] = {
+                "count": stats.count,
+                "total": stats.total,
+                "max": stats.max,
+                "crit_ratio": round(stats.crit_ratio, 4),
+            }
+        dps = {str(window_ms): round(window.dps, 2) for window_ms, window in self.windows.items()}
+        dps["fight"] = round(self.dps(), 2)
+        return {
+            "timestamp": self.last_timestamp_ms,
+            "moving_average": round(self.moving_average, 2),
+            "average": round(self.average, 2),
+            "total": self.total,
+            "count": self.count,
+            "dps": dps,
+            "skills": skills,
+        }
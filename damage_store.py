@@ -0,0 +1,185 @@
+from pathlib import Path
+
+import numpy as np
+
+
+# one raw little-endian file per column
+event_columns = {
+    "timestamp": np.dtype("<i8"),
+    "skill": np.dtype("<i4"),
+    "target": np.dtype("<i4"),
+    "damage": np.dtype("<i8"),
+    "multiplier": np.dtype("<i4"),
+}
+# columns holding ids of interned names
+name_columns = ("skill", "target", "multiplier")
+
+
+class NameTable:
+    # names are interned to ids in the order they appear, one name per line on disk
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.ids = {}
+        if path.exists():
+            for name in path.read_text(encoding="utf-8").split("\n")[:-1]:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+        self.file = None
+
+    def intern(self, name):
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.ids[name] = name_id
+            self.names.append(name)
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            # newlines would split the name, OCR lines never contain them
+            self.file.write(name.replace("\n", " ") + "\n")
+        return name_id
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class DamageEventStore:
+    # Append-only columnar store of damage events. Events are buffered and appended
+    # to the column files in blocks; queries memory-map the columns and aggregate
+    # them with NumPy, so a store of a whole evening answers in milliseconds.
+    def __init__(self, directory, flush_size=4096):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True, parents=True)
+        self.flush_size = flush_size
+
+        self.names = {column: NameTable(self.directory / f"{column}.names") for column in name_columns}
+        self.buffers = {column: [] for column in event_columns}
+        self.files = None
+        self.mapped = None
+        self.mapped_count = -1
+
+    def append(self, damage_list):
+        buffers = self.buffers
+        skills = self.names["skill"]
+        targets = self.names["target"]
+        multipliers = self.names["multiplier"]
+        for damage_info in damage_list:
+            buffers["timestamp"].append(damage_info.timestamp)
+            buffers["skill"].append(skills.intern(damage_info.skill_name))
+            buffers["target"].append(targets.intern(damage_info.target_name))
+            buffers["damage"].append(damage_info.damage)
+            buffers["multiplier"].append(multipliers.intern(damage_info.multiplier_type))
+        if len(buffers["timestamp"]) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        # names go first, so every stored id has its name
+        for table in self.names.values():
+            table.flush()
+        if not self.buffers["timestamp"]:
+            return
+        if self.files is None:
+            self.files = {column: open(self._column_path(column), "ab") for column in event_columns}
+        for column, dtype in event_columns.items():
+            np.asarray(self.buffers[column], dtype=dtype).tofile(self.files[column])
+            self.files[column].flush()
+            self.buffers[column] = []
+
+    def close(self):
+        self.flush()
+        if self.files is not None:
+            for f in self.files.values():
+                f.close()
+            self.files = None
+        for table in self.names.values():
+            table.close()
+        self.mapped = None
+
+    def __len__(self):
+        return self._count()
+
+    def columns(self):
+        # memory-mapped view of the flushed events, remapped once more were flushed
+        count = self._count()
+        if count != self.mapped_count:
+            self.mapped = {column: np.memmap(self._column_path(column), dtype=dtype, mode="r", shape=(count,))
+                           if count > 0 else np.empty(0, dtype=dtype)
+                           for column, dtype in event_columns.items()}
+            self.mapped_count = count
+        return self.mapped
+
+    def pulls(self, idle_gap_ms=10000):
+        # (start, end) event ranges of fights separated by idle_gap_ms without damage
+        timestamps = self.columns()["timestamp"]
+        if len(timestamps) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(timestamps) > idle_gap_ms) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(timestamps)]))
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def events(self, pull=None, idle_gap_ms=10000):
+        # columns of one pull (numbered from 1) or of the whole store
+        columns = self.columns()
+        if pull is None:
+            return columns
+        start, end = self.pulls(idle_gap_ms)[pull - 1]
+        return {column: values[start:end] for column, values in columns.items()}
+
+    def damage_by(self, column, pull=None, idle_gap_ms=10000):
+        # {name: {"count", "total", "max", "dps"}} for skill, target or multiplier
+        events = self.events(pull, idle_gap_ms)
+        ids = events[column]
+        damage = events["damage"]
+        if len(ids) == 0:
+            return {}
+
+        size = len(self.names[column].names)
+        counts = np.bincount(ids, minlength=size)
+        totals = np.bincount(ids, weights=damage, minlength=size)
+        maxima = np.zeros(size, dtype=np.int64)
+        np.maximum.at(maxima, ids, damage)
+        seconds = self._duration_sec(events["timestamp"])
+
+        result = {}
+        for name_id in np.flatnonzero(counts):
+            result[self.names[column].names[name_id]] = {
+                "count": int(counts[name_id]),
+                "total": int(totals[name_id]),
+                "max": int(maxima[name_id]),
+                "dps": float(totals[name_id]) / seconds if seconds > 0 else 0.0,
+            }
+        return result
+
+    def damage_by_time(self, bucket_ms=1000, pull=None, idle_gap_ms=10000):
+        # bucket start timestamps and damage totals of every bucket_ms
+        events = self.events(pull, idle_gap_ms)
+        timestamps = events["timestamp"]
+        if len(timestamps) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        start = int(timestamps[0])
+        buckets = (timestamps - start) // bucket_ms
+        totals = np.bincount(buckets, weights=events["damage"]).astype(np.int64)
+        return start + np.arange(len(totals), dtype=np.int64) * bucket_ms, totals
+
+    def _duration_sec(self, timestamps):
+        if len(timestamps) < 2:
+            return 0
+        return (int(timestamps[-1]) - int(timestamps[0])) / 1000.0
+
+    def _count(self):
+        # a column file cut short by an abrupt exit limits the readable events
+        sizes = []
+        for column, dtype in event_columns.items():
+            path = self._column_path(column)
+            sizes.append(path.stat().st_size // dtype.itemsize if path.exists() else 0)
+        return min(sizes)
+
+    def _column_path(self, column):
+        return self.directory / f"{column}.bin"
@@ -1,3 +1,4 @@
+import os
 import queue
 import threading
 import time
@@ -7,149 +8,463 @@ from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 
-from combat_log_ocr import CombatLogOCR
+from autotune import AdaptiveCaptureRate, tuning_options_from_config
+from change_detector import create_change_detector
+from combat_log_ocr import CombatLogOCR, RecognizedResult
 from combat_log_processor import CombatLogParser
 from damage_calculator import DamageCalculator
+from damage_store import DamageEventStore
+from frame_archive import RecordingCapturer, ReplayCapturer, ReplayBenchmark
+from instrumentation import Metrics, SamplingProfiler, StatsExporter
+from metrics_server import MetricsServer
+from name_index import name_options_from_config
+from ocr_process_pool import ProcessOCRPool
 from screen_capturer import ScreenCapturer, Capture
-from utils import images_not_similar
-from plotter import Plotter
-
-extract_color_ranges = [
-    # White text (normal text)
-    ([182, 144, 100], [255, 200, 140]),
-    # Orange text (values and names)
-    ([170, 105, 32], [255, 160, 51]),
-    # Red text (damage text)
-    ([100, 26, 10], [195, 31, 31]),
-    # Blue text (skills)
-    ([14, 85, 134], [16, 152, 248]),
-    # Green text (regeneration)
-    ([59, 93, 0], [129, 202, 1]),
-    # Warn text
-    ([135, 37, 37], [253, 87, 87]),
-]
+from text_extractor import extract_color_ranges
+from utils import StartupProfile
+
+
+def ocr_options_from_config(config):
+    ocr_engine = config.get('ocr', 'engine', fallback='paddle')
+    ocr_lang = config.get('ocr', 'lang', fallback='chinese_cht')
+    ocr_version = config.get('ocr', 'ocr_version', fallback='')
+    det_model_dir = config.get('ocr', 'det_model_dir', fallback='')
+    rec_model_dir = config.get('ocr', 'rec_model_dir', fallback='')
+    cls_model_dir = config.get('ocr', 'cls_model_dir', fallback='')
+    use_gpu_value = config.get('ocr', 'use_gpu', fallback='auto').lower()
+    if use_gpu_value in ('1', 'true', 'yes'):
+        use_gpu = True
+    elif use_gpu_value in ('0', 'false', 'no'):
+        use_gpu = False
+    else:
+        use_gpu = None
+    ocr_incremental = config.get('ocr', 'incremental', fallback='0') == "1"
+    ocr_incremental_refresh = int(config.get('ocr', 'incremental_refresh', fallback='30'))
+    ocr_mode = config.get('ocr', 'mode', fallback='full')
+    ocr_rec_batch_num = int(config.get('ocr', 'rec_batch_num', fallback='16'))
+    ocr_line_cache_size = int(config.get('ocr', 'line_cache_size', fallback='4096'))
+    ocr_resize_factor = int(config.get('ocr', 'resize_factor', fallback='2'))
+    ocr_glyph_atlas = config.get('ocr', 'glyph_atlas', fallback='./models/glyph_atlas.npz')
+    onnx_det_model = config.get('ocr', 'onnx_det_model', fallback='')
+    onnx_rec_model = config.get('ocr', 'onnx_rec_model', fallback='./models/PP-OCRv5_rec.onnx')
+    onnx_rec_dict = config.get('ocr', 'onnx_rec_dict', fallback='./models/ppocrv5_dict.txt')
+    onnx_quantize = config.get('ocr', 'onnx_quantize', fallback='0') == "1"
+    # every ocr worker runs its own inference, so by default the cores are split between them
+    ocr_workers = 1 if ocr_incremental else int(config.get('ocr', 'thread_count', fallback='1'))
+    worker_threads = max(1, (os.cpu_count() or 1) // max(ocr_workers, 1))
+    onnx_threads = int(config.get('ocr', 'onnx_threads', fallback='0'))
+    if onnx_threads <= 0:
+        onnx_threads = worker_threads
+    paddle_threads = int(config.get('ocr', 'paddle_threads', fallback='0'))
+    if paddle_threads <= 0:
+        paddle_threads = worker_threads
+
+    return dict(ocr_engine=ocr_engine,
+                ocr_lang=ocr_lang,
+                ocr_version=ocr_version or None,
+                det_model_dir=det_model_dir or None,
+                rec_model_dir=rec_model_dir or None,
+                cls_model_dir=cls_model_dir or None,
+                use_gpu=use_gpu,
+                extract_color_ranges=extract_color_ranges,
+                resize_factor=ocr_resize_factor,
+                resize_interpolation=cv2.INTER_NEAREST_EXACT,
+                incremental=ocr_incremental,
+                incremental_refresh=ocr_incremental_refresh,
+                mode=ocr_mode,
+                rec_batch_num=ocr_rec_batch_num,
+                line_cache_size=ocr_line_cache_size,
+                glyph_atlas=ocr_glyph_atlas,
+                onnx_det_model=onnx_det_model or None,
+                onnx_rec_model=onnx_rec_model,
+                onnx_rec_dict=onnx_rec_dict,
+                onnx_quantize=onnx_quantize,
+                onnx_threads=onnx_threads,
+                paddle_threads=paddle_threads)
+
 
 class DPSMeter:
-    def __init__(self, config):
-        ocr_engine = config.get('ocr', 'engine', fallback='paddle')
-        ocr_lang = config.get('ocr', 'lang', fallback='chinese_cht')
-        ocr_version = config.get('ocr', 'ocr_version', fallback='')
-        det_model_dir = config.get('ocr', 'det_model_dir', fallback='')
-        rec_model_dir = config.get('ocr', 'rec_model_dir', fallback='')
-        cls_model_dir = config.get('ocr', 'cls_model_dir', fallback='')
-        use_gpu_value = config.get('ocr', 'use_gpu', fallback='auto').lower()
-        if use_gpu_value in ('1', 'true', 'yes'):
-            use_gpu = True
-        elif use_gpu_value in ('0', 'false', 'no'):
-            use_gpu = False
-        else:
-            use_gpu = None
+    def __init__(self, config, startup_profile=None):
+        self.startup_profile = startup_profile if startup_profile is not None else StartupProfile(enabled=False)
+        ocr_options = ocr_options_from_config(config)
         ocr_thread_count = int(config.get('ocr', 'thread_count'))
+        ocr_executor = config.get('ocr', 'executor', fallback='thread')
+        ocr_ring_slots = int(config.get('ocr', 'ring_slots', fallback='16'))
+        ocr_max_in_flight = int(config.get('ocr', 'max_in_flight', fallback='16'))
+        ocr_reorder_timeout_ms = int(config.get('ocr', 'reorder_timeout_ms', fallback='2000'))
+        if ocr_options['incremental']:
+            # scroll tracking needs frames in capture order
+            ocr_thread_count = 1
+        if ocr_executor not in ('thread', 'process'):
+            raise ValueError(f"Unsupported OCR executor: {ocr_executor}")
 
         capture_fps = int(config.get('capture', 'fps'))
         capture_region_x = int(config.get('capture', 'region_x'))
         capture_region_y = int(config.get('capture', 'region_y'))
         capture_region_width = int(config.get('capture', 'region_width'))
         capture_region_height = int(config.get('capture', 'region_height'))
+        # frames held by ocr, the reorder buffer and the capture loop, more are allocated on demand
+        frame_pool_size = int(config.get('capture', 'frame_pool_size', fallback=str(ocr_max_in_flight + 8)))
+        record_path = config.get('capture', 'record_path', fallback='')
+        replay_path = config.get('capture', 'replay_path', fallback='')
+        change_detector = config.get('capture', 'change_detector', fallback='rowhash')
 
         save_combat_log = config.get('debug', 'save_combat_log') == "1"
         ignored_log = config.get('debug', 'ignored_log') == "1"
         damage_log = config.get('debug', 'damage_log') == "1"
+        dps_log = config.get('debug', 'dps_log', fallback='1') == "1"
+        stats_path = config.get('debug', 'stats_path', fallback='')
+        stats_interval_ms = int(config.get('debug', 'stats_interval_ms', fallback='5000'))
+        profile = config.get('debug', 'profile', fallback='0') == "1"
+        profile_path = config.get('debug', 'profile_path', fallback='./logs/profile.txt')
         ocr_view = config.get('debug', 'ocr_view') == "1"
+        event_store_dir = config.get('debug', 'event_store_dir', fallback='')
+        ui_mode = config.get('ui', 'mode', fallback='plot')
+        ui_history_points = int(config.get('ui', 'history_points', fallback='3600'))
+        ui_refresh_ms = int(config.get('ui', 'refresh_ms', fallback='1000'))
+        metrics = config.get('ui', 'metrics', fallback='0') == "1"
+        metrics_port = int(config.get('ui', 'metrics_port', fallback='8765'))
+        metrics_host = config.get('ui', 'metrics_host', fallback='127.0.0.1')
+        metrics_interval_ms = int(config.get('ui', 'metrics_interval_ms', fallback='500'))
+        if ui_mode not in ('plot', 'headless'):
+            raise ValueError(f"Unsupported ui mode: {ui_mode}")
+        log_max_mb = float(config.get('debug', 'log_max_mb', fallback='50'))
+        log_backups = int(config.get('debug', 'log_backups', fallback='5'))
+        log_compress = config.get('debug', 'log_compress', fallback='0') == "1"
+        tuning_options = tuning_options_from_config(config)
 
         self.running = threading.Event()
         self.running.set()
+        # set once the ocr executor returned every submitted frame
+        self.ocr_done = threading.Event()
         self.capture_fps_delay = 1.000 / float(capture_fps)
         self.ocr_view = ocr_view
+        self.replaying = replay_path != ''
+        # replayed frames are not paced, so there is no rate to adapt
+        self.capture_rate = None
+        if tuning_options['adaptive_fps'] and not self.replaying:
+            self.capture_rate = AdaptiveCaptureRate(float(capture_fps),
+                                                    min_fps=tuning_options['min_fps'],
+                                                    target_latency_ms=tuning_options['target_latency_ms'])
+        self.benchmark = None
+        self.change_detector = create_change_detector(change_detector)
         self.snapshot_queue = queue.Queue()
-        self.ocr_executor = ThreadPoolExecutor(max_workers=ocr_thread_count)
+        # frames submitted to ocr and not yet taken by the analyze thread
+        self.max_in_flight = ocr_max_in_flight
+        self.in_flight = threading.Semaphore(ocr_max_in_flight)
+        self.reorder_timeout = ocr_reorder_timeout_ms / 1000.0
+        self.metrics = Metrics()
+        self.stats_exporter = StatsExporter(self.metrics, stats_path, stats_interval_ms / 1000.0) if stats_path else None
+        self.profiler = SamplingProfiler() if profile else None
+        self.profile_path = profile_path
         self.capture_thread = threading.Thread(target=self._capture_loop)
         self.analyze_thread = threading.Thread(target=self._analyze_loop)
 
-        self.screen_capturer = ScreenCapturer(x=capture_region_x,
-                                              y=capture_region_y,
-                                              width=capture_region_width,
-                                              height=capture_region_height)
-
-        self.ocr = CombatLogOCR(ocr_engine=ocr_engine,
-                                ocr_lang=ocr_lang,
-                                ocr_version=ocr_version or None,
-                                det_model_dir=det_model_dir or None,
-                                rec_model_dir=rec_model_dir or None,
-                                cls_model_dir=cls_model_dir or None,
-                                use_gpu=use_gpu,
-                                extract_color_ranges=extract_color_ranges,
-                                resize_factor=2,
-                                resize_interpolation=cv2.INTER_NEAREST_EXACT)
+        if self.replaying:
+            self.screen_capturer = ReplayCapturer(replay_path)
+            warm_up_shape = self.screen_capturer.reader.shape
+        else:
+            warm_up_shape = (capture_region_height, capture_region_width, 3)
+            self.screen_capturer = ScreenCapturer(x=capture_region_x,
+                                                  y=capture_region_y,
+                                                  width=capture_region_width,
+                                                  height=capture_region_height,
+                                                  pool_size=frame_pool_size)
+            if record_path:
+                self.screen_capturer = RecordingCapturer(self.screen_capturer, record_path)
+
+        if ocr_executor == 'process':
+            # every worker process builds its own ocr engine
+            self.ocr = None
+            self.ocr_executor = ProcessOCRPool(ocr_options,
+                                               worker_count=ocr_thread_count,
+                                               slot_count=max(ocr_ring_slots, ocr_thread_count, ocr_max_in_flight),
+                                               on_result=self.snapshot_queue.put,
+                                               return_images=ocr_view,
+                                               warm_up_shape=warm_up_shape)
+        else:
+            # the engine is loaded and warmed up in the background while capture starts
+            self.ocr = CombatLogOCR(**ocr_options, load=False)
+            self.ocr_executor = ThreadPoolExecutor(max_workers=ocr_thread_count)
+        self.warm_up_shape = warm_up_shape
 
         self.parser = CombatLogParser()
         self.parser.set_debug(damage_log, ignored_log)
-        self.parser.set_write_log(save_combat_log)
-
-        self.dps_meter = DamageCalculator()
-
-        self.plotter = Plotter(self.dps_meter, max_points=100)
+        self.parser.set_name_canonicalization(**name_options_from_config(config))
+        self.parser.set_write_log(save_combat_log,
+                                  max_bytes=int(log_max_mb * 1024 * 1024),
+                                  backup_count=log_backups,
+                                  compress=log_compress)
+
+        self.dps_meter = DamageCalculator(log=dps_log)
+        self.event_store = DamageEventStore(event_store_dir) if event_store_dir else None
+
+        self.metrics_server = None
+        if metrics or ui_mode == 'headless':
+            self.metrics_server = MetricsServer(self.dps_meter.snapshot,
+                                                stats=self.metrics.snapshot,
+                                                host=metrics_host,
+                                                port=metrics_port,
+                                                interval=metrics_interval_ms / 1000.0)
+
+        self.plotter = None
+        if ui_mode == 'plot':
+            # headless runs never import matplotlib
+            from plotter import Plotter
+            self.plotter = Plotter(self.dps_meter, max_points=ui_history_points, refresh_ms=ui_refresh_ms)
+        self.startup_profile.mark("meter created")
 
 
     def run(self):
+        if self.ocr is not None:
+            threading.Thread(target=self._load_ocr, daemon=True).start()
+        self._start_instrumentation()
         self.analyze_thread.start()
         self.capture_thread.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+            print(f"Metrics stream: {self.metrics_server.address}/stream")
 
-        self.plotter.run_blocking()
+        if self.plotter is not None:
+            self.plotter.run_blocking()
+        else:
+            self._wait_headless()
 
         self.running.clear()
 
         self.capture_thread.join()
         self.ocr_executor.shutdown(wait=True)
+        self.ocr_done.set()
+        self.analyze_thread.join()
+        self._close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+
+    def _wait_headless(self):
+        # runs until ctrl+c, or until a replay is over
+        try:
+            while self.capture_thread.is_alive():
+                self.capture_thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            pass
+
+
+    def _load_ocr(self):
+        try:
+            self.ocr.load(warm_up_shape=self.warm_up_shape)
+            self.startup_profile.mark("ocr loaded and warmed up")
+        except Exception as e:
+            print(f"OCR Error: {e}")
+
+
+    def run_benchmark(self):
+        # replays the whole archive without ui and returns throughput/latency stats
+        if self.ocr is not None:
+            # model loading is not part of the measurement
+            self._load_ocr()
+        # per-frame console output would be measured with the pipeline
+        self.parser.set_debug(False, False)
+        self.dps_meter.log = False
+        self.benchmark = ReplayBenchmark()
+        self.benchmark.start()
+        self._start_instrumentation()
+
+        self.analyze_thread.start()
+        self.capture_thread.start()
+
+        self.capture_thread.join()
+        self.ocr_executor.shutdown(wait=True)
+        self.ocr_done.set()
+        self.running.clear()
         self.analyze_thread.join()
+        self._close()
+
+        report = self.benchmark.report()
+        report["pipeline"] = self.metrics.snapshot()
+        return report
+
+
+    def _start_instrumentation(self):
+        if self.stats_exporter is not None:
+            self.stats_exporter.start()
+        if self.profiler is not None:
+            self.profiler.start()
+
+
+    def _close(self):
+        self.screen_capturer.close()
+        self.parser.close()
+        if self.event_store is not None:
+            self.event_store.close()
+        if self.stats_exporter is not None:
+            self.stats_exporter.stop()
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.write_collapsed(self.profile_path)
+            print(f"Profile: {self.profile_path}")
+            for function, share in self.profiler.top_functions(10):
+                print(f"  {share:6.1%}  {function}")
 
 
     def _capture_loop(self):
         sequential_id = 0
+        pending_capture = None
         prev_capture = self.screen_capturer.capture()
-        while self.running.is_set():
-            capture = self.screen_capturer.capture()
+        self.startup_profile.mark("first frame captured")
+        metrics = self.metrics
+        while self.running.is_set() and prev_capture is not None:
+            with metrics.timer("capture"):
+                capture = self.screen_capturer.capture()
+            if capture is None:
+                break
+            metrics.increment("frames_captured")
+            if capture.pool is not None and capture.slot is None:
+                metrics.increment("frame_pool_exhausted")
 
             # do not process the same images
-            if images_not_similar(prev_capture.image, capture.image):
-                self.ocr_executor.submit(self._handle_screenshot, capture, sequential_id)
+            with metrics.timer("change_detection"):
+                changed = self.change_detector.detect(prev_capture.image, capture.image).changed
+            if changed:
+                if pending_capture is not None:
+                    # ocr is behind, the log panel still shows the older lines in the newest frame
+                    metrics.increment("frames_dropped")
+                    pending_capture.release()
+                pending_capture = capture.retain()
+            else:
+                metrics.increment("frames_unchanged")
+
+            # replay waits for ocr instead of dropping frames to stay deterministic
+            if pending_capture is not None and self.in_flight.acquire(blocking=self.replaying):
+                # the reference of the pending capture goes with it, the analyze thread releases it
+                self._submit_capture(pending_capture, sequential_id)
                 sequential_id += 1
+                pending_capture = None
 
+            prev_capture.release()
             prev_capture = capture
-            time.sleep(self.capture_fps_delay)
+            # replayed frames are fed as fast as possible
+            if not self.replaying:
+                if self.capture_rate is not None:
+                    self.capture_fps_delay = self.capture_rate.delay
+                    metrics.set_gauge("capture_fps", round(self.capture_rate.fps, 2))
+                time.sleep(self.capture_fps_delay)
+
+        if pending_capture is not None:
+            if self.replaying:
+                self.in_flight.acquire()
+                self._submit_capture(pending_capture, sequential_id)
+            else:
+                pending_capture.release()
+        if prev_capture is not None:
+            prev_capture.release()
+
+
+    def _submit_capture(self, capture, seq_id):
+        self.metrics.increment("frames_submitted")
+        if self.ocr is None:
+            self.ocr_executor.submit(capture, seq_id)
+        else:
+            self.ocr_executor.submit(self._handle_screenshot, capture, seq_id)
 
 
     def _handle_screenshot(self, capture: Capture, seq_id):
-        snapshot = self.ocr.handle(capture.image, capture.timestamp, seq_id)
+        try:
+            snapshot = self.ocr.handle(capture.image, capture.timestamp, seq_id)
+        except Exception as e:
+            # the analyze thread waits for every seq_id, so failures still report back
+            print(f"OCR Error: {e}")
+            snapshot = RecognizedResult(capture.image, None, "", capture.timestamp, seq_id)
+            snapshot.error = str(e)
+        snapshot.captured_at = capture.captured_at
+        snapshot.capture = capture
         self.snapshot_queue.put(snapshot)
 
 
     def _analyze_loop(self):
         next_seq = 0
         buffer = {}
-        while self.running.is_set() or not self.snapshot_queue.empty():
+        gap_since = None
+        while not self.ocr_done.is_set() or not self.snapshot_queue.empty() or buffer:
             try:
-                snapshot = self.snapshot_queue.get(block=True, timeout=10)
+                snapshot = self.snapshot_queue.get(block=True, timeout=0.1)
             except queue.Empty:
-                continue
-
-            # coz of multithreaded ocr processing we need to order results
-            buffer[snapshot.seq_id] = snapshot
+                snapshot = None
+
+            if snapshot is not None:
+                self.in_flight.release()
+                self.metrics.increment("frames_recognized")
+                for stage, seconds in snapshot.timings.items():
+                    self.metrics.observe(stage, seconds)
+                for name, value in snapshot.counters.items():
+                    self.metrics.increment(name, value)
+                if snapshot.error is None and "ocr" not in snapshot.timings:
+                    # no text in the frame, ocr was skipped
+                    self.metrics.increment("frames_without_text")
+                if snapshot.seq_id < next_seq:
+                    # its gap was already skipped
+                    self.metrics.increment("late_frames")
+                    snapshot.release()
+                else:
+                    # coz of multithreaded ocr processing we need to order results
+                    buffer[snapshot.seq_id] = snapshot
+
+            if buffer and next_seq not in buffer:
+                if gap_since is None:
+                    gap_since = time.monotonic()
+                if (time.monotonic() - gap_since > self.reorder_timeout
+                        or len(buffer) >= self.max_in_flight
+                        or self.ocr_done.is_set()):
+                    skip_to = min(buffer)
+                    self.metrics.increment("seq_gaps", skip_to - next_seq)
+                    next_seq = skip_to
 
             while next_seq in buffer:
+                gap_since = None
                 next_snapshot = buffer.pop(next_seq)
                 next_seq += 1
 
+                if next_snapshot.error is not None:
+                    self.metrics.increment("ocr_errors")
+                    next_snapshot.release()
+                    continue
+
                 if self.ocr_view:
                     vis_frame = self._create_debug_frame(next_snapshot.image, next_snapshot.processed_image, next_snapshot.text)
                     cv2.imshow('OCR Visualize', vis_frame)
                     cv2.waitKey(1)
 
-                damage_list = self.parser.parse_combat_log(next_snapshot.text, next_snapshot.timestamp, next_snapshot.seq_id)
-                self.dps_meter.process_damage(damage_list, next_snapshot.timestamp)
-
-            if self.snapshot_queue.qsize() > 100:
-                print("Queue size:", self.snapshot_queue.qsize())
+                with self.metrics.timer("parse"):
+                    damage_list = self.parser.parse_combat_log(next_snapshot.text, next_snapshot.timestamp, next_snapshot.seq_id)
+                with self.metrics.timer("calculate"):
+                    self.dps_meter.process_damage(damage_list, next_snapshot.timestamp)
+                if next_snapshot.captured_at is not None:
+                    end_to_end = time.perf_counter() - next_snapshot.captured_at
+                    self.metrics.observe("end_to_end", end_to_end)
+                    if self.capture_rate is not None:
+                        self.capture_rate.observe(end_to_end)
+                self.metrics.increment("damage_hits", len(damage_list))
+                self.startup_profile.mark("first frame recognized")
+                if damage_list:
+                    self.startup_profile.mark("first damage")
+                if self.event_store is not None:
+                    self.event_store.append(damage_list)
+
+                if self.benchmark is not None:
+                    self.benchmark.add(next_snapshot, damage_list)
+                next_snapshot.release()
+
+            self.metrics.set_gauge("snapshot_queue", self.snapshot_queue.qsize())
+            self.metrics.set_gauge("reorder_buffer", len(buffer))
+            self.metrics.set_gauge("in_flight", self.metrics.counters["frames_submitted"] - self.metrics.counters["frames_recognized"])
+            cache_lookups = self.metrics.counters["line_cache_hits"] + self.metrics.counters["line_cache_misses"]
+            if cache_lookups:
+                self.metrics.set_gauge("line_cache_hit_ratio", round(self.metrics.counters["line_cache_hits"] / cache_lookups, 4))
+                self.metrics.set_gauge("line_cache_evictions", self.metrics.counters["line_cache_evictions"])
+            self.metrics.set_gauge("unaligned_frames", self.parser.unaligned_frames)
+            self.metrics.set_gauge("unaligned_lines_dropped", self.parser.unaligned_lines_dropped)
+            if self.parser.log_writer is not None:
+                self.metrics.set_gauge("log_lines_dropped", self.parser.log_writer.dropped_lines)
         if self.ocr_view:
             cv2.destroyAllWindows()
 
@@ -0,0 +1,155 @@
+import struct
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+from screen_capturer import Capture
+
+
+ARCHIVE_MAGIC = b"A2FA"
+ARCHIVE_VERSION = 1
+# magic, version, height, width, channels
+ARCHIVE_HEADER = struct.Struct("<4sIIII")
+
+
+def _timestamps_path(path):
+    return Path(str(path) + ".ts")
+
+
+class FrameArchiveWriter:
+    # frames are stored raw with a fixed shape next to a `.ts` file of timestamps,
+    # so the archive can be memory-mapped back and survives an abrupt exit
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.shape = None
+        self.count = 0
+        self.frames_file = None
+        self.timestamps_file = None
+
+    def write(self, capture: Capture):
+        image = np.ascontiguousarray(capture.image, dtype=np.uint8)
+        if image.ndim == 2:
+            image = image[:, :, np.newaxis]
+
+        if self.shape is None:
+            self._open(image.shape)
+        elif image.shape != self.shape:
+            raise ValueError(f"Frame shape {image.shape} does not match archive shape {self.shape}")
+
+        self.frames_file.write(image.tobytes())
+        self.timestamps_file.write(struct.pack("<q", int(capture.timestamp)))
+        self.count += 1
+
+    def close(self):
+        if self.frames_file is not None:
+            self.frames_file.close()
+            self.timestamps_file.close()
+            self.frames_file = None
+            self.timestamps_file = None
+
+    def _open(self, shape):
+        self.shape = shape
+        self.frames_file = open(self.path, "wb")
+        self.frames_file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, *shape))
+        self.timestamps_file = open(_timestamps_path(self.path), "wb")
+
+
+class FrameArchiveReader:
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            magic, version, height, width, channels = ARCHIVE_HEADER.unpack(f.read(ARCHIVE_HEADER.size))
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            raise ValueError(f"Not a frame archive: {self.path}")
+
+        self.shape = (height, width, channels)
+        frame_size = height * width * channels
+        data_size = self.path.stat().st_size - ARCHIVE_HEADER.size
+        timestamps_path = _timestamps_path(self.path)
+        # a recording cut short may have one partially written frame at the end
+        count = min(data_size // frame_size, timestamps_path.stat().st_size // 8)
+
+        self.frames = np.memmap(self.path, dtype=np.uint8, mode="r", offset=ARCHIVE_HEADER.size,
+                                shape=(count,) + self.shape) if count > 0 else np.empty((0,) + self.shape, np.uint8)
+        self.timestamps = np.fromfile(timestamps_path, dtype="<i8", count=count)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        return Capture(self.frames[index], int(self.timestamps[index]))
+
+
+class RecordingCapturer:
+    def __init__(self, capturer, path):
+        self.capturer = capturer
+        self.writer = FrameArchiveWriter(path)
+
+    def capture(self):
+        capture = self.capturer.capture()
+        if capture is not None:
+            self.writer.write(capture)
+        return capture
+
+    def close(self):
+        self.writer.close()
+
+
+class ReplayCapturer:
+    # returns None once the archive is exhausted
+    def __init__(self, path, loop=False):
+        self.reader = FrameArchiveReader(path)
+        self.loop = loop
+        self.position = 0
+
+    def capture(self):
+        if self.position >= len(self.reader):
+            if not self.loop or len(self.reader) == 0:
+                return None
+            self.position = 0
+
+        capture = self.reader[self.position]
+        self.position += 1
+        return capture
+
+    def close(self):
+        pass
+
+
+class ReplayBenchmark:
+    def __init__(self):
+        self.started_at = None
+        self.finished_at = None
+        self.frames = 0
+        self.latencies = []
+        self.damage_total = 0
+        self.damage_count = 0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+
+    def add(self, snapshot, damage_list):
+        now = time.perf_counter()
+        self.frames += 1
+        self.latencies.append(now - snapshot.captured_at)
+        self.damage_count += len(damage_list)
+        self.damage_total += sum(d.damage for d in damage_list)
+        self.finished_at = now
+
+    def report(self):
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        latencies_ms = np.array(self.latencies) * 1000.0 if self.latencies else np.zeros(1)
+        return {
+            "frames": self.frames,
+            "elapsed_sec": round(elapsed, 3),
+            "fps": round(self.frames / elapsed, 2) if elapsed > 0 else 0,
+            "latency_ms_mean": round(float(latencies_ms.mean()), 2),
+            "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 2),
+            "latency_ms_p95": round(float(np.percentile(latencies_ms, 95)), 2),
+            "latency_ms_max": round(float(latencies_ms.max()), 2),
+            "damage_count": self.damage_count,
+            "damage_total": self.damage_total,
+        }
@@ -0,0 +1,437 @@
+import argparse
+import configparser
+import os
+
+import cv2
+import numpy as np
+
+from text_layout import text_mask
+
+
+# glyphs are compared as cells of this size, scaled by the same factor in both directions
+cell_height = 16
+cell_width = 24
+# a glyph may be cut into several pieces (quotes, CJK radicals, thin arches)
+max_pieces_per_glyph = 4
+
+
+class InkLine:
+    # A line crop cut into pieces at blank columns and, inside runs of ink, at thin
+    # columns where glyphs may touch. A glyph is one or more neighbouring pieces.
+    # Glyph cells are placed by the baseline, the bottom of the bulk of the ink,
+    # so the position of a glyph above or below it is part of the cell whether or
+    # not the line has tall letters or descenders.
+    def __init__(self, crop, thin=2):
+        self.mask = text_mask(crop) > 0
+        row_ink = self.mask.sum(axis=1)
+        rows = np.flatnonzero(row_ink)
+        self.top = int(rows[0]) if len(rows) else 0
+        self.bottom = int(rows[-1]) + 1 if len(rows) else 0
+        # the ink drops most below the baseline, descenders, commas and the rounded
+        # bottoms of letters ink only a few columns of the rows under it
+        self.baseline = int(np.argmin(np.diff(row_ink, append=0))) + 1 if len(rows) else 0
+        self.pieces = self._pieces(self.mask.sum(axis=0), thin)
+        self.lefts = np.array([left for left, _ in self.pieces], dtype=np.int64)
+        self.rights = np.array([right for _, right in self.pieces], dtype=np.int64)
+
+    @staticmethod
+    def _pieces(projection, thin):
+        # (left, right) column ranges, thin is the most ink of a column that may be cut
+        ink = np.concatenate(([0], (projection > 0).view(np.int8), [0]))
+        edges = np.flatnonzero(np.diff(ink))
+        narrow = np.concatenate(([0], ((projection > 0) & (projection <= thin)).view(np.int8), [0]))
+        narrow_edges = np.flatnonzero(np.diff(narrow))
+        cuts = []
+        for left, right in zip(narrow_edges[0::2].tolist(), narrow_edges[1::2].tolist()):
+            # thin columns at the edge of a run are serifs and arms, not joints
+            if left > 0 and right < len(projection) and projection[left - 1] > 0 and projection[right] > 0:
+                cuts.append((left + right) // 2)
+
+        pieces = []
+        position = 0
+        for left, right in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+            while position < len(cuts) and cuts[position] < right:
+                pieces.append((left, cuts[position]))
+                left = cuts[position]
+                position += 1
+            pieces.append((left, right))
+        return pieces
+
+    def gap(self, i):
+        # blank columns between piece i and piece i + 1, 0 inside a run of ink
+        return self.pieces[i + 1][0] - self.pieces[i][1]
+
+    def cells(self, spans, ascent, line_height):
+        # (spans, cell_width * cell_height) cells of the (first, last) piece spans, column
+        # by column. The line is scaled to the cell height once; every glyph is then
+        # averaged over columns from the running column sums, which is what an area
+        # resize of each glyph on its own would give.
+        width = self.mask.shape[1]
+        window = np.zeros((line_height, width), dtype=np.float32)
+        top = self.baseline - ascent
+        ink = self.mask[max(top, 0):top + line_height]
+        window[max(-top, 0):max(-top, 0) + len(ink)] = ink
+        rows = cv2.resize(window, (width, cell_height), interpolation=cv2.INTER_AREA)
+        sums = np.zeros((width + 1, cell_height), dtype=np.float32)
+        np.cumsum(rows.T, axis=0, out=sums[1:])
+
+        spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        left = self.lefts[spans[:, 0]]
+        right = self.rights[spans[:, 1]]
+        glyph_widths = np.clip(np.round((right - left) * cell_height / line_height).astype(np.int64), 1, cell_width)
+        scale = (right - left) / glyph_widths
+        # cell column c starts at glyph column c - offset, glyphs are centered
+        offsets = (cell_width - glyph_widths) // 2
+        columns = np.clip(np.arange(cell_width + 1)[None, :] - offsets[:, None], 0, glyph_widths[:, None])
+        positions = left[:, None] + columns * scale[:, None]
+        index = np.minimum(positions.astype(np.int64), width - 1)
+        fraction = (positions - index).astype(np.float32)[:, :, None]
+        low = sums[index]
+        at = low + fraction * (sums[index + 1] - low)
+        cells = np.diff(at, axis=1) / scale.astype(np.float32)[:, None, None]
+        return cells.reshape(len(spans), -1)
+
+
+def cell_distances(cells, templates, template_norms):
+    # (cells, templates) matrix, 0 for identical ink and 1 for no overlap at all
+    dots = cells @ templates.T
+    totals = np.einsum("ij,ij->i", cells, cells)[:, None] + template_norms[None, :]
+    return 1.0 - 2.0 * dots / np.maximum(totals, 1e-6)
+
+
+class GlyphAtlas:
+    # Template cells of the log font and the character of each. A character can have
+    # several cells, anti-aliasing and sub-pixel positions render it differently.
+    def __init__(self, cells, labels, ascent, line_height, space_width, resize_factor):
+        self.cells = np.asarray(cells, dtype=np.float32).reshape(len(labels), -1)
+        self.labels = list(labels)
+        # rows above the baseline and rows of a cell before scaling
+        self.ascent = int(ascent)
+        self.line_height = int(line_height)
+        self.space_width = float(space_width)
+        self.resize_factor = int(resize_factor)
+        self.norms = np.einsum("ij,ij->i", self.cells, self.cells)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["cells"], data["labels"].tolist(), data["ascent"], data["line_height"], data["space_width"], data["resize_factor"])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, cells=self.cells.astype(np.float16), labels=np.array(self.labels),
+                            ascent=self.ascent, line_height=self.line_height, space_width=self.space_width, resize_factor=self.resize_factor)
+
+    def distances(self, cells):
+        return cell_distances(cells, self.cells, self.norms)
+
+
+def candidate_spans(line, line_height, space_width, first_piece=0, end_piece=None):
+    # (spans, 2) array of the first and last piece of possible glyphs ordered by first
+    # piece, pieces split by a space never merge
+    end_piece = len(line.pieces) if end_piece is None else end_piece
+    firsts = np.arange(first_piece, end_piece)
+    spans = [np.stack((firsts, firsts), axis=1)]
+    merging = np.ones(len(firsts), dtype=bool)
+    for extra in range(1, max_pieces_per_glyph):
+        lasts = np.minimum(firsts + extra, max(end_piece - 1, 0))
+        merging &= (firsts + extra < end_piece) & (line.lefts[lasts] - line.rights[lasts - 1] < space_width)
+        merging &= (line.rights[lasts] - line.lefts[firsts]) * cell_height <= cell_width * line_height
+        spans.append(np.stack((firsts[merging], lasts[merging]), axis=1))
+    spans = np.concatenate(spans)
+    return spans[np.lexsort((spans[:, 1], spans[:, 0]))]
+
+
+class GlyphEngine:
+    # Reads line crops by matching glyphs against the atlas of the log font. Every
+    # piece of ink is a candidate glyph and so are neighbouring pieces merged; the
+    # cheapest split of the line into matched glyphs is the text. The cells of all
+    # crops are matched in one matrix product.
+    detects_lines = False
+
+    def __init__(self, atlas_path, resize_factor=2):
+        self.atlas_path = atlas_path
+        self.resize_factor = resize_factor
+        self.atlas = None
+
+    def load(self):
+        atlas = GlyphAtlas.load(self.atlas_path)
+        if atlas.resize_factor != self.resize_factor:
+            raise ValueError(f"Glyph atlas was built with resize factor {atlas.resize_factor}, not {self.resize_factor}")
+        self.atlas = atlas
+
+    def recognize(self, crops):
+        atlas = self.atlas
+        # one native pixel of ink is thin enough to be a joint of touching glyphs
+        lines = [InkLine(crop, thin=self.resize_factor) for crop in crops]
+        spans = [candidate_spans(line, atlas.line_height, atlas.space_width) for line in lines]
+        cells = [line.cells(line_spans, atlas.ascent, atlas.line_height) for line, line_spans in zip(lines, spans) if len(line_spans)]
+        if not cells:
+            return [""] * len(crops)
+
+        distances = atlas.distances(np.concatenate(cells))
+        best = distances.argmin(axis=1)
+        costs = distances[np.arange(len(best)), best]
+
+        texts = []
+        position = 0
+        for line, line_spans in zip(lines, spans):
+            count = len(line_spans)
+            texts.append(self._decode(line, line_spans, best[position:position + count], costs[position:position + count]))
+            position += count
+        return texts
+
+    def _decode(self, line, spans, best, costs):
+        # Dynamic programming over piece ends. Costs are weighted by glyph width, so
+        # a line costs the same per column whichever way it is split and merging a
+        # small glyph like a comma into its neighbour is not cheaper by itself.
+        weighted = (costs * (line.rights[spans[:, 1]] - line.lefts[spans[:, 0]])).tolist()
+        spans = spans.tolist()
+        total = [0.0] + [np.inf] * len(line.pieces)
+        choice = [None] * (len(line.pieces) + 1)
+        for i, (first, last) in enumerate(spans):
+            cost = total[first] + weighted[i]
+            if cost < total[last + 1]:
+                total[last + 1] = cost
+                choice[last + 1] = i
+
+        glyphs = []
+        end = len(line.pieces)
+        while end > 0:
+            first, last = spans[choice[end]]
+            glyphs.append((first, self.atlas.labels[best[choice[end]]]))
+            end = first
+        text = []
+        for first, label in reversed(glyphs):
+            if text and line.gap(first - 1) >= self.atlas.space_width:
+                text.append(" ")
+            text.append(label)
+        return "".join(text)
+
+
+class GlyphAtlasBuilder:
+    # Builds the atlas from line crops with known text. The widest gaps of a line
+    # are its spaces, which splits it into words. Words with one run of ink per
+    # character give the first templates, the rest are aligned to their text with
+    # those templates. Templates are picked by how many samples of the same
+    # character agree with them, so a few wrong labels do not make it into the atlas.
+    def __init__(self, resize_factor=2, templates_per_glyph=4, max_samples_per_glyph=500,
+                 agree_distance=0.1, min_template_distance=0.03, max_align_cost=0.25, align_rounds=3):
+        self.resize_factor = resize_factor
+        self.templates_per_glyph = templates_per_glyph
+        self.max_samples_per_glyph = max_samples_per_glyph
+        self.agree_distance = agree_distance
+        self.min_template_distance = min_template_distance
+        self.max_align_cost = max_align_cost
+        self.align_rounds = align_rounds
+        self.lines = []
+        self.stats = {}
+
+    def add(self, crop, text):
+        text = " ".join(text.split())
+        line = InkLine(crop, thin=self.resize_factor)
+        if text and line.pieces:
+            self.lines.append((line, text))
+
+    def build(self):
+        if not self.lines:
+            raise ValueError("No labeled lines to build a glyph atlas from")
+        ascent = max(int(np.percentile([line.baseline - line.top for line, _ in self.lines], 95)), 1)
+        line_height = ascent + int(np.percentile([line.bottom - line.baseline for line, _ in self.lines], 95))
+
+        samples = {}
+        inner_gaps = []
+        space_gaps = []
+        unaligned = []
+        words = 0
+        for line, text in self.lines:
+            line_words = self._split_words(line, text)
+            if line_words is None:
+                continue
+            for (first, end), word in line_words:
+                words += 1
+                runs = self._runs(line, first, end)
+                if len(runs) != len(word):
+                    unaligned.append((line, first, end, word))
+                    continue
+                for cell, character in zip(line.cells(runs, ascent, line_height), word):
+                    self._add_sample(samples, character, cell)
+                inner_gaps += [line.gap(last) for (_, last), _ in zip(runs, runs[1:])]
+            space_gaps += [line.gap(end - 1) for (_, end), _ in line_words[:-1]]
+        if not samples:
+            raise ValueError("No word of the labeled lines could be cut into its characters")
+
+        if inner_gaps and space_gaps:
+            space_width = (np.percentile(inner_gaps, 99) + np.percentile(space_gaps, 1)) / 2
+        else:
+            space_width = line_height * 0.3
+        space_width = max(space_width, 1.0)
+        atlas = self._atlas(samples, ascent, line_height, space_width)
+
+        # A word is aligned once at most one of its characters is still unknown, so
+        # its neighbours pin down where it is cut. Every round can make characters
+        # known for the next one.
+        skipped = unaligned
+        for _ in range(self.align_rounds):
+            remaining = []
+            known = set(atlas.labels)
+            for line, first, end, word in skipped:
+                glyphs = None
+                if len(set(word) - known) <= 1:
+                    glyphs = self._align(atlas, line, first, end, word)
+                if glyphs is None:
+                    remaining.append((line, first, end, word))
+                    continue
+                for cell, (_, character, cost) in zip(line.cells([span for span, _, _ in glyphs], ascent, line_height), glyphs):
+                    # a cut through touching glyphs in the wrong place looks like no known template
+                    if cost < self.max_align_cost:
+                        self._add_sample(samples, character, cell)
+            atlas = self._atlas(samples, ascent, line_height, space_width)
+            if len(remaining) == len(skipped):
+                break
+            skipped = remaining
+
+        self.stats = {
+            "lines": len(self.lines),
+            "words": words,
+            "one_run_per_character": words - len(unaligned),
+            "aligned": len(unaligned) - len(skipped),
+            "skipped": len(skipped),
+            "glyphs": len(samples),
+            "templates": len(atlas.labels),
+            "ascent": ascent,
+            "line_height": line_height,
+            "space_width": round(float(space_width), 2),
+        }
+        return atlas
+
+    def _split_words(self, line, text):
+        # [((first piece, end piece), word)], None if the line has fewer gaps than spaces
+        words = text.split(" ")
+        gaps = np.array([line.gap(i) for i in range(len(line.pieces) - 1)], dtype=np.int64)
+        if np.count_nonzero(gaps) < len(words) - 1:
+            return None
+        spaces = np.sort(np.argsort(-gaps, kind="stable")[:len(words) - 1]).tolist()
+        bounds = [0] + [space + 1 for space in spaces] + [len(line.pieces)]
+        return [((first, end), word) for first, end, word in zip(bounds, bounds[1:], words)]
+
+    def _runs(self, line, first, end):
+        # (first, last) pieces of every run of ink between first and end
+        runs = []
+        start = first
+        for i in range(first, end):
+            if i + 1 == end or line.gap(i) > 0:
+                runs.append((start, i))
+                start = i + 1
+        return runs
+
+    def _add_sample(self, samples, character, cell):
+        character_samples = samples.setdefault(character, [])
+        if len(character_samples) < self.max_samples_per_glyph:
+            character_samples.append(cell)
+
+    def _atlas(self, samples, ascent, line_height, space_width):
+        cells = []
+        labels = []
+        for character, character_samples in samples.items():
+            for cell in self._pick_templates(np.stack(character_samples)):
+                cells.append(cell)
+                labels.append(character)
+        return GlyphAtlas(np.stack(cells), labels, ascent, line_height, space_width, self.resize_factor)
+
+    def _pick_templates(self, cells):
+        # most agreed on samples first, further ones only if they differ from those picked
+        distances = cell_distances(cells, cells, np.einsum("ij,ij->i", cells, cells))
+        support = (distances < self.agree_distance).sum(axis=1) - 1
+        picked = []
+        for i in np.argsort(-support, kind="stable"):
+            if len(picked) == self.templates_per_glyph:
+                break
+            if picked and (support[i] < 2 or distances[i, picked].min() < self.min_template_distance):
+                continue
+            picked.append(i)
+        return cells[picked]
+
+    def _align(self, atlas, line, first, end, word):
+        # [((first, last), character, cost)] pieces of every character of the word, None if it does not fit
+        spans = candidate_spans(line, atlas.line_height, np.inf, first, end)
+        distances = atlas.distances(line.cells(spans, atlas.ascent, atlas.line_height))
+        templates = {}
+        for i, label in enumerate(atlas.labels):
+            templates.setdefault(label, []).append(i)
+        costs = np.array([distances[:, templates[character]].min(axis=1) if character in templates
+                          # characters without a template yet cost a little less than a poor match
+                          else np.full(len(spans), self.max_align_cost * 0.9)
+                          for character in word])
+
+        total = np.full((end - first + 1, len(word) + 1), np.inf)
+        total[0, 0] = 0.0
+        choice = {}
+        for i, (first_piece, last_piece) in enumerate(spans.tolist()):
+            start, stop = first_piece - first, last_piece - first + 1
+            for j in range(len(word)):
+                cost = total[start, j] + costs[j, i]
+                if cost < total[stop, j + 1]:
+                    total[stop, j + 1] = cost
+                    choice[stop, j + 1] = (first_piece, last_piece, costs[j, i])
+
+        if total[end - first, len(word)] > self.max_align_cost * len(word):
+            return None
+        glyphs = []
+        stop, j = end - first, len(word)
+        while j > 0:
+            first_piece, last_piece, cost = choice[stop, j]
+            glyphs.append(((first_piece, last_piece), word[j - 1], cost))
+            stop, j = first_piece - first, j - 1
+        return glyphs
+
+
+def main():
+    from combat_log_ocr import CombatLogOCR
+    from dps_meter import ocr_options_from_config
+    from frame_archive import FrameArchiveReader
+    from recognition_cache import RecognitionCache
+    from text_layout import crop_band
+
+    args_parser = argparse.ArgumentParser(description='Build the glyph atlas of the glyph OCR engine from a frame archive labeled by PaddleOCR')
+    args_parser.add_argument('archive', help='frame archive recorded with [capture] record_path')
+    args_parser.add_argument('--config', default=os.path.join(os.getcwd(), 'config.ini'))
+    args_parser.add_argument('--out', default='', help='atlas path, [ocr] glyph_atlas if omitted')
+    args_parser.add_argument('--frames', type=int, default=1000)
+    args_parser.add_argument('--templates-per-glyph', type=int, default=4)
+    args = args_parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    options = ocr_options_from_config(config)
+    options.update(ocr_engine="paddle", mode="rec_only", incremental=False, line_cache_size=0)
+    ocr = CombatLogOCR(**options)
+
+    builder = GlyphAtlasBuilder(ocr.resize_factor, args.templates_per_glyph)
+    reader = FrameArchiveReader(args.archive)
+    # scrolled lines show up again in later frames, every distinct line is labeled once
+    seen = set()
+    keys = RecognitionCache()
+    for index in range(min(args.frames, len(reader))):
+        processed, bounds = ocr._preprocess_image(reader.frames[index])
+        if bounds is None:
+            continue
+        crops = []
+        for band in ocr._segment_lines(processed, bounds):
+            crop = crop_band(processed, band, padding=2 * ocr.resize_factor)
+            key = keys.key(crop)
+            if key is not None and key not in seen:
+                seen.add(key)
+                crops.append(crop)
+        for crop, text in zip(crops, ocr.engine.recognize(crops)):
+            builder.add(crop, text)
+
+    atlas = builder.build()
+    out = args.out or options["glyph_atlas"]
+    atlas.save(out)
+    print(f"{builder.stats}")
+    print(f"saved {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import bisect
+import json
+import sys
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# bucket upper bounds in ms, about 10% apart from 0.05 ms to 60 s
+latency_bounds_ms = [0.05 * 1.1 ** i for i in range(148)]
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(latency_bounds_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(latency_bounds_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        # upper bound of the bucket holding the q-th percentile
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return min(latency_bounds_ms[i], self.max_ms) if i < len(latency_bounds_ms) else self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class Metrics:
+    # Latency histograms per stage, counters and gauges of the pipeline. Stages are
+    # observed from several threads, so every update takes the lock.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = Counter()
+        self.gauges = {}
+        self.started_at = time.time()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.observe(seconds * 1000.0)
+
+    @contextmanager
+    def timer(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_sec": round(time.time() - self.started_at, 1),
+                "latency": {name: histogram.summary() for name, histogram in self.histograms.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def export_json(self, path):
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        # written aside and renamed, so readers never see half a file
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        temp_path.write_text(json.dumps(self.snapshot(), indent=2), encoding="utf-8")
+        temp_path.replace(path)
+
+
+class StatsExporter:
+    # writes the metrics to a json file every interval and once more on stop
+    def __init__(self, metrics, path, interval=5.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._export_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self._export()
+
+    def _export_loop(self):
+        while not self.stopped.wait(self.interval):
+            self._export()
+
+    def _export(self):
+        try:
+            self.metrics.export_json(self.path)
+        except Exception as e:
+            print(f"Error saving stats: {e}")
+
+
+class SamplingProfiler:
+    # Samples the stacks of all threads every interval from a background thread and
+    # counts them. The output uses the collapsed stack format of flame graph tools:
+    # "thread;outer function;...;inner function count".
+    def __init__(self, interval=0.005, max_depth=32):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write_collapsed(self, path):
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit=20):
+        # (function, share of thread samples) by samples with the function on top of the stack
+        functions = Counter()
+        for stack, count in self.stacks.items():
+            functions[stack.rsplit(";", 1)[-1]] += count
+        total = max(sum(functions.values()), 1)
+        return [(function, count / total) for function, count in functions.most_common(limit)]
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                functions = []
+                while frame is not None and len(functions) < self.max_depth:
+                    code = frame.f_code
+                    functions.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                functions.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(functions))] += 1
+            self.samples += 1
@@ -0,0 +1,154 @@
+import re
+
+from collections import Counter
+
+from utils import bounded_edit_distance
+
+
+# characters OCR tends to mix up map to one representative
+ocr_confusions = str.maketrans({
+    "l": "1", "i": "1", "|": "1", "!": "1",
+    "o": "0",
+    "s": "5",
+    "z": "2",
+    "b": "8",
+})
+not_alphanumeric = re.compile(r"[\W_]+")
+
+
+def normalize_line(line):
+    return not_alphanumeric.sub("", line.casefold()).translate(ocr_confusions)
+
+
+class LogAligner:
+    # Consecutive frames show the same log scrolled up, so the end of the previous
+    # frame's lines reappears at the start of the current one. The aligner finds the
+    # longest such overlap: lines are normalized, exact matches of normalized lines
+    # found through a hash lookup propose candidate offsets, and each candidate is
+    # verified line by line. Lines that differ are compared by character counts first
+    # (a lower bound of the edit distance) and only then by bounded edit distance.
+    # Of the offsets that verify, the one with the most exactly equal lines wins, so
+    # lines differing in a digit ("damage of 31", "damage of 37") are not taken for a
+    # misread of each other, and the longest overlap wins ties, so repeated lines are
+    # not counted twice. Approximate matches of the first lines propose more offsets
+    # if none verifies.
+    #
+    # Noisy OCR can leave no offset that verifies. The candidate with the most
+    # matching lines is taken then, if at least min_partial_ratio of its lines match.
+    # Without any, two frames of at least full_panel_lines lines cannot be a whole
+    # panel apart, so the current one is taken as misread and none of its lines as new.
+    def __init__(self, tolerance=0.15, probe_lines=3, max_mismatch_ratio=0.2, min_partial_ratio=0.3, full_panel_lines=8):
+        self.tolerance = tolerance
+        self.probe_lines = probe_lines
+        self.max_mismatch_ratio = max_mismatch_ratio
+        self.min_partial_ratio = min_partial_ratio
+        self.full_panel_lines = full_panel_lines
+        # the current frame is the previous one on the next call
+        self.cache_lines = None
+        self.cache_prepared = None
+
+    def overlap(self, prev, cur):
+        # number of leading lines of cur that were already in prev, None if the frames do not align
+        if len(prev) == 0 or len(cur) == 0:
+            return 0
+
+        prev_lines = self.cache_prepared if prev is self.cache_lines else self._prepare(prev)
+        cur_lines = self._prepare(cur)
+        self.cache_lines = cur
+        self.cache_prepared = cur_lines
+
+        tried = set()
+        for candidates in (self._exact_candidates, self._approximate_candidates):
+            best_length = None
+            best_exact = -1
+            # longest overlap first, it wins ties
+            for offset in sorted(candidates(prev_lines, cur_lines) - tried):
+                tried.add(offset)
+                length = min(len(prev_lines) - offset, len(cur_lines))
+                if length <= best_exact:
+                    # shorter overlaps cannot have more exact lines
+                    break
+                exact = self._verify(prev_lines, cur_lines, offset, length)
+                if exact is not None and exact > best_exact:
+                    best_length = length
+                    best_exact = exact
+            if best_length is not None:
+                return best_length
+        return self._best_partial(prev_lines, cur_lines, tried)
+
+    def new_lines(self, prev, cur):
+        overlap = self.overlap(prev, cur)
+        if overlap is None:
+            overlap = len(cur) if self.full_panels(prev, cur) else 0
+        return cur[overlap:]
+
+    def full_panels(self, prev, cur):
+        return len(prev) >= self.full_panel_lines and len(cur) >= self.full_panel_lines
+
+    def _best_partial(self, prev_lines, cur_lines, offsets):
+        best_length = None
+        best_matches = 0
+        # longest overlap first, it wins ties
+        for offset in sorted(offsets):
+            length = min(len(prev_lines) - offset, len(cur_lines))
+            matches = sum(self._lines_match(prev_lines[offset + k], cur_lines[k]) for k in range(length))
+            if matches > best_matches and matches >= max(2, length * self.min_partial_ratio):
+                best_length = length
+                best_matches = matches
+        return best_length
+
+    def _prepare(self, lines):
+        prepared = []
+        for line in lines:
+            norm = normalize_line(line)
+            prepared.append((norm, Counter(norm)))
+        return prepared
+
+    def _exact_candidates(self, prev_lines, cur_lines):
+        positions = {}
+        for i, (norm, _) in enumerate(prev_lines):
+            positions.setdefault(norm, []).append(i)
+
+        offsets = set()
+        for j, (norm, _) in enumerate(cur_lines):
+            for i in positions.get(norm, []):
+                if i >= j:
+                    offsets.add(i - j)
+        return offsets
+
+    def _approximate_candidates(self, prev_lines, cur_lines):
+        # the true offset may have no line that survived OCR unchanged
+        offsets = set()
+        for j in range(min(self.probe_lines, len(cur_lines))):
+            for i in range(j, len(prev_lines)):
+                if self._lines_match(prev_lines[i], cur_lines[j]):
+                    offsets.add(i - j)
+        return offsets
+
+    def _verify(self, prev_lines, cur_lines, offset, length):
+        # number of exactly equal lines, None if too many lines do not match
+        allowed = int(length * self.max_mismatch_ratio)
+        mismatches = 0
+        exact = 0
+        for k in range(length):
+            if prev_lines[offset + k][0] == cur_lines[k][0]:
+                exact += 1
+            elif not self._lines_match(prev_lines[offset + k], cur_lines[k]):
+                mismatches += 1
+                if mismatches > allowed:
+                    return None
+        return exact
+
+    def _lines_match(self, lhs, rhs):
+        lhs_norm, lhs_counts = lhs
+        rhs_norm, rhs_counts = rhs
+        if lhs_norm == rhs_norm:
+            return True
+
+        limit = max(1, int(max(len(lhs_norm), len(rhs_norm)) * self.tolerance))
+        if abs(len(lhs_norm) - len(rhs_norm)) > limit:
+            return False
+        # every edit changes the count of at most one character on each side
+        if max(sum((lhs_counts - rhs_counts).values()), sum((rhs_counts - lhs_counts).values())) > limit:
+            return False
+        return bounded_edit_distance(lhs_norm, rhs_norm, limit) <= limit
@@ -0,0 +1,118 @@
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+
+from pathlib import Path
+
+from utils import format_timestamp
+
+
+class LogWriter:
+    # Lines are handed over to a writer thread through a bounded queue, so the
+    # analyze thread never waits for the disk: when the queue is full the lines are
+    # dropped and counted. The writer formats and writes lines in batches, flushing
+    # after batch_size lines or flush_interval seconds, and rotates the file once it
+    # grows over max_bytes.
+    def __init__(self, path, max_queue=10000, batch_size=256, flush_interval=1.0,
+                 max_bytes=50 * 1024 * 1024, backup_count=5, compress=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped_lines = 0
+        self.file = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def write(self, logs, timestamp):
+        try:
+            self.queue.put_nowait((timestamp, logs))
+        except queue.Full:
+            if self.dropped_lines == 0:
+                print("Error saving combat log: the writer falls behind, lines are dropped (see log_lines_dropped in the stats)")
+            self.dropped_lines += len(logs)
+
+    def close(self, timeout=5.0):
+        # everything queued before close() is written, unless the writer thread died
+        # or does not get through it within timeout; shutting down never waits longer
+        if self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+        self.thread.join(timeout)
+        if self.thread.is_alive() or not self.queue.empty():
+            print(f"Error saving combat log: writer stopped with {self.queue.qsize()} batches not written")
+
+    def _write_loop(self):
+        batch = []
+        line_count = 0
+        flush_at = time.monotonic() + self.flush_interval
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=max(flush_at - time.monotonic(), 0.001))
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                running = False
+            elif item:
+                batch.append(item)
+                line_count += len(item[1])
+
+            if batch and (line_count >= self.batch_size or time.monotonic() >= flush_at or not running):
+                self._write_batch(batch)
+                batch = []
+                line_count = 0
+            if time.monotonic() >= flush_at:
+                flush_at = time.monotonic() + self.flush_interval
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write_batch(self, batch):
+        chunks = []
+        for timestamp, logs in batch:
+            formatted_time = format_timestamp(timestamp)
+            for log in logs:
+                chunks.append(f"[{formatted_time}] {log}\n")
+        data = "".join(chunks).encode("utf-8")
+
+        try:
+            if self.file is not None and self.max_bytes > 0 and self.file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            if self.file is None:
+                self.file = open(self.path, "ab")
+            self.file.write(data)
+            self.file.flush()
+        except Exception as e:
+            print(f"Error saving combat log: {e}")
+
+    def _rotate(self):
+        # combat_log.log -> combat_log.log.1[.gz] -> ... -> combat_log.log.<backup_count>[.gz]
+        self.file.close()
+        self.file = None
+        suffix = ".gz" if self.compress else ""
+        for i in range(self.backup_count - 1, 0, -1):
+            source = Path(f"{self.path}.{i}{suffix}")
+            if source.exists():
+                os.replace(source, f"{self.path}.{i + 1}{suffix}")
+
+        if self.backup_count <= 0:
+            self.path.unlink()
+        elif self.compress:
+            with open(self.path, "rb") as source, gzip.open(f"{self.path}.1.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            self.path.unlink()
+        else:
+            os.replace(self.path, f"{self.path}.1")
@@ -1,15 +1,42 @@
+import argparse
 import configparser
 import os
-from dps_meter import DPSMeter
+import time
+
+from utils import StartupProfile
+
 
 def main():
+    started_at = time.perf_counter()
+    args_parser = argparse.ArgumentParser(description='Aion 2 DPS meter')
+    args_parser.add_argument('--startup-profile', action='store_true', help='print the time spent in every startup phase')
+    args_parser.add_argument('--autotune', action='store_true', help='measure OCR settings and write the tuned profile, replacing an existing one')
+    args = args_parser.parse_args()
+    startup_profile = StartupProfile(enabled=args.startup_profile, started_at=started_at)
+
     config = configparser.ConfigParser()
     ini_path = os.path.join(os.getcwd(),'config.ini')
     config.read(ini_path)
+    startup_profile.mark("config read")
 
-    dps_meter = DPSMeter(config)
+    from autotune import apply_tuned_profile, autotune, tuning_options_from_config
+    # --autotune calibrates again from config.ini and overwrites an existing profile
+    profile_path = None if args.autotune else apply_tuned_profile(config)
+    if profile_path is not None:
+        print(f"Using tuned profile {profile_path}")
+    elif args.autotune or tuning_options_from_config(config)['autotune']:
+        autotune(config)
+        startup_profile.mark("autotuned")
+
+    from dps_meter import DPSMeter
+    startup_profile.mark("modules imported")
+
+    dps_meter = DPSMeter(config, startup_profile)
     dps_meter.run()
 
+    if args.startup_profile:
+        print(startup_profile.report())
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
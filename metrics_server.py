@@ -0,0 +1,154 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def snapshot_delta(prev, cur):
+    # keys of cur whose values changed since prev, nested dicts are compared key by key
+    delta = {}
+    for key, value in cur.items():
+        prev_value = prev.get(key)
+        if isinstance(value, dict) and isinstance(prev_value, dict):
+            nested = snapshot_delta(prev_value, value)
+            if nested:
+                delta[key] = nested
+        elif value != prev_value or key not in prev:
+            delta[key] = value
+    return delta
+
+
+class MetricsPublisher:
+    # Takes a snapshot every interval and keeps the latest one together with its
+    # delta to the previous snapshot. Clients that saw the previous version get the
+    # delta, others (new or too slow) get the full snapshot.
+    def __init__(self, snapshot, interval=0.5):
+        self.snapshot = snapshot
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.version = 0
+        self.current = {}
+        self.delta = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._publish_loop, daemon=True)
+
+    def start(self):
+        self._publish()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+        self.thread.join()
+
+    def wait(self, client_version, timeout):
+        # (version, event name, data) of the next update after client_version, None on stop
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != client_version or self.stopped.is_set(), timeout)
+            if self.stopped.is_set():
+                return None
+            if self.version == client_version:
+                return client_version, None, None
+            if self.version == client_version + 1:
+                return self.version, "delta", self.delta
+            return self.version, "snapshot", self.current
+
+    def _publish_loop(self):
+        while not self.stopped.wait(self.interval):
+            self._publish()
+
+    def _publish(self):
+        snapshot = self.snapshot()
+        delta = snapshot_delta(self.current, snapshot)
+        if not delta and self.version != 0:
+            return
+        with self.condition:
+            self.current = snapshot
+            self.delta = delta
+            self.version += 1
+            self.condition.notify_all()
+
+
+class MetricsServer:
+    # Local HTTP server for overlays and dashboards:
+    #   GET /snapshot  the current numbers as JSON
+    #   GET /stream    server-sent events, a "snapshot" event followed by "delta" events
+    #   GET /stats     pipeline metrics, if a stats callable is given
+    def __init__(self, snapshot, stats=None, host="127.0.0.1", port=8765, interval=0.5):
+        self.stats = stats
+        self.host = host
+        self.port = port
+        self.publisher = MetricsPublisher(snapshot, interval)
+        self.server = None
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.publisher.start()
+        self.thread.start()
+
+    def close(self):
+        if self.server is None:
+            return
+        self.publisher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
+
+    def _handler_class(self):
+        publisher = self.publisher
+        stats = self.stats
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/snapshot":
+                    self._send_json(publisher.current)
+                elif self.path == "/stats" and stats is not None:
+                    self._send_json(stats())
+                elif self.path == "/stream":
+                    self._stream()
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                version = -1
+                try:
+                    while True:
+                        update = publisher.wait(version, timeout=15)
+                        if update is None:
+                            break
+                        version, event, data = update
+                        if event is None:
+                            # keeps idle connections open through proxies
+                            self.wfile.write(b": keep-alive\n\n")
+                        else:
+                            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
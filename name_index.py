@@ -0,0 +1,241 @@
+import os
+import re
+
+from collections import OrderedDict
+
+from log_aligner import normalize_line
+from utils import edit_distance
+
+
+# letter pairs OCR reads for one letter, merged before the character confusions
+ocr_pair_confusions = (("rn", "m"), ("vv", "w"), ("cl", "d"))
+# rank of a skill ("Flame Bolt II"), as OCR may read the roman numerals
+rank_suffix = re.compile(r"\s([IVXivxl1|]+|\d+)\s*$")
+
+
+def normalize_name(name):
+    name = name.casefold()
+    for pair, letter in ocr_pair_confusions:
+        name = name.replace(pair, letter)
+    return normalize_line(name)
+
+
+def name_rank(name):
+    # normalized rank suffix of a name, "" without one
+    match = rank_suffix.search(name)
+    return normalize_line(match.group(1)) if match else ""
+
+
+def read_known_names(path):
+    # one name per line, blank lines and lines starting with # are skipped
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def name_options_from_config(config):
+    # arguments of CombatLogParser.set_name_canonicalization
+    return dict(enabled=config.get('names', 'canonicalize', fallback='0') == "1",
+                known_skills=read_known_names(config.get('names', 'known_skills', fallback='./known_skills.txt')),
+                known_targets=read_known_names(config.get('names', 'known_targets', fallback='./known_targets.txt')),
+                tolerance=float(config.get('names', 'tolerance', fallback='0.1')),
+                min_length=int(config.get('names', 'min_length', fallback='8')),
+                learn_after=int(config.get('names', 'learn_after', fallback='3')),
+                max_names=int(config.get('names', 'max_names', fallback='1024')))
+
+
+class BKTree:
+    # Burkhard-Keller tree over normalized names with the edit distance as metric.
+    # Children hang by their distance to the node, so a search of radius r only
+    # descends into children at distance d - r to d + r (triangle inequality).
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key, value):
+        node = (key, value, {})
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = edit_distance(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def nearest(self, key, radius, accept=None):
+        # (distance, value) of the closest key within radius that accept(value) allows, None if there is none
+        if self.root is None:
+            return None
+        best = None
+        stack = [self.root]
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = edit_distance(key, node_key)
+            if distance <= radius and (best is None or distance < best[0]) and (accept is None or accept(value)):
+                best = (distance, value)
+                radius = distance
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return best
+
+
+class NameIndex:
+    # Interns OCR'd names to canonical ids, so misread variants of a skill or target
+    # ("Flame Bolt", "Flarne Bolt", "Flame Bo1t") count as one. Names are normalized
+    # first and equal normalized names share an id. With known names, a name within
+    # tolerance * length edits of a known one takes its id and other names are kept
+    # as read, so two real names are never merged. Without known names, names seen
+    # before take the place of the known ones, and every name matched to one of them
+    # is matched like it from then on, so misreads of a misread first seen still join
+    # it. Either way only names of at least min_length normalized characters are
+    # matched approximately, never to a name starting with another letter or with
+    # another rank ("Flame Bolt II" and "III").
+    #
+    # A name that matches none becomes a canonical name only once it was read
+    # learn_after times, and at least misread_share times as often as the closest
+    # name within twice the tolerance: two misreads of one name differ by up to twice
+    # as many edits, also when the first letter was misread or lost. Until then it
+    # is taken for a misread of that name. Misreads are rare compared with the name
+    # itself, so most of them never become names, while a real name gets its own
+    # once it was read a few times. Names one edit apart ("Dark Flash", "Dark Slash")
+    # can only be told apart by known names.
+    #
+    # Raw names map to ids through an LRU memo, so a repeated name costs one dict
+    # lookup. Approximate matches are forgotten when a name is added that could be
+    # closer. Canonical names are limited to max_names; past that, unmatched names
+    # share overflow_name and the tables built on the ids stay bounded.
+    overflow_name = "Other"
+    # a name read less often than this share of the similar name is taken for a misread of it
+    misread_share = 0.05
+
+    def __init__(self, known_names=(), tolerance=0.1, min_length=8, learn_after=3, cache_size=4096, max_names=1024):
+        self.tolerance = tolerance
+        self.min_length = min_length
+        self.learn_after = learn_after
+        self.cache_size = cache_size
+        self.max_names = max_names
+        self.names = []
+        # normalized name and times looked up of every canonical name
+        self.keys = []
+        self.reads = []
+        # normalized name -> id, of the canonical names and the names matched to them
+        self.ids = {}
+        # approximate matches need the same first letter and rank, (first two letters, rank) of every name
+        self.guards = []
+        self.tree = BKTree()
+        self.memo = OrderedDict()
+        # raw names in the memo that were matched approximately
+        self.approximate = set()
+        # normalized name -> times read, of the names not learned yet
+        self.pending = OrderedDict()
+        self.overflow_id = None
+        self.known_only = False
+
+        self.hits = 0
+        self.misses = 0
+        for name in known_names:
+            # known names never merge into each other
+            if normalize_name(name) not in self.ids:
+                self._add(name, normalize_name(name))
+        self.known_only = len(self.names) > 0
+
+    def canonical_id(self, name):
+        name_id = self.memo.get(name)
+        if name_id is not None:
+            self.memo.move_to_end(name)
+            self.hits += 1
+            self.reads[name_id] += 1
+            return name_id
+
+        self.misses += 1
+        name_id, approximate = self._lookup(name)
+        self.reads[name_id] += 1
+        if approximate is None:
+            # pending names are looked up again, they are counted until they are learned
+            return name_id
+        self.memo[name] = name_id
+        if approximate:
+            self.approximate.add(name)
+        if len(self.memo) > self.cache_size:
+            self.approximate.discard(self.memo.popitem(last=False)[0])
+        return name_id
+
+    def canonical(self, name):
+        return self.names[self.canonical_id(name)]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "names": len(self.names),
+            "memo": len(self.memo),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _lookup(self, name):
+        # (id, whether the name was matched approximately), None instead of True while the name is pending
+        key = normalize_name(name)
+        name_id = self.ids.get(key)
+        if name_id is not None:
+            return name_id, False
+
+        rank = name_rank(name)
+        radius = max(1, int(len(key) * self.tolerance))
+        if len(key) >= self.min_length:
+            nearest = self.tree.nearest(key, radius, self._accept(key, rank, False))
+            if nearest is not None:
+                # only names close to the canonical one are added, so a chain of misreads
+                # cannot drift off to another name, and the tables stay bounded
+                if (not self.known_only and len(self.ids) < self.max_names + self.cache_size
+                        and edit_distance(key, self.keys[nearest[1]]) <= radius):
+                    self.ids[key] = nearest[1]
+                    self.tree.add(key, nearest[1])
+                return nearest[1], True
+
+        if self.learn_after > 1:
+            nearest = self.tree.nearest(key, 2 * radius, self._accept(key, rank, True))
+            read = self.pending.pop(key, 0) + 1
+            if nearest is not None and (read < self.learn_after or read < self.reads[nearest[1]] * self.misread_share):
+                self.pending[key] = read
+                if len(self.pending) > self.cache_size:
+                    self.pending.popitem(last=False)
+                return nearest[1], None
+
+        if len(self.names) >= self.max_names:
+            if self.overflow_id is None:
+                self.overflow_id = self._add(self.overflow_name, None)
+            return self.overflow_id, False
+        return self._add(name, key), False
+
+    def _accept(self, key, rank, loose):
+        # whether a name may be matched to the candidate, loose also allows a misread or lost first letter
+        def accept(candidate):
+            start, candidate_rank = self.guards[candidate]
+            if candidate_rank != rank:
+                return False
+            return start[:1] == key[:1] or (loose and (key[:1] in "10" or key[:1] == start[1:2]))
+        return accept
+
+    def _add(self, name, key):
+        name_id = len(self.names)
+        self.names.append(name)
+        self.keys.append(key)
+        self.reads.append(0)
+        self.guards.append((key[:2], name_rank(name)) if key is not None else None)
+        if key is not None:
+            self.ids[key] = name_id
+            if not self.known_only:
+                self.tree.add(key, name_id)
+                # the new name may be closer to names matched before it existed
+                for raw in self.approximate:
+                    self.memo.pop(raw, None)
+                self.approximate.clear()
+        return name_id
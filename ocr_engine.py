@@ -0,0 +1,86 @@
+import math
+
+from glyph_ocr import GlyphEngine
+from onnx_ocr import OnnxEngine
+from text_layout import TextLine
+
+
+class PaddleEngine:
+    # PaddleOCR with text detection for full mode and the bare recognizer for line crops
+    detects_lines = True
+
+    def __init__(self, lang, version=None, det_model_dir=None, rec_model_dir=None, cls_model_dir=None,
+                 use_gpu=False, rec_batch_num=16, cpu_threads=1):
+        self.lang = lang
+        self.version = version
+        self.det_model_dir = det_model_dir
+        self.rec_model_dir = rec_model_dir
+        self.cls_model_dir = cls_model_dir
+        self.use_gpu = use_gpu
+        self.rec_batch_num = rec_batch_num
+        # inference threads on CPU, Paddle would start its default count in every worker
+        self.cpu_threads = cpu_threads
+        self.ocr = None
+
+    @staticmethod
+    def detect_gpu():
+        import paddle
+
+        return paddle.device.is_compiled_with_cuda() and paddle.device.cuda.device_count() > 0
+
+    def load(self):
+        from paddleocr import PaddleOCR
+
+        options = {
+            "lang": self.lang,
+            "use_angle_cls": True,
+            "show_log": False,
+            "use_gpu": self.use_gpu,
+            "rec_batch_num": self.rec_batch_num,
+            "cpu_threads": self.cpu_threads,
+        }
+        if self.version:
+            options["ocr_version"] = self.version
+        if self.det_model_dir:
+            options["det_model_dir"] = self.det_model_dir
+        if self.rec_model_dir:
+            options["rec_model_dir"] = self.rec_model_dir
+        if self.cls_model_dir:
+            options["cls_model_dir"] = self.cls_model_dir
+        self.ocr = PaddleOCR(**options)
+
+    def detect_and_recognize(self, image):
+        try:
+            result = self.ocr.ocr(image, cls=True)
+        except Exception as exc:
+            print(f"OCR Error: {exc}")
+            return []
+        lines = []
+        for block in result or []:
+            for line in block or []:
+                if len(line) > 1 and line[1]:
+                    ys = [point[1] for point in line[0]]
+                    lines.append(TextLine(int(min(ys)), int(math.ceil(max(ys))), line[1][0]))
+        return lines
+
+    def recognize(self, crops):
+        # recognition only: no text detection and no angle classifier, all crops in one call
+        if len(crops) == 0:
+            return []
+        try:
+            result, _ = self.ocr.text_recognizer(crops)
+        except Exception as exc:
+            print(f"OCR Error: {exc}")
+            return [""] * len(crops)
+        return [text for text, _ in result]
+
+
+# An engine has load(), which builds the slow parts, and recognize(crops), which
+# returns the text of every line crop of the color-extracted image. Engines with
+# detects_lines also find the lines themselves in full mode through
+# detect_and_recognize(image); the others always get the lines cut by CombatLogOCR.
+ocr_engines = {
+    "paddle": PaddleEngine,
+    "glyph": GlyphEngine,
+    "onnx": OnnxEngine,
+}
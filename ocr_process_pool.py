@@ -0,0 +1,209 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from combat_log_ocr import RecognizedResult
+
+
+def _ocr_worker(ocr_options, tasks, results, return_images, warm_up_shape, current, index):
+    from combat_log_ocr import CombatLogOCR
+
+    # a worker without an engine still answers every task, so no frame waits for it
+    ocr = None
+    load_error = None
+    try:
+        ocr = CombatLogOCR(**ocr_options)
+        if warm_up_shape is not None:
+            ocr.warm_up(warm_up_shape)
+    except Exception as e:
+        ocr = None
+        load_error = f"OCR engine failed to load: {e}"
+    current[index] = -1
+    shm = None
+    frames = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        shm_name, slot_count, shape, slot, timestamp, seq_id = task
+        if shm is None or shm.name != shm_name:
+            if shm is not None:
+                shm.close()
+            shm = shared_memory.SharedMemory(name=shm_name)
+            frames = np.ndarray((slot_count,) + shape, dtype=np.uint8, buffer=shm.buf)
+
+        # the pool fails the task in current[index] if this process dies
+        current[index] = seq_id
+        try:
+            if ocr is None:
+                raise RuntimeError(load_error)
+            snapshot = ocr.handle(frames[slot], timestamp, seq_id)
+            processed = snapshot.processed_image if return_images else None
+            results.put((slot, seq_id, snapshot.text, processed, snapshot.timings, snapshot.counters, None))
+        except Exception as e:
+            results.put((slot, seq_id, "", None, {}, {}, str(e)))
+        current[index] = -1
+
+    frames = None
+    if shm is not None:
+        shm.close()
+
+
+class ProcessOCRPool:
+    # Every worker process owns its own CombatLogOCR. Frames are copied into a ring
+    # of shared memory slots instead of being pickled, only the slot index goes
+    # through the task queue. A slot is reused once its result came back, so a full
+    # ring blocks submit() until a worker catches up.
+    #
+    # Every submitted frame comes back through on_result, also when a worker dies:
+    # the frame it was working on fails, and once no worker is left every pending
+    # and later frame fails, so the analyze thread never waits for a lost seq_id.
+    def __init__(self, ocr_options, worker_count, slot_count, on_result, return_images=False, warm_up_shape=None,
+                 check_interval=0.5):
+        self.slot_count = slot_count
+        self.on_result = on_result
+        self.check_interval = check_interval
+
+        context = multiprocessing.get_context("spawn")
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        # seq_id each worker is recognizing, -1 while it waits for a task, -2 while it loads its engine
+        self.current = context.RawArray('q', [-2] * worker_count)
+        self.workers = [context.Process(target=_ocr_worker,
+                                        args=(ocr_options, self.tasks, self.results, return_images, warm_up_shape,
+                                              self.current, index),
+                                        daemon=True)
+                        for index in range(worker_count)]
+        for worker in self.workers:
+            worker.start()
+
+        self.shm = None
+        self.frames = None
+        self.free_slots = queue.Queue()
+        for slot in range(slot_count):
+            self.free_slots.put(slot)
+        # seq_id -> (capture, slot) of the frames sent to the workers
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.dead_workers = set()
+        self.closing = False
+        # set once no worker is left
+        self.error = None
+
+        self.collector = threading.Thread(target=self._collect_loop, daemon=True)
+        self.collector.start()
+
+    def submit(self, capture, seq_id):
+        image = capture.image
+        if self.shm is None:
+            # frame size is known only once the first frame arrives
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slot_count * image.nbytes)
+            self.frames = np.ndarray((self.slot_count,) + image.shape, dtype=np.uint8, buffer=self.shm.buf)
+        elif image.shape != self.frames.shape[1:]:
+            raise ValueError(f"Frame shape {image.shape} does not match pool frame shape {self.frames.shape[1:]}")
+
+        slot = self.free_slots.get()
+        with self.lock:
+            error = self.error
+            if error is None:
+                self.pending[seq_id] = (capture, slot)
+        if error is not None:
+            self.free_slots.put(slot)
+            self._deliver(capture, seq_id, "", None, {}, error)
+            return
+        self.frames[slot] = image
+        self.tasks.put((self.shm.name, self.slot_count, image.shape, slot, capture.timestamp, seq_id))
+
+    def wait_ready(self, timeout=None):
+        # True once every living worker loaded its engine, the first frames then do not wait for it
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(self.current[index] == -2 and worker.is_alive() for index, worker in enumerate(self.workers)):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, wait=True):
+        self.closing = True
+        for _ in self.workers:
+            self.tasks.put(None)
+        if wait:
+            for worker in self.workers:
+                worker.join()
+        self.results.put(None)
+        self.collector.join()
+        # frames of workers that died while shutting down
+        for seq_id in list(self.pending):
+            self._fail(seq_id, "OCR worker exited before answering")
+
+        if self.shm is not None:
+            self.frames = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def _collect_loop(self):
+        checked_at = time.monotonic()
+        while True:
+            try:
+                result = self.results.get(timeout=self.check_interval)
+            except queue.Empty:
+                result = False
+            if time.monotonic() - checked_at >= self.check_interval:
+                self._check_workers()
+                checked_at = time.monotonic()
+            if result is None:
+                break
+            if result is False:
+                continue
+
+            slot, seq_id, text, processed, timings, counters, error = result
+            with self.lock:
+                pending = self.pending.pop(seq_id, None)
+            if pending is None:
+                # failed already when its worker was found dead
+                continue
+            self.free_slots.put(slot)
+            self._deliver(pending[0], seq_id, text, processed, timings, error, counters)
+
+    def _check_workers(self):
+        if self.closing:
+            return
+        for index, worker in enumerate(self.workers):
+            if index in self.dead_workers or worker.is_alive():
+                continue
+            self.dead_workers.add(index)
+            print(f"OCR Error: worker process {worker.pid} exited with code {worker.exitcode}")
+            if self.current[index] >= 0:
+                self._fail(self.current[index], f"OCR worker exited with code {worker.exitcode}")
+        if len(self.dead_workers) == len(self.workers) and self.error is None:
+            # nothing answers the queued tasks anymore
+            with self.lock:
+                self.error = "No OCR worker process left"
+                seq_ids = list(self.pending)
+            for seq_id in seq_ids:
+                self._fail(seq_id, self.error)
+
+    def _fail(self, seq_id, error):
+        with self.lock:
+            pending = self.pending.pop(seq_id, None)
+        if pending is not None:
+            self.free_slots.put(pending[1])
+            self._deliver(pending[0], seq_id, "", None, {}, error)
+
+    def _deliver(self, capture, seq_id, text, processed, timings, error, counters=None):
+        if error is not None:
+            print(f"OCR Error: {error}")
+        snapshot = RecognizedResult(capture.image, processed, text, capture.timestamp, seq_id)
+        snapshot.captured_at = capture.captured_at
+        snapshot.capture = capture
+        snapshot.error = error
+        snapshot.timings = timings
+        snapshot.counters = counters or {}
+        self.on_result(snapshot)
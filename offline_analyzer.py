@@ -0,0 +1,304 @@
+import argparse
+import configparser
+import gzip
+import json
+import multiprocessing
+import os
+import re
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+
+from change_detector import RowHashChangeDetector
+from combat_log_processor import CombatLogParser
+from damage_calculator import DamageCalculator, DamageStats
+from frame_archive import ARCHIVE_MAGIC, FrameArchiveReader
+from name_index import NameIndex, name_options_from_config
+
+
+image_suffixes = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+saved_log_line = re.compile(r"\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{3})\] (.*)")
+
+# per worker process state, set up by _init_worker
+_worker_ocr = None
+_worker_archive = None
+
+
+def _init_worker(ocr_options, archive_path):
+    global _worker_ocr, _worker_archive
+    from combat_log_ocr import CombatLogOCR
+
+    _worker_ocr = CombatLogOCR(**ocr_options)
+    _worker_archive = FrameArchiveReader(archive_path) if archive_path else None
+
+
+def _load_frame(frame):
+    # a frame is an image file path, an index into the archive or the image itself,
+    # None if the file cannot be read
+    if isinstance(frame, str):
+        image = cv2.imread(frame, cv2.IMREAD_COLOR)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if image is not None else None
+    if isinstance(frame, int):
+        return _worker_archive.frames[frame]
+    return frame
+
+
+def _recognize_chunk(chunk):
+    # [(seq_id, timestamp, text)], frames equal to the previous one of the chunk are left out
+    # and unreadable frames have None as text
+    detector = RowHashChangeDetector()
+    results = []
+    prev = None
+    for seq_id, timestamp, frame in chunk:
+        image = _load_frame(frame)
+        if image is None:
+            print(f"Offline Analysis Error: cannot read frame {frame}, skipped")
+            results.append((seq_id, timestamp, None))
+            continue
+        if prev is None or detector.detect(prev, image).changed:
+            results.append((seq_id, timestamp, _worker_ocr.handle(image, timestamp, seq_id).text))
+        prev = image
+    return results
+
+
+def is_frame_archive(path):
+    with open(path, "rb") as f:
+        return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+
+def frames_from_directory(path, fps):
+    # frame files in name order, timestamps from the frame rate
+    files = sorted(p for p in Path(path).iterdir() if p.suffix.lower() in image_suffixes)
+    for seq_id, file in enumerate(files):
+        yield seq_id, int(seq_id * 1000 / fps), str(file)
+
+
+def frames_from_archive(reader):
+    for seq_id in range(len(reader)):
+        yield seq_id, int(reader.timestamps[seq_id]), seq_id
+
+
+def frames_from_video(path):
+    video = cv2.VideoCapture(str(path))
+    if not video.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    seq_id = 0
+    try:
+        while True:
+            ok, frame = video.read()
+            if not ok:
+                break
+            yield seq_id, int(video.get(cv2.CAP_PROP_POS_MSEC)), cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            seq_id += 1
+    finally:
+        video.release()
+
+
+def chunked(frames, chunk_size):
+    chunk = []
+    for frame in frames:
+        chunk.append(frame)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def recognize_frames(frames, ocr_options, workers, chunk_size, archive_path=None):
+    # Chunks of consecutive frames are recognized in parallel and their results are
+    # yielded in frame order. Only a few chunks per worker are in flight, so a long
+    # video is never decoded into memory as a whole.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(ocr_options, archive_path)) as executor:
+        pending = deque()
+        for chunk in chunked(frames, chunk_size):
+            pending.append(executor.submit(_recognize_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def read_saved_log(path):
+    # (timestamp, lines) groups of a saved combat_log.log, plain or gzip rotated
+    opener = gzip.open if str(path).endswith(".gz") else open
+    timestamp = None
+    lines = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            m = saved_log_line.match(line.rstrip("\n"))
+            if m is None:
+                continue
+            line_timestamp = int(datetime.strptime(m.group(1), "%Y-%m-%d %H:%M:%S.%f").timestamp() * 1000)
+            if line_timestamp != timestamp and lines:
+                yield timestamp, lines
+                lines = []
+            timestamp = line_timestamp
+            lines.append(m.group(2))
+    if lines:
+        yield timestamp, lines
+
+
+class OfflineAnalysis:
+    def __init__(self, store_dir=""):
+        self.parser = CombatLogParser()
+        self.calculator = DamageCalculator(log=False)
+        self.by_targets = {}
+        self.frames = 0
+        self.skipped_frames = 0
+        self.event_store = None
+        if store_dir:
+            from damage_store import DamageEventStore
+            self.event_store = DamageEventStore(store_dir)
+
+    def add_text(self, text, timestamp, seq_id):
+        # recognized text of a frame, new lines are found by the parser
+        self.frames += 1
+        self._add_damage(self.parser.parse_combat_log(text, timestamp, seq_id), timestamp)
+
+    def add_lines(self, lines, timestamp):
+        # lines of a saved log are already new
+        self._add_damage(self.parser._filter_damage(lines, timestamp), timestamp)
+
+    def close(self):
+        self.parser.close()
+        if self.event_store is not None:
+            self.event_store.close()
+
+    def report(self):
+        calculator = self.calculator
+        total = calculator.total or 1
+        skills = {}
+        for skill_name, skill_damage_info in sorted(calculator.by_skills.items(), key=lambda item: -item[1].total_damage):
+            skills[skill_name] = self._stats_report(skill_damage_info.stats, total)
+        targets = {}
+        for target_name, stats in sorted(self.by_targets.items(), key=lambda item: -item[1].total):
+            targets[target_name] = self._stats_report(stats, total)
+        return {
+            "frames": self.frames,
+            "skipped_frames": self.skipped_frames,
+            "hits": calculator.count,
+            "total": calculator.total,
+            "duration_sec": round((calculator.last_timestamp_ms - (calculator.first_timestamp_ms or calculator.last_timestamp_ms)) / 1000, 3),
+            "dps": round(calculator.dps(), 2),
+            "skills": skills,
+            "targets": targets,
+        }
+
+    def _add_damage(self, damage_list, timestamp):
+        self.calculator.process_damage(damage_list, timestamp)
+        for damage_info in damage_list:
+            if damage_info.target_name not in self.by_targets:
+                self.by_targets[damage_info.target_name] = DamageStats()
+            self.by_targets[damage_info.target_name].add(damage_info.damage, damage_info.multiplier_type)
+        if self.event_store is not None:
+            self.event_store.append(damage_list)
+
+    def _stats_report(self, stats, total):
+        return {
+            "hits": stats.count,
+            "total": stats.total,
+            "share": round(stats.total / total, 4),
+            "max": stats.max,
+            "p50": round(stats.percentile(50)),
+            "crit_ratio": round(stats.crit_ratio, 4),
+        }
+
+
+def format_report(report):
+    lines = [f"frames: {report['frames']}, hits: {report['hits']}, total: {report['total']}, "
+             f"duration: {report['duration_sec']} s, dps: {report['dps']}"]
+    if report['skipped_frames']:
+        lines.append(f"skipped {report['skipped_frames']} unreadable frames")
+    for title, rows in (("skill", report["skills"]), ("target", report["targets"])):
+        lines.append("")
+        lines.append(f"{title:<32} {'hits':>7} {'total':>12} {'share':>7} {'max':>9} {'p50':>9} {'crit':>6}")
+        for name, row in rows.items():
+            lines.append(f"{name[:32]:<32} {row['hits']:>7} {row['total']:>12} {row['share']:>7.1%} "
+                         f"{row['max']:>9} {row['p50']:>9} {row['crit_ratio']:>6.1%}")
+    return "\n".join(lines)
+
+
+def write_known_names(config, report, min_hits):
+    # names read at least min_hits times as a first known names dictionary, to be corrected by hand
+    for option, title in (("known_skills", "skills"), ("known_targets", "targets")):
+        path = config.get('names', option, fallback=f'./{option}.txt')
+        if os.path.exists(path):
+            print(f"{path} exists, not overwritten")
+            continue
+        names = [name for name, row in report[title].items() if row["hits"] >= min_hits and name != NameIndex.overflow_name]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# {title} read at least {min_hits} times, correct misspelled names and remove misread ones\n")
+            f.writelines(f"{name}\n" for name in names)
+        print(f"wrote {len(names)} {title} to {path}")
+
+
+def main():
+    args_parser = argparse.ArgumentParser(description='Analyze recorded combat log frames or a saved combat log offline')
+    args_parser.add_argument('input', help='directory of frames, video file, frame archive or saved combat_log.log')
+    args_parser.add_argument('--config', default=os.path.join(os.getcwd(), 'config.ini'))
+    args_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args_parser.add_argument('--chunk-size', type=int, default=64, help='consecutive frames recognized by one worker task')
+    args_parser.add_argument('--fps', type=float, default=10, help='frame rate of a frame directory')
+    args_parser.add_argument('--store', default='', help='also append the hits to a damage event store')
+    args_parser.add_argument('--json', action='store_true')
+    args_parser.add_argument('--write-known-names', action='store_true',
+                             help='write the names read at least --min-hits times to [names] known_skills and known_targets')
+    args_parser.add_argument('--min-hits', type=int, default=20)
+    args = args_parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+
+    path = Path(args.input)
+    analysis = OfflineAnalysis(args.store)
+    analysis.parser.set_name_canonicalization(**name_options_from_config(config))
+    started = time.perf_counter()
+    # rotated logs are combat_log.log.1 or combat_log.log.1.gz
+    if path.is_file() and (".log" in path.suffixes or path.suffix == ".txt"):
+        for timestamp, lines in read_saved_log(path):
+            analysis.add_lines(lines, timestamp)
+    else:
+        from dps_meter import ocr_options_from_config
+
+        ocr_options = ocr_options_from_config(config)
+        # chunks are recognized out of order by separate processes, and every one of them
+        # runs its own inference, so the cores are split between the processes
+        ocr_options["incremental"] = False
+        ocr_options["onnx_threads"] = ocr_options["paddle_threads"] = max(1, (os.cpu_count() or 1) // max(args.workers, 1))
+        archive_path = None
+        if path.is_dir():
+            frames = frames_from_directory(path, args.fps)
+        elif is_frame_archive(path):
+            archive_path = str(path)
+            frames = frames_from_archive(FrameArchiveReader(path))
+        else:
+            frames = frames_from_video(path)
+        for seq_id, timestamp, text in recognize_frames(frames, ocr_options, args.workers, args.chunk_size, archive_path):
+            if text is None:
+                analysis.skipped_frames += 1
+                continue
+            analysis.add_text(text, timestamp, seq_id)
+    elapsed = time.perf_counter() - started
+    analysis.close()
+
+    report = analysis.report()
+    report["elapsed_sec"] = round(elapsed, 3)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print(format_report(report))
+        print(f"\nanalyzed in {elapsed:.1f} s")
+    if args.write_known_names:
+        write_known_names(config, report, args.min_hits)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import os
+
+import cv2
+import numpy as np
+
+from text_layout import TextLine
+
+
+# PP-OCR recognition input height, line crops are scaled to it keeping their aspect ratio
+rec_image_height = 48
+rec_max_width = 3200
+# DBNet detection: the longer side is limited, both sides are multiples of 32
+det_limit_side = 960
+det_threshold = 0.3
+det_box_threshold = 0.6
+det_unclip_ratio = 1.5
+det_mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+det_std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def load_character_dict(path):
+    # class 0 is the CTC blank, the models are exported with the space as the last class
+    with open(path, encoding="utf-8") as f:
+        characters = [line.rstrip("\r\n") for line in f]
+    return [""] + characters + [" "]
+
+
+def quantized_model_path(path):
+    # Int8 weights with activations quantized at run time, written once next to the
+    # model. Worker processes may race to write it, so it is written aside and renamed.
+    root, ext = os.path.splitext(path)
+    quantized = f"{root}.int8{ext}"
+    if not os.path.exists(quantized) or os.path.getmtime(quantized) < os.path.getmtime(path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        temp_path = f"{root}.int8.{os.getpid()}{ext}"
+        quantize_dynamic(path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, quantized)
+    return quantized
+
+
+class OnnxEngine:
+    # Exported PP-OCR models on ONNX Runtime's CPU provider, without the Paddle
+    # runtime. The detection model is only needed in full mode. Sessions are shared
+    # by the ocr threads, intra-op threads are meant to split the cores between them.
+    detects_lines = True
+
+    def __init__(self, rec_model, character_dict, det_model=None, quantize=False, threads=1, rec_batch_num=16):
+        self.rec_model = rec_model
+        self.character_dict = character_dict
+        self.det_model = det_model
+        self.quantize = quantize
+        self.threads = threads
+        self.rec_batch_num = rec_batch_num
+        self.characters = None
+        self.rec_session = None
+        self.det_session = None
+
+    def load(self):
+        self.characters = load_character_dict(self.character_dict)
+        self.rec_session = self._session(self.rec_model)
+        if self.det_model:
+            self.det_session = self._session(self.det_model)
+
+    def _session(self, path):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.quantize:
+            path = quantized_model_path(path)
+        return onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def detect_and_recognize(self, image):
+        boxes = self._detect(image)
+        texts = self.recognize([image[top:bottom, left:right] for top, bottom, left, right in boxes])
+        return [TextLine(top, bottom, text) for (top, bottom, _, _), text in zip(boxes, texts) if text]
+
+    def recognize(self, crops):
+        texts = [""] * len(crops)
+        # crops of similar aspect ratio share a batch, so little of it is padding
+        order = sorted((i for i, crop in enumerate(crops) if crop.size), key=lambda i: crops[i].shape[1] / crops[i].shape[0])
+        input_name = self.rec_session.get_inputs()[0].name
+        for start in range(0, len(order), self.rec_batch_num):
+            batch = order[start:start + self.rec_batch_num]
+            images = [self._rec_input(crops[i]) for i in batch]
+            inputs = np.zeros((len(images), 3, rec_image_height, max(image.shape[2] for image in images)), dtype=np.float32)
+            for k, image in enumerate(images):
+                inputs[k, :, :, :image.shape[2]] = image
+            probabilities = self.rec_session.run(None, {input_name: inputs})[0]
+            for i, text in zip(batch, self._ctc_decode(probabilities)):
+                texts[i] = text
+        return texts
+
+    def _rec_input(self, crop):
+        if crop.ndim == 2:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2RGB)
+        height, width = crop.shape[:2]
+        resized_width = min(max(int(np.ceil(rec_image_height * width / height)), 1), rec_max_width)
+        resized = cv2.resize(crop, (resized_width, rec_image_height), interpolation=cv2.INTER_LINEAR)
+        # scaled to [-1, 1], padding stays 0 like in PaddleOCR
+        return resized.transpose(2, 0, 1).astype(np.float32) / 127.5 - 1.0
+
+    def _ctc_decode(self, probabilities):
+        # greedy CTC: best class per time step, repeats collapsed and blanks dropped
+        indices = probabilities.argmax(axis=2)
+        keep = indices != 0
+        keep[:, 1:] &= indices[:, 1:] != indices[:, :-1]
+        characters = self.characters
+        return ["".join(characters[i] for i in row[row_keep] if i < len(characters)) for row, row_keep in zip(indices, keep)]
+
+    def _detect(self, image):
+        # (top, bottom, left, right) boxes of text lines ordered top to bottom
+        if self.det_session is None:
+            raise RuntimeError("ONNX full mode needs a detection model (onnx_det_model)")
+        height, width = image.shape[:2]
+        scale = min(1.0, det_limit_side / max(height, width))
+        resized_height = max(int(round(height * scale / 32)) * 32, 32)
+        resized_width = max(int(round(width * scale / 32)) * 32, 32)
+        resized = cv2.resize(image, (resized_width, resized_height))
+        inputs = ((resized.astype(np.float32) / 255.0 - det_mean) / det_std).transpose(2, 0, 1)[np.newaxis]
+        input_name = self.det_session.get_inputs()[0].name
+        probability = self.det_session.run(None, {input_name: inputs})[0][0, 0]
+
+        bitmap = (probability > det_threshold).astype(np.uint8)
+        contours, _ = cv2.findContours(bitmap, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        scale_x = width / resized_width
+        scale_y = height / resized_height
+        boxes = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if min(w, h) < 3:
+                continue
+            if cv2.mean(probability[y:y + h, x:x + w], mask=bitmap[y:y + h, x:x + w])[0] < det_box_threshold:
+                continue
+            # the map marks shrunk text cores, boxes grow back by area * ratio / perimeter like DBNet's unclip
+            distance = w * h * det_unclip_ratio / (2 * (w + h))
+            boxes.append((max(int((y - distance) * scale_y), 0), min(int(np.ceil((y + h + distance) * scale_y)), height),
+                          max(int((x - distance) * scale_x), 0), min(int(np.ceil((x + w + distance) * scale_x)), width)))
+        boxes.sort()
+        return boxes
@@ -1,23 +1,82 @@
+import time
+
 import matplotlib.pyplot as plt
+import numpy as np
+
+
+class SeriesBuffer:
+    # Ring buffer of rows of values. Every value is written twice, capacity apart,
+    # so the last `size` values are always one contiguous slice and reading the
+    # series never copies.
+    def __init__(self, capacity, rows):
+        self.capacity = capacity
+        self.data = np.zeros((rows, 2 * capacity))
+        self.start = 0
+        self.size = 0
+
+    def append(self, values):
+        end = (self.start + self.size) % self.capacity
+        self.data[:, end] = values
+        self.data[:, end + self.capacity] = values
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def view(self):
+        return self.data[:, self.start:self.start + self.size]
+
+    def __len__(self):
+        return self.size
+
+
+class BlitManager:
+    # Redraws only the animated artists over a cached background. The background
+    # is captured again on every full draw (resize, new axis limits).
+    def __init__(self, canvas, artists):
+        self.canvas = canvas
+        self.background = None
+        self.artists = artists
+        for artist in artists:
+            artist.set_animated(True)
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    def update(self):
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
 
-from matplotlib.animation import FuncAnimation
-from collections import deque
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
 
 
 class Plotter:
-    def __init__(self, damage_calculator, max_points=100):
+    def __init__(self, damage_calculator, max_points=3600, refresh_ms=1000, rescale_interval=5.0):
         self.damage_calculator = damage_calculator
         self.max_points = max_points
+        self.refresh_ms = refresh_ms
+        # axis limits only change on growth or every rescale_interval, a new limit means a full redraw
+        self.rescale_interval = rescale_interval
 
-        self.timestamps = deque(maxlen=max_points)
-        self.moving_avg_data = deque(maxlen=max_points)
-        self.avg_data = deque(maxlen=max_points)
+        # time, moving average, average
+        self.series = SeriesBuffer(max_points, 3)
 
         self.start_timestamp = 0
         self.last_timestamp = 0
+        self.last_rescale = 0
         self.fig = None
         self.ax = None
-        self.animation = None
+        self.timer = None
+        self.blit_manager = None
         self.annot = None
 
     def run_blocking(self):
@@ -33,6 +92,8 @@ class Plotter:
         self.ax.set_ylabel('DPS')
         self.ax.set_title('DPS Meter - Damage Per Second')
         self.ax.grid(True, alpha=0.3)
+        self.ax.set_xlim(0, 10)
+        self.ax.set_ylim(0, 1)
 
         self.line_moving, = self.ax.plot([], [], label='Moving Average', linewidth=2, color='#FF6B6B')
         self.line_avg, = self.ax.plot([], [], label='Average', linewidth=2, color='#95E1D3')
@@ -44,22 +105,20 @@ class Plotter:
                                        bbox=dict(boxstyle="round", fc="white", ec="black", alpha=0.9),
                                        arrowprops=dict(arrowstyle="->", connectionstyle="arc3,rad=0"))
         self.annot.set_visible(False)
+        self.blit_manager = BlitManager(self.fig.canvas, [self.line_moving, self.line_avg, self.annot])
         self.fig.canvas.mpl_connect("motion_notify_event", self._on_hover)
 
-        self.animation = FuncAnimation(
-            self.fig, 
-            self._update_plot, 
-            interval=1000,
-            blit=False,
-            cache_frame_data=False
-        )
+        self.timer = self.fig.canvas.new_timer(interval=self.refresh_ms)
+        self.timer.add_callback(self._update_plot)
+        self.timer.start()
 
         plt.tight_layout()
         plt.show()
+        self.timer.stop()
 
-    def _update_plot(self, frame):
+    def _update_plot(self):
         if self.last_timestamp == self.damage_calculator.last_timestamp_ms:
-            return self.line_moving, self.line_avg
+            return
 
         if self.start_timestamp == 0:
             self.start_timestamp = self.damage_calculator.last_timestamp_ms
@@ -67,77 +126,73 @@ class Plotter:
         current_time = self.damage_calculator.last_timestamp_ms - self.start_timestamp
         self.last_timestamp = self.damage_calculator.last_timestamp_ms
 
-        self.timestamps.append(current_time / 1000.00)
-        self.moving_avg_data.append(self.damage_calculator.moving_average)
-        self.avg_data.append(self.damage_calculator.average)
-
-        if len(self.timestamps) > 0:
-            times = list(self.timestamps)
-            self.line_moving.set_data(times, list(self.moving_avg_data))
-            self.line_avg.set_data(times, list(self.avg_data))
-
-            self.ax.relim()
-            self.ax.autoscale_view()
-
-            if len(times) > 0:
-                if len(times) < self.max_points:
-                    self.ax.set_xlim(0, max(times[-1], 10))
-                else:
-                    self.ax.set_xlim(times[0], times[-1])
-
-        return self.line_moving, self.line_avg
-
-    def _find_nearest_point(self, x, y, line):
+        self.series.append((current_time / 1000.00,
+                            self.damage_calculator.moving_average,
+                            self.damage_calculator.average))
+
+        times, moving_avg_data, avg_data = self.series.view()
+        self.line_moving.set_data(times, moving_avg_data)
+        self.line_avg.set_data(times, avg_data)
+
+        if self._rescale(times, moving_avg_data, avg_data):
+            self.fig.canvas.draw_idle()
+        else:
+            self.blit_manager.update()
+
+    def _rescale(self, times, moving_avg_data, avg_data):
+        # returns True if the limits changed
+        now = time.monotonic()
+        x_min, x_max = self.ax.get_xlim()
+        y_min, y_max = self.ax.get_ylim()
+        first, last = times[0], times[-1]
+        low = min(moving_avg_data.min(), avg_data.min())
+        high = max(moving_avg_data.max(), avg_data.max())
+
+        grown = last > x_max or high > y_max or low < y_min
+        if not grown and now - self.last_rescale < self.rescale_interval:
+            return False
+
+        span = max(last - first, 10)
+        # room to grow, so the limits do not change every tick
+        new_x = (0 if len(self.series) < self.max_points else first, max(last + span * 0.1, 10))
+        margin = max(high - low, 1) * 0.1
+        new_y = (low - margin, high + margin)
+        self.last_rescale = now
+        if not grown and abs(new_y[1] - y_max) < margin and abs(new_x[0] - x_min) < span * 0.1:
+            return False
+        self.ax.set_xlim(*new_x)
+        self.ax.set_ylim(*new_y)
+        return True
+
+    def _find_nearest_point(self, event, line):
+        # nearest point in display coordinates, (index, x, y, distance in pixels)
         xdata, ydata = line.get_data()
         if len(xdata) == 0:
-            return None, None, None
-
-        ax_bbox = self.ax.get_window_extent()
-        xlim = self.ax.get_xlim()
-        ylim = self.ax.get_ylim()
-
-        x_scale = (xlim[1] - xlim[0]) / ax_bbox.width if ax_bbox.width > 0 else 1
-        y_scale = (ylim[1] - ylim[0]) / ax_bbox.height if ax_bbox.height > 0 else 1
-
-        distances = []
-        for xi, yi in zip(xdata, ydata):
-            dx = (xi - x) / x_scale if x_scale != 0 else 0
-            dy = (yi - y) / y_scale if y_scale != 0 else 0
-            distances.append(dx**2 + dy**2)
+            return None, None, None, None
 
-        if not distances:
-            return None, None, None
-
-        min_idx = distances.index(min(distances))
-        return min_idx, xdata[min_idx], ydata[min_idx]
+        points = self.ax.transData.transform(np.column_stack((xdata, ydata)))
+        distances = (points[:, 0] - event.x) ** 2 + (points[:, 1] - event.y) ** 2
+        min_idx = int(np.argmin(distances))
+        return min_idx, xdata[min_idx], ydata[min_idx], distances[min_idx] ** 0.5
 
     def _on_hover(self, event):
         if event.inaxes != self.ax:
             if self.annot.get_visible():
                 self.annot.set_visible(False)
-                self.fig.canvas.draw_idle()
+                self.blit_manager.update()
             return
 
         for line, label in [(self.line_moving, 'Moving Average'), (self.line_avg, 'Average')]:
-            if len(line.get_xdata()) == 0:
-                continue
-
-            idx, x, y = self._find_nearest_point(event.xdata, event.ydata, line)
-
-            if idx is not None:
-                display_coords = self.ax.transData.transform((x, y))
-                event_coords = (event.x, event.y)
-                distance = ((display_coords[0] - event_coords[0])**2 + 
-                           (display_coords[1] - event_coords[1])**2)**0.5
+            idx, x, y, distance = self._find_nearest_point(event, line)
 
-                if distance < 20:
-                    self.annot.xy = (x, y)
-                    text = f"{label}\nTime: {x:.2f}s\nDPS: {y:.2f}"
-                    self.annot.set_text(text)
-                    self.annot.set_visible(True)
-                    self.fig.canvas.draw_idle()
-                    return
+            if idx is not None and distance < 20:
+                self.annot.xy = (x, y)
+                text = f"{label}\nTime: {x:.2f}s\nDPS: {y:.2f}"
+                self.annot.set_text(text)
+                self.annot.set_visible(True)
+                self.blit_manager.update()
+                return
 
         if self.annot.get_visible():
             self.annot.set_visible(False)
-            self.fig.canvas.draw_idle()
\ No newline at end of file
+            self.blit_manager.update()
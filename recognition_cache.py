@@ -0,0 +1,73 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+from text_layout import text_mask
+
+
+class RecognitionCache:
+    # Lines scroll up unchanged, so the same line image is seen many times.
+    # Crops are reduced to their binary text mask trimmed to the glyphs, which
+    # does not depend on text color or on where the crop was cut, and the hash of
+    # that mask maps to the recognized text.
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, crop):
+        mask = text_mask(crop) > 0
+        rows = np.flatnonzero(mask.any(axis=1))
+        columns = np.flatnonzero(mask.any(axis=0))
+        if len(rows) == 0:
+            return None
+        mask = mask[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.array(mask.shape, dtype=np.int32).tobytes())
+        digest.update(np.packbits(mask).tobytes())
+        return digest.digest()
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        # number of entries evicted to make room
+        evicted = 0
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        return evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
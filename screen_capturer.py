@@ -1,26 +1,89 @@
+import threading
 import time
 
 import cv2
-import mss
 import numpy as np
 
 
+class FramePool:
+    # Fixed set of preallocated frames. A slot is handed out with one reference and
+    # goes back to the pool when its last reference is released. When every slot is
+    # in use a fresh array is allocated, so capture never waits for the pool.
+    def __init__(self, shape, size):
+        self.shape = shape
+        self.frames = [np.empty(shape, dtype=np.uint8) for _ in range(size)]
+        self.refs = [0] * size
+        self.free = list(range(size))
+        self.lock = threading.Lock()
+        self.exhausted = 0
+
+    def acquire(self):
+        # (slot, frame), slot is None for a frame outside of the pool
+        with self.lock:
+            if self.free:
+                slot = self.free.pop()
+                self.refs[slot] = 1
+                return slot, self.frames[slot]
+            self.exhausted += 1
+        return None, np.empty(self.shape, dtype=np.uint8)
+
+    def retain(self, slot):
+        with self.lock:
+            self.refs[slot] += 1
+
+    def release(self, slot):
+        with self.lock:
+            self.refs[slot] -= 1
+            if self.refs[slot] == 0:
+                self.free.append(slot)
+
+
 class Capture:
-    def __init__(self, capture, timestamp=None):
+    # A pooled capture starts with one reference; every holder that keeps it past
+    # the call it got it in retains it and releases it when done.
+    def __init__(self, capture, timestamp=None, pool=None, slot=None):
         self.image = capture
         self.timestamp = timestamp if timestamp is not None else int(round(time.time() * 1000))
+        self.captured_at = time.perf_counter()
+        self.pool = pool
+        self.slot = slot
+
+    def retain(self):
+        if self.slot is not None:
+            self.pool.retain(self.slot)
+        return self
+
+    def release(self):
+        if self.slot is not None:
+            self.pool.release(self.slot)
 
 
 class ScreenCapturer:
-    def __init__(self, x, y, width, height):
+    def __init__(self, x, y, width, height, pool_size=32):
         self.region = {"top": y, "left": x, "width": width, "height": height}
+        self.pool_size = pool_size
+        self.pool = None
         self.sct = None
 
     def capture(self):
         if self.sct is None:
+            import mss
+
             self.sct = mss.mss()
 
         screenshot = self.sct.grab(self.region)
-        img_array = np.array(screenshot)
-        img_rgb = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
-        return Capture(img_rgb)
+        # the grab buffer is BGRA, it is wrapped without copying
+        width, height = screenshot.size
+        bgra = np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(height, width, 4)
+        if self.pool is None or self.pool.shape[:2] != (height, width):
+            # the grabbed size is known only after the first grab (display scaling)
+            self.pool = FramePool((height, width, 3), self.pool_size)
+
+        slot, frame = self.pool.acquire()
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB, dst=frame)
+        return Capture(frame, pool=self.pool, slot=slot)
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
@@ -0,0 +1,145 @@
+import threading
+
+import numpy as np
+
+
+class ScrollTracker:
+    # The combat log mostly scrolls up between frames. Rows that occur once in a
+    # frame are hashed and looked up in the previous frame to find candidate scroll
+    # offsets; the offset whose overlap has the fewest changed rows, compared word
+    # by word, is taken. Lines of the previous frame are reused only where every
+    # one of their rows is unchanged, all other rows with text go to OCR: the newly
+    # exposed strip at the bottom as well as anything that changed in place.
+    def __init__(self, max_offset_ratio=0.5, tolerance=0.02, refresh_interval=30, candidates=4):
+        self.max_offset_ratio = max_offset_ratio
+        # share of overlapping rows that may differ, they are recognized again
+        self.tolerance = tolerance
+        self.refresh_interval = refresh_interval
+        self.candidates = candidates
+        self.lock = threading.Lock()
+        self.multipliers = None
+
+        self.prev_rows = None
+        self.prev_keys = None
+        self.prev_lines = None
+        self.frames_since_refresh = 0
+
+        self.full_frames = 0
+        self.incremental_frames = 0
+        self.pixels_total = 0
+        self.pixels_recognized = 0
+
+    def recognize(self, image, recognize_lines):
+        with self.lock:
+            rows = self._row_words(image)
+            keys = self._row_keys(rows)
+            height = len(rows)
+            offset = None
+            if self.prev_lines is not None and self.frames_since_refresh < self.refresh_interval:
+                offset = self._estimate_offset(self.prev_rows, self.prev_keys, rows, keys)
+
+            if offset is None:
+                lines = recognize_lines(image)
+                self.frames_since_refresh = 0
+                self.full_frames += 1
+                recognized_rows = height
+            else:
+                lines, recognized_rows = self._stitch(image, rows, keys, offset, recognize_lines)
+                self.frames_since_refresh += 1
+                self.incremental_frames += 1
+
+            self.pixels_total += image.size
+            self.pixels_recognized += image.size * recognized_rows // max(height, 1)
+
+            self.prev_rows = rows
+            self.prev_keys = keys
+            self.prev_lines = lines
+            return lines
+
+    def reset(self):
+        with self.lock:
+            self.prev_rows = None
+            self.prev_keys = None
+            self.prev_lines = None
+
+    def _stitch(self, image, rows, keys, offset, recognize_lines):
+        height = len(rows)
+        # rows showing exactly the pixels of the previous frame's row offset further down
+        unchanged = np.zeros(height, dtype=bool)
+        unchanged[:height - offset] = self._same_rows(self.prev_rows[offset:], rows[:height - offset])
+
+        lines = []
+        covered = np.zeros(height, dtype=bool)
+        for line in self.prev_lines:
+            top = line.top - offset
+            # a line touching the bottom of the previous frame may have been cut off there
+            if top < 0 or line.bottom >= height or not unchanged[top:line.bottom - offset].all():
+                continue
+            lines.append(line.shifted(-offset))
+            covered[top:line.bottom - offset] = True
+
+        # runs of rows between the reused lines are recognized if they have any text
+        recognized_rows = 0
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], (~covered).view(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            if keys[start:end].any():
+                lines += [line.shifted(start) for line in recognize_lines(image[start:end])]
+                recognized_rows += end - start
+        lines.sort(key=lambda line: line.top)
+        return lines, recognized_rows
+
+    def _row_words(self, image):
+        # every row as 8 byte words, padded with zeros
+        flat = np.ascontiguousarray(image).reshape(image.shape[0], -1)
+        if flat.shape[1] % 8:
+            flat = np.pad(flat, ((0, 0), (0, -flat.shape[1] % 8)))
+        return flat.view(np.uint64)
+
+    def _row_keys(self, rows):
+        # multilinear hash of the words with random odd multipliers, blank rows hash to 0
+        if self.multipliers is None or len(self.multipliers) != rows.shape[1]:
+            rng = np.random.default_rng(0)
+            self.multipliers = rng.integers(0, 2 ** 63, rows.shape[1], dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        return rows @ self.multipliers
+
+    def _same_rows(self, a, b):
+        return ~(a != b).any(axis=1)
+
+    def _anchors(self, keys):
+        # (keys, positions) of the rows occurring once in the frame; rows repeated by the
+        # upscaling count once, blank rows never
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        first &= keys != 0
+        positions = np.flatnonzero(first)
+        unique_keys, index, counts = np.unique(keys[positions], return_index=True, return_counts=True)
+        return unique_keys[counts == 1], positions[index[counts == 1]]
+
+    def _estimate_offset(self, prev_rows, prev_keys, rows, keys):
+        if prev_rows is None or prev_rows.shape != rows.shape:
+            return None
+
+        height = len(rows)
+        max_offset = int(height * self.max_offset_ratio)
+        # every row found in both frames votes for the offset between its positions
+        prev_anchor_keys, prev_positions = self._anchors(prev_keys)
+        anchor_keys, positions = self._anchors(keys)
+        _, prev_index, index = np.intersect1d(prev_anchor_keys, anchor_keys, assume_unique=True, return_indices=True)
+        offsets = prev_positions[prev_index] - positions[index]
+        offsets = offsets[(offsets >= 0) & (offsets <= max_offset)]
+        if not len(offsets):
+            return None
+        votes = np.bincount(offsets)
+
+        best_offset = None
+        best_changed = None
+        for offset in np.argsort(-votes, kind="stable")[:self.candidates]:
+            if not votes[offset]:
+                break
+            changed = height - offset - np.count_nonzero(self._same_rows(prev_rows[offset:], rows[:height - offset]))
+            if best_changed is None or changed < best_changed:
+                best_offset = int(offset)
+                best_changed = changed
+        if best_changed > self.tolerance * (height - best_offset):
+            return None
+        return best_offset
@@ -0,0 +1,205 @@
+import argparse
+import json
+
+import cv2
+import numpy as np
+
+from text_extractor import extract_color_ranges
+
+
+# the middle of every extract_color_ranges entry, so the colors survive extraction
+color_names = ("white", "orange", "red", "blue", "green", "warn")
+colors = {name: tuple((low + high) // 2 for low, high in zip(*color_range))
+          for name, color_range in zip(color_names, extract_color_ranges)}
+background = (18, 20, 26)
+
+skills = ["Flame Bolt", "Frost Chain", "Wind Cut", "Earth Spike", "Dark Flash", "Soul Strike", "Blade Storm"]
+targets = ["Training Dummy", "Ancient Dragon", "Goblin Chief", "Kerubim"]
+# every multiplier variant of damage_pattern, brackets included
+multipliers = ["", "Critical ", "Perfect ", "Smite ", "Double Critical ", "Perfect Critical ", "[Critical] ", "[Perfect] "]
+
+
+class LogEntry:
+    # one combat log message as (text, color name) segments, damage 0 for messages the parser ignores
+    def __init__(self, segments, damage=0):
+        self.segments = segments
+        self.damage = damage
+        self.text = "".join(text for text, _ in segments)
+
+
+def random_entry(rng):
+    kind = rng.random()
+    if kind < 0.75:
+        damage = int(rng.integers(1, 100000))
+        return LogEntry([("Used ", "white"), (rng.choice(skills), "blue"), (" against ", "white"),
+                         (rng.choice(targets), "orange"), (" and dealt ", "white"), (str(damage), "red"),
+                         (" " + rng.choice(multipliers) + "damage.", "white")], damage)
+    if kind < 0.9:
+        damage = int(rng.integers(1, 10000))
+        return LogEntry([("Dealt additional damage of ", "white"), (str(damage), "orange"),
+                         (" to ", "white"), (rng.choice(targets) + ".", "orange")], damage)
+    if kind < 0.95:
+        return LogEntry([("Recovered ", "green"), (str(int(rng.integers(1, 5000))), "green"), (" HP.", "green")])
+    return LogEntry([("You cannot use that skill now.", "warn")])
+
+
+class GlyphFont:
+    # Hershey glyphs rasterized once per character without anti-aliasing, one pixel
+    # apart like the log font. Rows are drawn on strips of line_height pixels.
+    def __init__(self, scale=0.4, line_height=17, space_width=4, spacing=1):
+        self.scale = scale
+        self.line_height = line_height
+        self.space_width = space_width
+        self.spacing = spacing
+        self.glyphs = {}
+
+    def glyph(self, char):
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            canvas = np.zeros((self.line_height, self.line_height * 2), dtype=np.uint8)
+            cv2.putText(canvas, char, (2, self.line_height - 4), cv2.FONT_HERSHEY_SIMPLEX, self.scale, 255, 1, cv2.LINE_8)
+            columns = np.flatnonzero(canvas.any(axis=0))
+            glyph = self.glyphs[char] = canvas[:, columns[0]:columns[-1] + 1] > 0
+        return glyph
+
+    def width(self, text):
+        return sum(self.space_width if char == " " else self.glyph(char).shape[1] + self.spacing for char in text)
+
+    def wrap(self, entry, width):
+        # word wrap into rows of (char, color name), the space at a break is dropped
+        words = []
+        for text, color in entry.segments:
+            for i, part in enumerate(text.split(" ")):
+                if i > 0:
+                    words.append([])
+                if not words:
+                    words.append([])
+                words[-1] += [(char, color) for char in part]
+        rows = [[]]
+        for word in words:
+            row_width = self.width("".join(char for char, _ in rows[-1]))
+            if rows[-1] and row_width + self.space_width + self.width("".join(char for char, _ in word)) > width:
+                rows.append([])
+            elif rows[-1]:
+                rows[-1].append((" ", "white"))
+            rows[-1] += word
+        return rows
+
+    def render(self, row, width, left):
+        strip = np.empty((self.line_height, width, 3), dtype=np.uint8)
+        strip[:] = background
+        x = left
+        for char, color in row:
+            if char == " ":
+                x += self.space_width
+                continue
+            glyph = self.glyph(char)
+            strip[:, x:x + glyph.shape[1]][glyph] = colors[color]
+            x += glyph.shape[1] + self.spacing
+        return strip
+
+
+class SyntheticFrame:
+    def __init__(self, image, timestamp, rows):
+        self.image = image
+        self.timestamp = timestamp
+        # text of the visible rows, what a perfect OCR would read
+        self.rows = rows
+
+    @property
+    def text(self):
+        return "\n".join(self.rows)
+
+
+class SyntheticCombatLog:
+    # Deterministic combat log panel. Entries arrive at entry_rate per frame on average
+    # and scroll the panel up, some frames are idle and the panel starts empty.
+    # expected_total/expected_hits are the damage the parser should find in the frames
+    # generated so far: the first and last message of a frame are never parsed, so an
+    # entry counts once it was seen anywhere in between.
+    def __init__(self, seed=0, width=348, height=852, entry_rate=1.5, idle_ratio=0.2, empty_frames=3,
+                 noise=0.0, blur=0, frame_interval_ms=100, font=None):
+        self.rng = np.random.default_rng(seed)
+        self.width = width
+        self.height = height
+        self.entry_rate = entry_rate
+        self.idle_ratio = idle_ratio
+        self.empty_frames = empty_frames
+        self.noise = noise
+        self.blur = blur
+        self.frame_interval_ms = frame_interval_ms
+        self.font = font if font is not None else GlyphFont()
+        self.margin = 4
+        self.visible_rows = (height - 2 * self.margin) // self.font.line_height
+        # (entry index, row text, row strip) of the newest rows
+        self.rows = []
+        self.entries = []
+        self.counted = set()
+        self.expected_total = 0
+        self.expected_hits = 0
+
+    def frames(self, count):
+        for index in range(count):
+            if index >= self.empty_frames and self.rng.random() >= self.idle_ratio:
+                for _ in range(self.rng.poisson(self.entry_rate)):
+                    self._add_entry(random_entry(self.rng))
+            yield self._frame(index)
+
+    def _add_entry(self, entry):
+        self.entries.append(entry)
+        for row in self.font.wrap(entry, self.width - 2 * self.margin):
+            text = "".join(char for char, _ in row)
+            self.rows.append((len(self.entries) - 1, text, self.font.render(row, self.width, self.margin)))
+        del self.rows[:-self.visible_rows]
+
+    def _frame(self, index):
+        image = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        image[:] = background
+        line_height = self.font.line_height
+        for i, (_, _, strip) in enumerate(self.rows):
+            image[self.margin + i * line_height:self.margin + (i + 1) * line_height] = strip
+        if self.blur:
+            image = cv2.GaussianBlur(image, (2 * self.blur + 1, 2 * self.blur + 1), 0)
+        if self.noise:
+            image = np.clip(image + self.rng.normal(0, self.noise, image.shape), 0, 255).astype(np.uint8)
+
+        visible = sorted({entry_index for entry_index, _, _ in self.rows})
+        for entry_index in visible[1:-1]:
+            if entry_index not in self.counted:
+                self.counted.add(entry_index)
+                if self.entries[entry_index].damage:
+                    self.expected_total += self.entries[entry_index].damage
+                    self.expected_hits += 1
+        return SyntheticFrame(image, index * self.frame_interval_ms, [text for _, text, _ in self.rows])
+
+
+def main():
+    from frame_archive import FrameArchiveWriter
+    from screen_capturer import Capture
+
+    args_parser = argparse.ArgumentParser(description='Write a synthetic combat log frame archive with its ground truth')
+    args_parser.add_argument('out', help='frame archive, the truth goes to <out>.truth.json')
+    args_parser.add_argument('--frames', type=int, default=300)
+    args_parser.add_argument('--seed', type=int, default=0)
+    args_parser.add_argument('--entry-rate', type=float, default=1.5, help='new messages per frame on average')
+    args_parser.add_argument('--noise', type=float, default=0.0, help='standard deviation of gaussian pixel noise')
+    args_parser.add_argument('--blur', type=int, default=0, help='gaussian blur radius in pixels')
+    args = args_parser.parse_args()
+
+    log = SyntheticCombatLog(seed=args.seed, entry_rate=args.entry_rate, noise=args.noise, blur=args.blur)
+    writer = FrameArchiveWriter(args.out)
+    texts = []
+    for frame in log.frames(args.frames):
+        writer.write(Capture(frame.image, timestamp=frame.timestamp))
+        texts.append(frame.text)
+    writer.close()
+
+    truth = {"expected_total": log.expected_total, "expected_hits": log.expected_hits, "texts": texts}
+    with open(args.out + ".truth.json", "w", encoding="utf-8") as f:
+        json.dump(truth, f, indent=2)
+    print(f"{args.frames} frames, {len(log.entries)} messages, expected {log.expected_hits} hits "
+          f"with {log.expected_total} damage")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import sys
+
+from pathlib import Path
+
+import pytest
+
+
+# the modules live flat in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--perf", action="store_true", help="also run the timing tests")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "perf: timing test, depends on the machine, run with --perf")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--perf"):
+        return
+    skip = pytest.mark.skip(reason="timing test, run with --perf")
+    for item in items:
+        if "perf" in item.keywords:
+            item.add_marker(skip)
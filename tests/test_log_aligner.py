@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from benchmark import ocr_noise, synthetic_log_lines
+from log_aligner import LogAligner
+
+
+def scroll_corpus(rng, count=1500):
+    # synthetic log with runs of the very same hit, like a skill repeated on one target
+    lines = []
+    for line in synthetic_log_lines(count, rng):
+        lines.append(line)
+        if rng.random() < 0.05:
+            lines += [line] * int(rng.integers(2, 6))
+    return lines
+
+
+def scroll_frames(corpus, rng, window, max_scroll, noise):
+    # (first corpus line, OCR'd lines) of a panel scrolling over the corpus, idle frames included
+    frames = []
+    position = 0
+    while position + window <= len(corpus):
+        lines = corpus[position:position + window]
+        frames.append((position, [ocr_noise(line, rng, noise) for line in lines] if noise else list(lines)))
+        position += int(rng.integers(0, max_scroll + 1))
+    return frames
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("noise", [0.0, 0.01])
+def test_no_duplicated_or_missed_lines(seed, noise):
+    rng = np.random.default_rng(seed)
+    corpus = scroll_corpus(rng)
+    frames = scroll_frames(corpus, rng, window=40, max_scroll=6, noise=noise)
+
+    aligner = LogAligner()
+    duplicated = missed = 0
+    for (prev_position, prev), (position, cur) in zip(frames, frames[1:]):
+        reported = len(aligner.new_lines(prev, cur))
+        expected = min(position - prev_position, len(cur))
+        duplicated += max(reported - expected, 0)
+        missed += max(expected - reported, 0)
+
+    assert (duplicated, missed) == (0, 0)
+
+
+def test_repeated_hits_are_new_lines():
+    hit = "Used Flame Bolt against Goblin and dealt 1200 damage."
+    other = [f"Dealt additional damage of {i} to Goblin." for i in range(10)]
+    prev = other + [hit] * 3
+    # two more of the same hit scrolled in
+    cur = other[2:] + [hit] * 5
+    assert LogAligner().new_lines(prev, cur) == [hit, hit]
+
+
+def test_unchanged_frame_has_no_new_lines():
+    lines = [f"Used Wind Cut against Goblin and dealt {i} damage." for i in range(12)]
+    assert LogAligner().new_lines(lines, list(lines)) == []
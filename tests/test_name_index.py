@@ -0,0 +1,57 @@
+from collections import Counter
+
+import numpy as np
+
+from benchmark import ocr_noise
+from name_index import NameIndex
+
+
+skills = ["Flame Bolt", "Frost Chain", "Piercing Arrow", "Thunder Strike", "Savage Blow", "Hidden Lance",
+          "Flame Bolt II", "Flame Bolt III"]
+
+
+def noisy_reads(rng, count, noise=0.03):
+    # a few skills used most of the time, every read with OCR noise
+    weights = 1.0 / np.arange(1, len(skills) + 1)
+    truth = rng.choice(len(skills), count, p=weights / weights.sum())
+    return truth, [ocr_noise(skills[i], rng, noise) for i in truth]
+
+
+def test_variants_cluster_without_known_names():
+    truth, reads = noisy_reads(np.random.default_rng(0), 20000)
+    index = NameIndex()
+    ids = [index.canonical_id(name) for name in reads]
+
+    # every true name lands on one canonical name nearly always, and no canonical name mixes two
+    by_truth = {}
+    by_id = {}
+    for name_id, true_id in zip(ids, truth):
+        by_truth.setdefault(true_id, Counter())[name_id] += 1
+        by_id.setdefault(name_id, Counter())[true_id] += 1
+    assert sum(counter.most_common(1)[0][1] for counter in by_truth.values()) / len(ids) >= 0.98
+    assert sum(counter.most_common(1)[0][1] for counter in by_id.values()) / len(ids) >= 0.99
+    # only badly misread names get one of their own
+    assert len(index.names) <= 5 * len(skills)
+
+
+def test_ranks_stay_apart():
+    index = NameIndex()
+    ids = {name: index.canonical_id(name) for name in ["Flame Bolt", "Flame Bolt II", "Flame Bolt III"] * 3}
+    assert len(set(ids.values())) == 3
+
+
+def test_frequent_name_is_learned():
+    index = NameIndex(learn_after=3)
+    for _ in range(10):
+        index.canonical_id("Piercing Arrow")
+    # a new name close to a known one is taken for a misread of it until it is read often enough
+    assert index.canonical("Piercing Arr0w.") == "Piercing Arrow"
+    for _ in range(10):
+        index.canonical_id("Piercing Sparrow")
+    assert index.canonical("Piercing Sparrow") == "Piercing Sparrow"
+
+
+def test_known_names_are_canonical():
+    index = NameIndex(["Flame Bolt", "Frost Chain"])
+    assert index.canonical("Flarne Bolt") == "Flame Bolt"
+    assert index.canonical("Frost Cha1n") == "Frost Chain"
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from benchmark import build_synthetic_atlas
+from combat_log_ocr import CombatLogOCR
+from offline_analyzer import OfflineAnalysis
+from synthetic_frames import SyntheticCombatLog
+from text_extractor import extract_color_ranges
+
+
+frame_count = 100
+min_fps = 5.0
+
+
+def glyph_options(atlas=""):
+    return dict(ocr_engine="glyph", ocr_lang="en", ocr_version=None, det_model_dir=None, rec_model_dir=None,
+                cls_model_dir=None, use_gpu=False, extract_color_ranges=extract_color_ranges,
+                resize_factor=2, mode="rec_only", glyph_atlas=atlas)
+
+
+@pytest.fixture(scope="module")
+def regression(tmp_path_factory):
+    # synthetic frames read by the glyph engine, its atlas learned from other synthetic frames
+    atlas = build_synthetic_atlas(glyph_options(), 100, 1, str(tmp_path_factory.mktemp("atlas") / "glyph_atlas.npz"))
+    ocr = CombatLogOCR(**glyph_options(atlas))
+    log = SyntheticCombatLog(seed=0)
+    frames = list(log.frames(frame_count))
+    ocr.warm_up(frames[0].image.shape)
+
+    started = time.perf_counter()
+    texts = [ocr.handle(frame.image, frame.timestamp, i).text for i, frame in enumerate(frames)]
+    elapsed = time.perf_counter() - started
+    return log, frames, texts, elapsed
+
+
+def analyze(frames, texts):
+    analysis = OfflineAnalysis()
+    for i, (frame, text) in enumerate(zip(frames, texts)):
+        analysis.add_text(text, frame.timestamp, i)
+    analysis.close()
+    return analysis.calculator
+
+
+def test_parser_counts_every_hit_of_the_true_text(regression):
+    log, frames, _, _ = regression
+    calculator = analyze(frames, [frame.text for frame in frames])
+    assert log.expected_hits > 0
+    assert (calculator.count, calculator.total) == (log.expected_hits, log.expected_total)
+
+
+def test_recognized_damage_totals(regression):
+    log, frames, texts, _ = regression
+    calculator = analyze(frames, texts)
+    assert (calculator.count, calculator.total) == (log.expected_hits, log.expected_total)
+
+
+def test_recognized_text(regression):
+    _, frames, texts, _ = regression
+    assert texts == [frame.text for frame in frames]
+
+
+@pytest.mark.perf
+def test_frame_rate(regression):
+    _, frames, _, elapsed = regression
+    assert len(frames) / elapsed >= min_fps
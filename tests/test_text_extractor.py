@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import pytest
+
+from synthetic_frames import SyntheticCombatLog
+from text_extractor import ColorTextExtractor, extract_color_ranges
+
+
+def synthetic_frames(count=20):
+    # rendered log panels with every text color sprinkled over them
+    rng = np.random.default_rng(1)
+    colors = np.array([np.add(lower, upper) // 2 for lower, upper in extract_color_ranges], dtype=np.uint8)
+    frames = []
+    for frame in SyntheticCombatLog(seed=3).frames(count):
+        image = frame.image.copy()
+        sprinkled = rng.random(image.shape[:2]) < 0.2
+        image[sprinkled] = colors[rng.integers(0, len(colors), sprinkled.sum())]
+        frames.append(image)
+    return frames
+
+
+def edge_frame():
+    # every channel just inside and just outside the bounds of every range
+    pixels = []
+    for lower, upper in extract_color_ranges:
+        for channel in range(3):
+            for value in (lower[channel] - 1, lower[channel], upper[channel], upper[channel] + 1):
+                pixel = list(lower)
+                pixel[channel] = min(max(value, 0), 255)
+                pixels.append(pixel)
+    pixels = np.array(pixels, dtype=np.uint8)
+    return np.tile(pixels[np.newaxis], (8, 1, 1))
+
+
+@pytest.mark.parametrize("resize_factor", [1, 2, 3])
+@pytest.mark.parametrize("interpolation", [cv2.INTER_NEAREST, cv2.INTER_NEAREST_EXACT])
+def test_lut_extraction_is_pixel_identical_to_in_range(resize_factor, interpolation):
+    extractor = ColorTextExtractor(extract_color_ranges, resize_factor, interpolation)
+    rng = np.random.default_rng(2)
+    frames = synthetic_frames() + [edge_frame(), rng.integers(0, 256, (64, 96, 3), dtype=np.uint8)]
+    for frame in frames:
+        image, bounds = extractor.extract_with_bounds(frame)
+        reference, reference_bounds = extractor.extract_reference_with_bounds(frame)
+        assert image.shape == reference.shape
+        assert np.array_equal(image, reference)
+        if reference_bounds is None:
+            assert bounds is None
+        else:
+            assert (bounds.top, bounds.bottom, bounds.left, bounds.right) == \
+                (reference_bounds.top, reference_bounds.bottom, reference_bounds.left, reference_bounds.right)
+
+
+def test_frame_without_text_colors():
+    extractor = ColorTextExtractor(extract_color_ranges)
+    frame = np.zeros((40, 60, 3), dtype=np.uint8)
+    image, bounds = extractor.extract_with_bounds(frame)
+    assert bounds is None
+    assert image.shape == (80, 120, 3)
+    assert not image.any()
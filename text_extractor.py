@@ -0,0 +1,109 @@
+import threading
+
+import cv2
+import numpy as np
+
+from text_layout import text_bounds
+
+
+nearest_interpolations = (cv2.INTER_NEAREST, cv2.INTER_NEAREST_EXACT)
+
+extract_color_ranges = [
+    # White text (normal text)
+    ([182, 144, 100], [255, 200, 140]),
+    # Orange text (values and names)
+    ([170, 105, 32], [255, 160, 51]),
+    # Red text (damage text)
+    ([100, 26, 10], [195, 31, 31]),
+    # Blue text (skills)
+    ([14, 85, 134], [16, 152, 248]),
+    # Green text (regeneration)
+    ([59, 93, 0], [129, 202, 1]),
+    # Warn text
+    ([135, 37, 37], [253, 87, 87]),
+]
+
+
+class ColorTextExtractor:
+    # Keeps only pixels inside one of the color ranges and upscales the result.
+    #
+    # Every channel value maps through a lookup table to a bitmask of the ranges
+    # containing it, so ANDing the three channel bitmasks gives the combined mask
+    # of all ranges in one pass. The mask is applied at native resolution before
+    # resizing; with nearest neighbour interpolation every output pixel is a copy
+    # of an input pixel, so the result is identical to masking the upscaled frame.
+    def __init__(self, color_ranges, resize_factor=2, resize_interpolation=cv2.INTER_NEAREST_EXACT):
+        self.color_ranges = color_ranges
+        self.resize_factor = resize_factor
+        self.resize_interpolation = resize_interpolation
+        self.channel_luts = self._build_channel_luts(color_ranges)
+        # scratch buffers are reused across frames, one set per ocr thread
+        self.local = threading.local()
+
+    def extract(self, image):
+        return self.extract_with_bounds(image)[0]
+
+    def extract_with_bounds(self, image):
+        # (processed image, TextBand around its text pixels or None without any)
+        if self.channel_luts is None or self.resize_interpolation not in nearest_interpolations or image.ndim != 3 or image.shape[2] != 3:
+            return self.extract_reference_with_bounds(image)
+
+        buffers = self._buffers(image.shape)
+        mask = self._lut_mask(image, buffers)
+        # the native mask is a quarter of the upscaled one, bounds are taken on it
+        bounds = text_bounds(mask, self.resize_factor)
+        if bounds is None:
+            return np.zeros(self._resized_shape(image.shape), dtype=np.uint8), None
+        # masked operations leave pixels outside of the mask untouched
+        buffers.masked.fill(0)
+        cv2.bitwise_and(image, image, dst=buffers.masked, mask=mask)
+        return self._resize(buffers.masked), bounds
+
+    def extract_reference(self, image):
+        return self.extract_reference_with_bounds(image)[0]
+
+    def extract_reference_with_bounds(self, image):
+        resized = cv2.resize(image, None, fx=self.resize_factor, fy=self.resize_factor, interpolation=self.resize_interpolation)
+        combined_mask = np.zeros(resized.shape[:2], dtype=np.uint8)
+        for lower, upper in self.color_ranges:
+            mask = cv2.inRange(resized, np.array(lower), np.array(upper))
+            combined_mask = cv2.bitwise_or(combined_mask, mask)
+        return cv2.bitwise_and(resized, resized, mask=combined_mask), text_bounds(combined_mask)
+
+    def _resized_shape(self, shape):
+        # same rounding as cv2.resize with fx/fy
+        return (int(round(shape[0] * self.resize_factor)), int(round(shape[1] * self.resize_factor))) + tuple(shape[2:])
+
+    def _lut_mask(self, image, buffers):
+        channels = cv2.split(image, buffers.channels)
+        for channel, lut in zip(channels, self.channel_luts):
+            cv2.LUT(channel, lut, dst=channel)
+        cv2.bitwise_and(channels[0], channels[1], dst=buffers.mask)
+        cv2.bitwise_and(buffers.mask, channels[2], dst=buffers.mask)
+        return buffers.mask
+
+    def _resize(self, image):
+        if self.resize_factor == 1:
+            return image.copy()
+        return cv2.resize(image, None, fx=self.resize_factor, fy=self.resize_factor, interpolation=self.resize_interpolation)
+
+    def _buffers(self, shape):
+        buffers = self.local
+        if getattr(buffers, "shape", None) != shape:
+            buffers.shape = shape
+            buffers.channels = [np.empty(shape[:2], dtype=np.uint8) for _ in range(shape[2])]
+            buffers.mask = np.empty(shape[:2], dtype=np.uint8)
+            buffers.masked = np.empty(shape, dtype=np.uint8)
+        return buffers
+
+    def _build_channel_luts(self, color_ranges):
+        # one bit per range
+        if len(color_ranges) > 8:
+            return None
+        values = np.arange(256)
+        luts = [np.zeros(256, dtype=np.uint8) for _ in range(3)]
+        for bit, (lower, upper) in enumerate(color_ranges):
+            for channel, lut in enumerate(luts):
+                inside = (values >= lower[channel]) & (values <= upper[channel])
+                lut[inside] |= 1 << bit
+        return luts
@@ -0,0 +1,70 @@
+import math
+
+import cv2
+import numpy as np
+
+
+class TextLine:
+    # a recognized line with its vertical position in the processed image
+    def __init__(self, top, bottom, text):
+        self.top = top
+        self.bottom = bottom
+        self.text = text
+
+    def shifted(self, dy):
+        return TextLine(self.top + dy, self.bottom + dy, self.text)
+
+
+class TextBand:
+    # bounding box of one rendered text line, bottom/right exclusive
+    def __init__(self, top, bottom, left, right):
+        self.top = top
+        self.bottom = bottom
+        self.left = left
+        self.right = right
+
+    def shifted(self, dy, dx=0):
+        return TextBand(self.top + dy, self.bottom + dy, self.left + dx, self.right + dx)
+
+
+def lines_to_text(lines):
+    return "\n".join(line.text for line in lines)
+
+
+def text_mask(image):
+    # color extraction leaves everything except text black
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+
+
+def text_bounds(mask, scale=1):
+    # bounding box of all text pixels as a TextBand, None for a frame without text
+    if not cv2.countNonZero(mask):
+        return None
+    x, y, w, h = cv2.boundingRect(mask)
+    return TextBand(int(y * scale), int(math.ceil((y + h) * scale)), int(x * scale), int(math.ceil((x + w) * scale)))
+
+
+def find_text_bands(mask, min_height=4, max_gap=1):
+    # horizontal projection: runs of rows containing text pixels, gaps up to
+    # max_gap rows are bridged so glyph parts like dots stay in their line
+    rows = np.flatnonzero(np.count_nonzero(mask, axis=1))
+    if len(rows) == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(rows) > max_gap + 1)
+    starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    ends = np.concatenate((rows[breaks], [rows[-1]])) + 1
+
+    bands = []
+    for top, bottom in zip(starts, ends):
+        if bottom - top < min_height:
+            continue
+        columns = np.flatnonzero(np.count_nonzero(mask[top:bottom], axis=0))
+        bands.append(TextBand(int(top), int(bottom), int(columns[0]), int(columns[-1]) + 1))
+    return bands
+
+
+def crop_band(image, band, padding=0):
+    h, w = image.shape[:2]
+    return image[max(band.top - padding, 0):min(band.bottom + padding, h),
+                 max(band.left - padding, 0):min(band.right + padding, w)]
@@ -1,25 +1,60 @@
+import time
+
 from datetime import datetime
 
-from skimage.metrics import structural_similarity
 
 def images_not_similar(prev, cur, threshold=0.9):
     if prev is None or cur is None:
         return True
+    from skimage.metrics import structural_similarity
     return structural_similarity(prev, cur, channel_axis=2, full=False) < threshold
 
 
-def fuzzy_string_match(lhs, rhs, deep=1):
-    len_diff = abs(len(lhs) - len(rhs))
-    if len_diff > deep:
-        return False
+def edit_distance(lhs, rhs):
+    # bit-parallel Levenshtein distance (Myers/Hyyrö), one pass over rhs with
+    # the columns of the dynamic programming table packed into integers
+    if len(lhs) == 0 or len(rhs) == 0:
+        return len(lhs) + len(rhs)
+
+    mask = (1 << len(lhs)) - 1
+    high = 1 << (len(lhs) - 1)
+    peq = {}
+    for i, c in enumerate(lhs):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    pv = mask
+    mv = 0
+    score = len(lhs)
+    for c in rhs:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+def bounded_edit_distance(lhs, rhs, limit):
+    # edit distance if it is at most limit, otherwise limit + 1
+    if abs(len(lhs) - len(rhs)) > limit:
+        return limit + 1
+    if lhs == rhs:
+        return 0
+    return min(edit_distance(lhs, rhs), limit + 1)
 
-    miss = len_diff
-    for i in range(0, min(len(lhs), len(rhs))):
-        miss += 0 if rhs[i] == lhs[i] else 1
-        if miss > deep:
-            return False
 
-    return True
+def character_error_rate(reference, hypothesis):
+    if len(reference) == 0:
+        return 0.0 if len(hypothesis) == 0 else 1.0
+    return edit_distance(reference, hypothesis) / len(reference)
 
 
 def format_timestamp(timestamp_ms):
@@ -28,3 +63,24 @@ def format_timestamp(timestamp_ms):
         return dt.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
     except:
         return str(timestamp_ms)
+
+
+class StartupProfile:
+    # Records the first time every named phase is reached, relative to started_at.
+    # Phases may be marked from any thread; a disabled profile ignores marks.
+    def __init__(self, enabled=True, started_at=None):
+        self.enabled = enabled
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases = {}
+
+    def mark(self, phase):
+        if self.enabled and phase not in self.phases:
+            self.phases[phase] = time.perf_counter() - self.started_at
+
+    def report(self):
+        lines = ["Startup profile:"]
+        prev = 0
+        for phase, elapsed in sorted(self.phases.items(), key=lambda item: item[1]):
+            lines.append(f"  {elapsed * 1000:9.1f} ms  (+{(elapsed - prev) * 1000:8.1f})  {phase}")
+            prev = elapsed
+        return "\n".join(lines)